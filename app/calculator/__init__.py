@@ -1,126 +1,634 @@
 # calculator.py
 
 import logging
-from app.operations import addition, subtraction, multiplication, division, exponent, modulus
-from app.history import History
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(
-    filename=os.getenv("LOG_FILE", "default.log"),
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+import sys
+import time
+from contextlib import redirect_stdout
+from typing import Iterable, NamedTuple, Optional, TextIO
+
+from app.config import get_config
+from app.expressions import (
+    ExpressionError, clear_expression_cache, compile_expression, expression_cache_info, looks_like_expression,
 )
+from app.logger import configure_logging, shutdown_logging
+from app.metrics import configure_metrics, count_error, get_metrics, shutdown_metrics
+from app.profiling import ProfilingError, active_profile, profiled, start_profile, stop_profile
+from app.operations import OperationCache, get_operation, load_plugins, operation_labels, operation_names
+from app.history import History, HistoryLogError, Record
+
+# save/load use the append-only binary log (or SQLite or an archive, as HISTORY_BACKEND
+# says); export/import use the CSV format.
+HISTORY_FILE = 'history.bin'
+SQLITE_HISTORY_FILE = 'history.db'
+ARCHIVE_HISTORY_FILE = 'history.archive'
+EXPORT_FILE = 'history.csv'
+
+PROMPT = "Enter an operation (add, sub, multi, div) and two numbers, or a command: "
+
+# Words that name a command rather than an operation, for the per-command metrics.
+COMMANDS = frozenset(("exit", "history", "clear", "undo", "redo", "save", "load", "compact",
+                      "export", "import", "cache", "stats", "profile", "help"))
+
+# Batch output is flushed to the underlying stream once this many characters are buffered.
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+
+class BatchStats(NamedTuple):
+    """
+    Summary of a batch run.
+    """
+    lines: int
+    seconds: float
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.lines / self.seconds if self.seconds > 0 else float("inf")
+
+
+class _BufferedOutput:
+    """
+    File-like object that collects writes in memory and forwards them to
+    the wrapped stream in large chunks.
+    """
+    def __init__(self, stream: TextIO, limit: int = OUTPUT_BUFFER_SIZE):
+        self._stream = stream
+        self._limit = limit
+        self._chunks = []
+        self._size = 0
+
+    def write(self, text: str) -> int:
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._size >= self._limit:
+            self.flush()
+        return len(text)
 
-def calculator(inputs=None):
+    def flush(self):
+        if self._chunks:
+            self._stream.write("".join(self._chunks))
+            self._chunks.clear()
+            self._size = 0
+        self._stream.flush()
+
+
+def record_calculation(history: History, operation: str, numbers, result):
+    """
+    Appends a single-operation result to history and logs it.
+    """
+    history.add_record(operation, numbers, result)
+    log_calculation(operation, numbers, result)
+
+
+def log_error(error) -> None:
+    """
+    Counts a failed calculation by kind (see error_kind) and logs it, typed by
+    that kind for log sampling and summaries.
+
+    :param error: The error raised, or its message.
+    """
+    kind = error_kind(error)
+    count_error(kind)
+    logging.error("Error during calculation: %s", error, extra={"aggregate": f"{kind} errors"})
+
+
+def log_calculation(operation: str, numbers, result):
+    # Record renders "<op> <num1> <num2> = <result>" only if the message is emitted.
+    logging.info("Calculation performed: %s", Record(operation, tuple(numbers), result))
+
+
+def record_expression(history: History, text: str, result):
+    """
+    Appends the result of a compound expression to history and logs it.
+    """
+    history.add_calculation(f"{text} = {result}")
+    logging.info("Calculation performed: %s = %s", text, result)
+
+
+def parse_numbers(parts) -> list:
+    """
+    Converts operands to floats, or with EXACT_ARITHMETIC to ints, Decimals
+    and Fractions (see app.operations.exact.parse_number).
+
+    :raises ValueError: If an operand is not a number.
+    """
+    if get_config().exact_arithmetic:
+        from app.operations.exact import parse_number  # pylint: disable=import-outside-toplevel
+        return [parse_number(part) for part in parts]
+    return [float(part) for part in parts]
+
+
+def parse_operation(user_input: str):
+    """
+    Splits "<operation> <num1> <num2>" into the registered operation and its operands.
+
+    :return: (operation, numbers), or None if the input is not in that form.
+    """
+    parts = user_input.split()
+    operation = get_operation(parts[0]) if parts else None
+    if operation is None or len(parts) != operation.arity + 1:
+        return None
+    try:
+        return operation, parse_numbers(parts[1:])
+    except ValueError:
+        return None
+
+
+def command_name(user_input: str) -> str:
+    """
+    Name a command is counted under in the metrics: the command word, the
+    canonical operation name, "expression", "invalid" or "empty".
+    """
+    parts = user_input.split(maxsplit=1)
+    if not parts:
+        return "empty"
+    word = parts[0].lower()
+    if word in COMMANDS:
+        return word
+    operation = get_operation(parts[0])
+    if operation is not None:
+        return operation.name
+    return "expression" if looks_like_expression(user_input) else "invalid"
+
+
+def error_kind(error: ValueError) -> str:
+    """
+    Kind an error raised by an operation is counted under in the metrics.
+    """
+    if str(error).lower().startswith(("division by zero", "modulus by zero")):
+        return "division_by_zero"
+    return "calculation_error"
+
+
+def execute_command(user_input: str, history: History, history_file: str = HISTORY_FILE,
+                    cache: Optional[OperationCache] = None) -> bool:
+    """
+    Executes a single calculator command or operation.
+
+    When metrics are enabled (see app.metrics), the command is counted and its
+    latency recorded, and calculations also record the time of each stage.
+
+    :param user_input: The raw line entered by the user (already stripped).
+    :param history: History instance the command operates on.
+    :param history_file: Binary log used by the save, load and compact commands.
+    :param cache: Optional result cache consulted before computing an operation.
+    :return: False once the exit command has been processed, True otherwise.
+    """
+    metrics = get_metrics()
+    if metrics is None:
+        return _execute_command(user_input, history, history_file, cache)
+    started = time.perf_counter_ns()
+    keep_going = _execute_command(user_input, history, history_file, cache, metrics, started)
+    metrics.observe_command(command_name(user_input), time.perf_counter_ns() - started)
+    return keep_going
+
+
+def _execute_command(user_input: str, history: History, history_file: str, cache: Optional[OperationCache],
+                     metrics=None, started: int = 0) -> bool:
+    if not user_input:
+        count_error("empty_input")
+        print("No input detected. Please enter a valid command or operation.")
+        logging.warning("No input detected.")
+        return True
+
+    command = user_input.lower()
+
+    if command == "exit":
+        logging.info("Exiting calculator.")
+        print("Exiting calculator...")
+        return False
+    elif command == "history":
+        logging.info("History retrieved.")
+        print("Calculation History:")
+        for calc in history.get_history():
+            print(calc)
+        return True
+    elif command == "history stats":
+        print(history.stats())
+        return True
+    elif command.startswith(("history tail", "history get")):
+        return execute_history_query(command.split()[1:], history, history_file)
+    elif command.startswith("history where"):
+        return execute_history_where(command[len("history where"):], history)
+    elif command == "clear":
+        history.clear_history()
+        logging.info("History cleared.")
+        print("History Cleared.")
+        return True
+    elif command == "undo":
+        history.undo_last()
+        logging.info("Last calculation undone.")
+        print("Last calculation undone.")
+        return True
+    elif command == "redo":
+        if history.redo_last():
+            logging.info("Last undone change redone.")
+            print("Last undone change redone.")
+        return True
+    elif command == "save":
+        history.save(history_file)
+        logging.info("History saved to file.")
+        return True
+    elif command == "load":
+        try:
+            history.load(history_file)
+            print("History successfully loaded.")
+        except FileNotFoundError:
+            logging.error("File not found during history load.")
+            print("File was not found.")
+        return True
+    elif command == "compact":
+        history.compact(history_file)
+        return True
+    elif command == "export":
+        history.save(EXPORT_FILE)
+        return True
+    elif command == "import":
+        history.load(EXPORT_FILE)
+        return True
+    elif command in ("cache", "cache clear"):
+        if cache is None:
+            print("Operation cache is disabled. Set OPERATION_CACHE_SIZE to enable it.")
+        elif command == "cache clear":
+            cache.clear()
+            print("Operation cache cleared.")
+        else:
+            print(cache.stats())
+        if command == "cache clear":
+            clear_expression_cache()
+        else:
+            info = expression_cache_info()
+            print(f"Expression cache: {info.currsize}/{info.maxsize} compiled, "
+                  f"{info.hits} hits, {info.misses} misses")
+        return True
+    elif command == "stats":
+        metrics = get_metrics()
+        print(metrics.summary() if metrics is not None else "Metrics are disabled. Set METRICS_ENABLED=1.")
+        return True
+    elif command == "profile" or command.startswith("profile "):
+        return execute_profile(command.split()[1:])
+    elif command == "help":
+        print("History Features: undo, clear, history, save, load.")
+        print(f"Math Functions: {', '.join(operation_names())}.")
+        print("Saved History: history tail N (last N saved entries), history get I..J (saved entries I to J).")
+        print("Search: history where op=div result>100 (op=NAME, result with = < <= > >=).")
+        print("Undo: undo and redo step through every change, including clear, load and import.")
+        print("Storage: compact (shrink the saved log), export/import (CSV).")
+        print("Expressions: infix with + - * / % ^ and parentheses, e.g. (3 + 4) ^ 2 % 5 or add (1 + 2) 3.")
+        print("Modular power: expo 2 1000 mod 7 (also a ^ b % m) never computes a ^ b in full.")
+        print("Diagnostics: cache (result cache statistics), cache clear, "
+              "history stats (entries in memory and spilled to disk), stats (command counts and latencies).")
+        print("Profiling: profile start [cprofile|sample], profile stop (writes .pstats/.collapsed files), profile.")
+        return True
+
+    parts = user_input.split()
+    operation = get_operation(parts[0])
+    if operation is not None and operation.name == "expo" and len(parts) == 5 and parts[3].lower() == "mod":
+        return execute_powmod(parts, history, cache)
+    arity = operation.arity if operation is not None else 2
+    routed = time.perf_counter_ns() if metrics is not None else 0
+    try:
+        if len(parts) != arity + 1:
+            raise ValueError(user_input)
+        numbers = parse_numbers(parts[1:])
+    except ValueError:
+        if looks_like_expression(user_input):
+            return execute_expression(user_input, history, cache)
+        count_error("invalid_input")
+        logging.warning("Invalid input format detected.")
+        print("Invalid input. Please follow the format: <operation> <num1> <num2>.")
+        return True
+
+    if operation is None:
+        count_error("unknown_operation")
+        logging.warning("Unknown operation detected.")
+        print(f"Unknown operation. Supported operations: {', '.join(operation_labels())}.")
+        return True
+
+    try:
+        if metrics is None:
+            result = operation.apply(numbers) if cache is None else cache.call(operation, numbers)
+            record_calculation(history, operation.name, numbers, result)
+        else:
+            parsed = time.perf_counter_ns()
+            result = operation.apply(numbers) if cache is None else cache.call(operation, numbers)
+            computed = time.perf_counter_ns()
+            history.add_record(operation.name, numbers, result)
+            recorded = time.perf_counter_ns()
+            log_calculation(operation.name, numbers, result)
+            metrics.observe_stages(operation.name, routed - started, parsed - routed, computed - parsed,
+                                   recorded - computed, time.perf_counter_ns() - recorded)
+        print(f"Result: {result}")
+    except ValueError as error:
+        log_error(error)
+        print(error)
+    return True
+
+
+def execute_powmod(parts, history: History, cache: Optional[OperationCache] = None) -> bool:
+    """
+    Evaluates "expo <base> <exponent> mod <modulus>" with three-argument pow,
+    so the cost depends on the size of the modulus rather than of base ^ exponent.
+
+    :return: Always True.
+    """
+    from app.operations.exact import POWMOD  # pylint: disable=import-outside-toplevel
+
+    try:
+        numbers = parse_numbers((parts[1], parts[2], parts[4]))
+    except ValueError:
+        count_error("invalid_input")
+        logging.warning("Invalid input format detected.")
+        print("Invalid input. Please follow the format: expo <base> <exponent> mod <modulus>.")
+        return True
+    try:
+        result = POWMOD.apply(numbers) if cache is None else cache.call(POWMOD, numbers)
+    except ValueError as error:
+        log_error(error)
+        print(error)
+        return True
+    record_expression(history, f"expo {numbers[0]} {numbers[1]} mod {numbers[2]}", result)
+    print(f"Result: {result}")
+    return True
+
+
+def execute_history_query(args, history: History, history_file: str = HISTORY_FILE) -> bool:
+    """
+    Prints entries of the saved history log without loading it: "tail N" shows
+    the last N entries and "get I..J" (or "get I") entries I to J, counted from 0.
+    Entries are located through the log's offset index, so the cost does not
+    depend on the size of the log.
+
+    :return: Always True.
+    """
+    try:
+        if args[0] == "tail" and len(args) <= 2:
+            count = int(args[1]) if len(args) == 2 else 10
+            if count < 0:
+                raise ValueError(count)
+            start, stop = None, None
+        elif args[0] == "get" and len(args) == 2:
+            first, _, last = args[1].partition("..")
+            start = int(first)
+            stop = int(last) + 1 if last else start + 1
+            if start < 0 or stop <= start:
+                raise ValueError(args[1])
+        else:
+            raise ValueError(args)
+    except ValueError:
+        count_error("invalid_query")
+        logging.warning("Invalid history query.")
+        print("Invalid input. Please use: history tail N, or history get I..J.")
+        return True
+
+    try:
+        saved = history.open_saved(history_file)
+    except FileNotFoundError:
+        logging.error("The file %s was not found.", history_file)
+        print(f"The file {history_file} was not found.")
+        return True
+    except HistoryLogError as error:
+        logging.error("%s", error)
+        print(error)
+        return True
+    with saved:
+        if start is None:
+            start = max(len(saved) - count, 0)
+            stop = len(saved)
+        logging.info("Saved history entries %d to %d of %d retrieved.", start, stop, len(saved))
+        print(f"Saved History ({len(saved)} entries):")
+        for index, entry in enumerate(saved.entries(start, stop), start):
+            print(f"{index}: {entry}")
+    return True
+
+
+def execute_history_where(conditions: str, history: History) -> bool:
+    """
+    Prints the entries of the current history that match conditions such as
+    "op=div result>100", found through the history's secondary indexes.
+
+    :return: Always True.
+    """
+    try:
+        positions = history.where(conditions)
+    except ValueError as error:
+        count_error("invalid_query")
+        logging.warning("Invalid history query: %s", error)
+        print(f"Invalid query: {error} Example: history where op=div result>100")
+        return True
+    logging.info("History query matched %d entries.", len(positions))
+    print(f"History Query ({len(positions)} matches):")
+    for position in positions:
+        print(f"{position}: {history.history[position]}")
+    return True
+
+
+def execute_profile(words) -> bool:
+    """
+    Handles "profile start [cprofile|sample]", "profile stop" and "profile"
+    (status), which capture a profile of a window of the session.
+
+    :return: Always True.
+    """
+    action = words[0] if words else "status"
+    try:
+        if action == "start" and len(words) <= 2:
+            profiler = start_profile(words[1] if len(words) == 2 else None)
+            logging.info("Started %s profile.", profiler.mode)
+            print(f"Profiling with {profiler.mode}. Enter 'profile stop' to write the results.")
+        elif action == "stop" and len(words) == 1:
+            paths = stop_profile()
+            logging.info("Profile written to %s.", ", ".join(paths))
+            print(f"Profile written to {', '.join(paths)}.")
+        elif action == "status" and len(words) <= 1:
+            profiler = active_profile()
+            print(f"A {profiler.mode} profile is running." if profiler is not None else "No profile is running.")
+        else:
+            print("Usage: profile start [cprofile|sample], profile stop, profile")
+    except (ProfilingError, ValueError) as error:
+        print(error)
+    return True
+
+
+def execute_expression(user_input: str, history: History, cache: Optional[OperationCache] = None) -> bool:
+    """
+    Evaluates an infix or nested expression such as "(3 + 4) ^ 2 % 5".
+
+    Compiled expressions are cached on their text, so repeated formulas skip parsing.
+    A single operation on numbers is recorded in history like the prefix command;
+    anything larger is recorded as "<expression> = <result>".
+
+    :return: Always True.
+    """
+    try:
+        expression = compile_expression(user_input)
+    except ExpressionError as error:
+        count_error("invalid_expression")
+        logging.warning("Invalid expression: %s", error)
+        print(f"Invalid expression: {error}")
+        return True
+
+    try:
+        result = expression.evaluate(cache.call if cache is not None else None)
+    except ValueError as error:
+        log_error(error)
+        print(error)
+        return True
+
+    single = expression.single_operation()
+    if single is not None:
+        record_calculation(history, single[0].name, single[1], result)
+    else:
+        record_expression(history, expression.text, result)
+    print(f"Result: {result}")
+    return True
+
+
+def run_batch(lines: Iterable[str], out: Optional[TextIO] = None, history: Optional[History] = None,
+              history_file: str = HISTORY_FILE, report: Optional[TextIO] = None,
+              cache: Optional[OperationCache] = None) -> BatchStats:
+    """
+    Runs commands non-interactively from any iterable of lines (a list, an open
+    file or sys.stdin). No prompts are printed and all output is buffered.
+
+    :param lines: Commands to execute, one per item.
+    :param out: Stream that receives the command output. Defaults to sys.stdout.
+    :param history: History instance to use. A new one is created when omitted.
+    :param history_file: Binary log used by the save, load and compact commands.
+    :param report: Stream that receives the lines/sec summary, or None for no summary.
+    :param cache: Optional result cache consulted before computing an operation.
+    :return: Number of lines processed and the elapsed time.
+    """
+    if history is None:
+        history = History()
+    buffer = _BufferedOutput(out if out is not None else sys.stdout)
+
+    logging.info("Calculator started.")
+    count = 0
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(buffer):
+            for line in lines:
+                count += 1
+                if not execute_command(line.strip(), history, history_file, cache):
+                    break
+    finally:
+        buffer.flush()
+    stats = BatchStats(count, time.perf_counter() - start)
+
+    logging.info("Batch finished: %d lines in %.3fs.", stats.lines, stats.seconds)
+    if report is not None:
+        print(f"Processed {stats.lines} lines in {stats.seconds:.3f}s "
+              f"({stats.lines_per_second:.0f} lines/sec).", file=report)
+    return stats
+
+
+def calculator(inputs=None, workers: Optional[int] = None, chunk_size: Optional[int] = None):
     """
     Interactive calculator that supports basic arithmetic operations
     and manages calculation history with save and load functionalities.
     
-    :param inputs: Optional parameter for automated inputs (not used in this implementation).
+    :param inputs: Optional iterable of commands. When given, the commands are
+                   run in batch mode (see run_batch) instead of prompting.
+    :param workers: Evaluate batch calculations in this many worker processes
+                    (see app.calculator.parallel). None runs the batch in-process.
+    :param chunk_size: Lines handed to a worker at a time.
     """
     
+    configure_logging()
+    configure_metrics()
     history = History()
-    history_file = 'history.csv'
+    load_plugins()
+    config = get_config()
+    history_file = config.history_file or {"sqlite": SQLITE_HISTORY_FILE, "archive": ARCHIVE_HISTORY_FILE}.get(
+        config.history_backend, HISTORY_FILE)
+    cache = OperationCache(config.cache_size, config.cache_ttl) if config.cache_size > 0 else None
+    recovered = 0
+    if config.autosave:
+        try:
+            recovered = history.start_autosave(history_file)
+        except (OSError, HistoryLogError) as error:
+            # The calculator still works; the history is only saved by the save command.
+            logging.error("Autosave to %s could not start: %s", history_file, error)
+            print(f"Autosave is off: {error}", file=sys.stderr)
 
-    logging.info("Calculator started.")
-    print("Welcome to the Calculator!")
-    print("Available operations: add, sub, multi, div, expo, mod")
-    print("Available commands: history, clear, undo, save, load, help, exit")
-    print("Format is <operation> <number1> <number2>")
-
-    while True:
-        user_input = input("Enter an operation (add, sub, multi, div) and two numbers, or a command: ").strip()
-
-        if not user_input:
-            print("No input detected. Please enter a valid command or operation.")
-            logging.warning("No input detected.")
-            continue
-
-        command = user_input.lower()
-
-        if command == "exit":
-            logging.info("Exiting calculator.")
-            print("Exiting calculator...")
-            break
-        elif command == "history":
-            logging.info("History retrieved.")
-            print("Calculation History:")
-            for calc in history.get_history():
-                print(calc)
-            continue
-        elif command == "clear":
-            history.clear_history()
-            logging.info("History cleared.")
-            print("History Cleared.")
-            continue
-        elif command == "undo":
-            history.undo_last()
-            logging.info("Last calculation undone.")
-            print("Last calculation undone.")
-            continue
-        elif command == "save":
-            history.save(history_file)
-            logging.info("History saved to file.")
-            continue
-        elif command == "load":
-            try:
-                history.load(history_file)
-                print("History successfully loaded.")
-                continue
-            except FileNotFoundError:
-                logging.error("File not found during history load.")
-                print("File was not found.")
-                continue
-        elif command == "help":
-            print("History Features: undo, clear, history, save, load.")
-            print("Math Functions: add, sub, multi, div, expo, mod.")
-            continue
-        else:
-            try:
-                operation, num1, num2 = user_input.split()
-                num1 = float(num1)
-                num2 = float(num2)
-            except ValueError:
-                logging.warning("Invalid input format detected.")
-                print("Invalid input. Please follow the format: <operation> <num1> <num2>.")
-                continue
-
-            try:
-                if operation == "add":
-                    result = addition(num1, num2)
-                elif operation == "sub":
-                    result = subtraction(num1, num2)
-                elif operation == "multi":
-                    result = multiplication(num1, num2)
-                elif operation == "div":
-                    result = division(num1, num2)
-                elif operation == "expo":
-                    result = exponent(num1, num2)
-                elif operation == "mod":
-                    result = modulus(num1, num2)
-                else:
-                    logging.warning("Unknown operation detected.")
-                    print("Unknown operation. Supported operations: add, subtract, multiply, divide, exponent, modulus.")
-                    continue
-
-                calculation_str = f"{operation} {num1} {num2} = {result}"
-                history.add_calculation(calculation_str)
-                logging.info("Calculation performed: %s", calculation_str)
-                print(f"Result: {result}")
-            except ValueError as error:
-                logging.error("Error during calculation: Divide by zero not allowed")
-                print(error)
-
-def main():
-    """
-    Main loop of the calculator application for interactive use.
-    """
-    calculator()
+    try:
+        if inputs is not None and workers is not None:
+            from app.calculator.parallel import (  # pylint: disable=import-outside-toplevel
+                DEFAULT_CHUNK_SIZE, run_parallel)
+            return run_parallel(inputs, workers, chunk_size or DEFAULT_CHUNK_SIZE, history=history,
+                                history_file=history_file, report=sys.stderr, cache=cache)
+        if inputs is not None:
+            return run_batch(inputs, history=history, history_file=history_file, report=sys.stderr, cache=cache)
+
+        logging.info("Calculator started.")
+        print("Welcome to the Calculator!")
+        if recovered:
+            print(f"Recovered {recovered} unsaved changes to {history_file} after a crash.")
+        print(f"Available operations: {', '.join(operation_names())}")
+        print("Available commands: history, clear, undo, redo, save, load, compact, export, import, cache, stats, "
+              "profile, help, exit")
+        print("Format is <operation> <number1> <number2>, or an expression such as (3 + 4) ^ 2 % 5")
+
+        while True:
+            user_input = input(PROMPT).strip()
+            if not execute_command(user_input, history, history_file, cache):
+                break
+        return None
+    finally:
+        history.stop_autosave()
+
+
+def main(argv=None):
+    """
+    Main loop of the calculator application. Runs interactively on a terminal,
+    in batch mode when --batch is given or stdin is a pipe, or as a server
+    with --serve/--unix.
+    """
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description="Command line calculator.")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run commands from FILE without prompting ('-' reads stdin)")
+    parser.add_argument("--serve", metavar="HOST:PORT",
+                        help="serve concurrent sessions as JSON lines over TCP (e.g. 127.0.0.1:8765)")
+    parser.add_argument("--unix", metavar="PATH", help="serve concurrent sessions on a Unix socket")
+    parser.add_argument("--workers", metavar="N", type=int,
+                        help="evaluate batch calculations in N worker processes (0 uses every CPU)")
+    parser.add_argument("--chunk-size", metavar="LINES", type=int,
+                        help="lines sent to a worker at a time in parallel batch mode")
+    parser.add_argument("--profile", choices=("cprofile", "sample"),
+                        help="profile the whole run and write the results on exit (default: PROFILE)")
+    parser.add_argument("--profile-output", metavar="PREFIX",
+                        help="path of the profile files without extension (default: PROFILE_OUTPUT)")
+    args = parser.parse_args(argv)
+    try:
+        get_config()
+    except ValueError as error:
+        parser.error(f"invalid configuration: {error}")
+
+    configure_logging()
+    configure_metrics()
+    try:
+        with profiled(args.profile or get_config().profile, args.profile_output):
+            if args.serve or args.unix:
+                import asyncio  # pylint: disable=import-outside-toplevel
+                from app.server import serve  # pylint: disable=import-outside-toplevel
+
+                host, _, port = (args.serve or "").rpartition(":")
+                try:
+                    asyncio.run(serve(host or "127.0.0.1", int(port or 8765), args.unix))
+                except KeyboardInterrupt:
+                    pass
+            elif args.batch and args.batch != "-":
+                with open(args.batch, encoding="utf-8") as command_file:
+                    calculator(command_file, args.workers, args.chunk_size)
+            elif args.batch == "-" or not sys.stdin.isatty():
+                calculator(sys.stdin, args.workers, args.chunk_size)
+            else:
+                calculator()
+    finally:
+        shutdown_metrics()
+        shutdown_logging()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,203 @@
+# app/calculator/parallel.py
+
+"""
+Parallel batch mode: evaluates the calculations of a command stream in a
+process pool while keeping the exact output and history of run_batch().
+
+The input is cut into chunks that worker processes evaluate. A worker only
+computes lines whose outcome does not depend on session state, i.e.
+"<op> <num1> <num2>" commands and expressions, and returns their results.
+The main process then walks the lines in input order: it prints and records
+the precomputed results, and executes everything else (history, undo,
+clear, save, load, exit, invalid input, ...) with execute_command() at the
+same position it has in the input, so stateful commands see exactly the
+history they would see in a sequential run. Precomputed outcomes are
+counted in the metrics and errors logged through the same helpers as in a
+sequential run, and the lines executed in the main process use the caller's
+operation cache.
+
+If a worker fails, its chunk is executed in the main process instead, and
+once the pool is broken so are all the chunks after it.
+"""
+
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
+from itertools import islice
+from typing import Iterable, List, Optional, TextIO
+
+from app.calculator import (
+    HISTORY_FILE, BatchStats, _BufferedOutput, command_name, execute_command, log_error, parse_operation,
+    record_calculation, record_expression,
+)
+from app.expressions import ExpressionError, compile_expression, looks_like_expression
+from app.history import History
+from app.metrics import get_metrics
+from app.operations import OperationCache, load_plugins
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+# Outcome tags returned by workers for each line of a chunk.
+RESULT = 0       # (RESULT, operation name, numbers, result)
+EXPRESSION = 1   # (EXPRESSION, text, result, (operation name, numbers) or None)
+ERROR = 2        # (ERROR, message)
+
+
+def _init_worker():
+    load_plugins()
+
+
+def evaluate_chunk(lines: List[str]) -> list:
+    """
+    Computes the stateless lines of a chunk. Runs in a worker process.
+
+    :return: One outcome per line; None for lines the main process must execute.
+    """
+    outcomes = []
+    for line in lines:
+        command = line.strip()
+        outcome = None
+        try:
+            parsed = parse_operation(command)
+            if parsed is not None:
+                operation, numbers = parsed
+                outcome = (RESULT, operation.name, numbers, operation.apply(numbers))
+            elif looks_like_expression(command):
+                expression = compile_expression(command)
+                single = expression.single_operation()
+                outcome = (EXPRESSION, expression.text, expression.evaluate(),
+                           (single[0].name, single[1]) if single else None)
+        except ExpressionError:
+            outcome = None
+        except ValueError as error:
+            outcome = (ERROR, str(error))
+        except Exception:  # pylint: disable=broad-except
+            # Anything else is left to execute_command so that it behaves as in a sequential run.
+            outcome = None
+        outcomes.append(outcome)
+    return outcomes
+
+
+def _apply(line: str, outcome, history: History, history_file: str,
+           cache: Optional[OperationCache] = None) -> bool:
+    if outcome is None:
+        return execute_command(line.strip(), history, history_file, cache)
+    metrics = get_metrics()
+    if metrics is None:
+        return _apply_outcome(outcome, history)
+    started = time.perf_counter_ns()
+    _apply_outcome(outcome, history)
+    name = outcome[1] if outcome[0] == RESULT else command_name(line.strip())
+    metrics.observe_command(name, time.perf_counter_ns() - started)
+    return True
+
+
+def _apply_outcome(outcome, history: History) -> bool:
+    kind = outcome[0]
+    if kind == RESULT:
+        _, name, numbers, result = outcome
+        record_calculation(history, name, numbers, result)
+        print(f"Result: {result}")
+    elif kind == EXPRESSION:
+        _, text, result, single = outcome
+        if single is not None:
+            record_calculation(history, single[0], single[1], result)
+        else:
+            record_expression(history, text, result)
+        print(f"Result: {result}")
+    else:
+        log_error(outcome[1])
+        print(outcome[1])
+    return True
+
+
+def _chunks(lines: Iterable[str], size: int):
+    iterator = iter(lines)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_parallel(lines: Iterable[str], workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 out: Optional[TextIO] = None, history: Optional[History] = None,
+                 history_file: str = HISTORY_FILE, report: Optional[TextIO] = None,
+                 cache: Optional[OperationCache] = None) -> BatchStats:
+    """
+    Runs commands like run_batch(), evaluating calculations in a process pool.
+
+    :param lines: Commands to execute, one per item.
+    :param workers: Number of worker processes. Defaults to the CPU count.
+    :param chunk_size: Lines sent to a worker at a time.
+    :param out: Stream that receives the command output. Defaults to sys.stdout.
+    :param history: History instance to use. A new one is created when omitted.
+    :param history_file: Binary log used by the save, load and compact commands.
+    :param report: Stream that receives the lines/sec summary, or None for no summary.
+    :param cache: Operation result cache for the lines executed in the main process, as in run_batch.
+    :return: Number of lines processed and the elapsed time.
+    """
+    if history is None:
+        history = History()
+    workers = workers or os.cpu_count() or 1
+    buffer = _BufferedOutput(out if out is not None else sys.stdout)
+
+    logging.info("Calculator started.")
+    count = 0
+    start = time.perf_counter()
+    # Bounded read-ahead: at most two chunks per worker are in flight.
+    in_flight = deque()
+    chunks = _chunks(lines, chunk_size)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        try:
+            with redirect_stdout(buffer):
+                running = True
+                broken = False
+                while running:
+                    while len(in_flight) < workers * 2:
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        future = None
+                        if not broken:
+                            try:
+                                future = pool.submit(evaluate_chunk, chunk)
+                            except BrokenProcessPool as error:
+                                # A worker died; the pool takes no more work, so the rest runs in-process.
+                                logging.warning("Worker pool is broken (%s); executing the remaining lines "
+                                                "in-process.", error)
+                                broken = True
+                        in_flight.append((chunk, future))
+                    if not in_flight:
+                        break
+                    chunk, future = in_flight.popleft()
+                    if future is None:
+                        outcomes = [None] * len(chunk)
+                    else:
+                        try:
+                            outcomes = future.result()
+                        except Exception as error:  # pylint: disable=broad-except
+                            logging.warning("Worker failed (%s); executing %d lines in-process.", error, len(chunk))
+                            outcomes = [None] * len(chunk)
+                    for line, outcome in zip(chunk, outcomes):
+                        count += 1
+                        if not _apply(line, outcome, history, history_file, cache):
+                            running = False
+                            break
+        finally:
+            for _, future in in_flight:
+                if future is not None:
+                    future.cancel()
+            buffer.flush()
+    stats = BatchStats(count, time.perf_counter() - start)
+
+    logging.info("Parallel batch finished: %d lines in %.3fs with %d workers.", stats.lines, stats.seconds, workers)
+    if report is not None:
+        print(f"Processed {stats.lines} lines in {stats.seconds:.3f}s "
+              f"({stats.lines_per_second:.0f} lines/sec, {workers} workers).", file=report)
+    return stats
@@ -0,0 +1,119 @@
+# app/config/__init__.py
+
+import functools
+import os
+from typing import NamedTuple, Optional
+
+# Formats for saved histories (see app.history.backends).
+HISTORY_BACKENDS = ("binlog", "sqlite", "archive")
+
+
+class Config(NamedTuple):
+    """
+    Settings read from the environment (and the .env file, if present).
+    """
+    log_file: str
+    log_max_bytes: int
+    log_backup_count: int
+    log_sample_rate: int
+    log_rate_limit: float
+    log_summary_interval: float
+    history_file: Optional[str]
+    history_backend: str
+    segment_size: int
+    archive_codec: str
+    archive_threads: int
+    fsync_interval: int
+    autosave: bool
+    journal_commit_interval: float
+    checkpoint_interval: float
+    cache_size: int
+    cache_ttl: Optional[float]
+    history_capacity: int
+    spill_dir: Optional[str]
+    undo_depth: int
+    exact_arithmetic: bool
+    digit_budget: int
+    metrics_enabled: bool
+    metrics_file: Optional[str]
+    metrics_interval: float
+    profile: Optional[str]
+    profile_output: str
+    profile_interval: float
+
+
+@functools.lru_cache(maxsize=None)
+def get_config() -> Config:
+    """
+    Loads the configuration once and returns the same object on every call.
+
+    python-dotenv is imported here rather than at module level so that
+    importing the application does not pay for it until settings are needed.
+
+    :raises ValueError: If a setting is malformed or HISTORY_BACKEND is not a known backend.
+    """
+    from dotenv import load_dotenv  # pylint: disable=import-outside-toplevel
+
+    load_dotenv()
+    history_backend = os.getenv("HISTORY_BACKEND", "binlog").lower()
+    if history_backend not in HISTORY_BACKENDS:
+        raise ValueError(f"Unknown HISTORY_BACKEND {history_backend!r}. "
+                         f"Choose one of: {', '.join(HISTORY_BACKENDS)}.")
+    return Config(
+        log_file=os.getenv("LOG_FILE", "default.log"),
+        # The log is rotated at LOG_MAX_BYTES (0 never rotates), keeping LOG_BACKUP_COUNT old files.
+        log_max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        log_backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        # Sampling and periodic summaries of log records (app.logger.LogSampler); the
+        # defaults write every record and no summaries.
+        log_sample_rate=int(os.getenv("LOG_SAMPLE_RATE", "1")),
+        log_rate_limit=float(os.getenv("LOG_RATE_LIMIT", "0")),
+        log_summary_interval=float(os.getenv("LOG_SUMMARY_INTERVAL", "0")),
+        # Where the history is saved. Unset, the calculator picks history.bin, history.db or
+        # history.archive by backend, and History methods called without a path use default.csv.
+        history_file=os.getenv("HISTORY_FILE") or None,
+        # Format of saved histories that are not .csv, .db, .sqlite or .archive paths:
+        # "binlog", "sqlite" or "archive".
+        history_backend=history_backend,
+        # Segmented archives (app.history.archive): entries per segment, "gzip" or "lzma",
+        # and threads compressing segments, where 0 uses one per CPU.
+        segment_size=int(os.getenv("HISTORY_SEGMENT_SIZE", "100000")),
+        archive_codec=os.getenv("HISTORY_ARCHIVE_CODEC", "gzip").lower(),
+        archive_threads=int(os.getenv("HISTORY_ARCHIVE_THREADS", "0")),
+        fsync_interval=int(os.getenv("HISTORY_FSYNC_INTERVAL", "1")),
+        # Journal every change and checkpoint it into the history log in the background
+        # (app.history.journal): seconds between group commits (0 commits every change)
+        # and between checkpoints (0 only checkpoints on save and exit).
+        autosave=os.getenv("HISTORY_AUTOSAVE", "0").lower() in ("1", "true", "yes"),
+        journal_commit_interval=float(os.getenv("HISTORY_JOURNAL_COMMIT_INTERVAL", "0.05")),
+        checkpoint_interval=float(os.getenv("HISTORY_CHECKPOINT_INTERVAL", "30")),
+        # 0 disables the operation result cache.
+        cache_size=int(os.getenv("OPERATION_CACHE_SIZE", "0")),
+        cache_ttl=float(os.environ["OPERATION_CACHE_TTL"]) if os.getenv("OPERATION_CACHE_TTL") else None,
+        # Entries kept in memory before older ones spill to disk; 0 keeps everything in memory.
+        history_capacity=int(os.getenv("HISTORY_CAPACITY", "0")),
+        spill_dir=os.getenv("HISTORY_SPILL_DIR") or None,
+        # Changes undo can step back through; 0 keeps every change (and every cleared history).
+        undo_depth=int(os.getenv("HISTORY_UNDO_DEPTH", "1000")),
+        # Parse operands as int/Decimal/Fraction instead of float (see app.operations.exact).
+        exact_arithmetic=os.getenv("EXACT_ARITHMETIC", "0").lower() in ("1", "true", "yes"),
+        # Largest exact result, in decimal digits, an exponentiation may produce.
+        digit_budget=int(os.getenv("EXPONENT_DIGIT_BUDGET", "100000")),
+        # Command counters and latency histograms (app.metrics); the file is written
+        # in the Prometheus text format every METRICS_INTERVAL seconds when set.
+        metrics_enabled=os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes"),
+        metrics_file=os.getenv("METRICS_FILE") or None,
+        metrics_interval=float(os.getenv("METRICS_INTERVAL", "15")),
+        # Profile whole runs with "cprofile" or "sample" (app.profiling); unset disables profiling.
+        profile=os.getenv("PROFILE") or None,
+        profile_output=os.getenv("PROFILE_OUTPUT", "calculator-profile"),
+        profile_interval=float(os.getenv("PROFILE_INTERVAL", "0.005")),
+    )
+
+
+def reload_config() -> Config:
+    """
+    Discards the cached configuration and reads the environment again.
+    """
+    get_config.cache_clear()
+    return get_config()
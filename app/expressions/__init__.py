@@ -0,0 +1,305 @@
+# app/expressions/__init__.py
+
+"""
+Expression language for the calculator.
+
+Supports infix arithmetic with the usual precedence, parentheses and unary
+minus, as well as the prefix form of the registered operations, which can
+be nested:
+
+    (3 + 4) ^ 2 % 5
+    -2 ^ 2                  # -(2 ^ 2), as in Python
+    add (1 + 2) expo 2 3
+    mod(7, 3) * 2
+
+Operators map onto the registered operations (+ add, - sub, * multi,
+/ div, ^ expo, % mod), so expressions compute exactly what the prefix
+commands do. Parsed expressions are compiled into a tree of closures and
+kept in a cache keyed on the expression text, so a formula that repeats in
+a script is only parsed once.
+
+With EXACT_ARITHMETIC set, numbers are parsed as ints and Decimals (see
+app.operations.exact). "a ^ b % m" is compiled into one three-argument pow,
+so 2 ^ 1000000 % 7 never builds 2 ^ 1000000.
+"""
+
+import functools
+import re
+from typing import Callable, List, NamedTuple, Optional, Tuple, Union
+
+from app.config import get_config
+from app.operations import Operation, get_operation, registry_version
+
+# Number of distinct expression texts kept compiled.
+EXPRESSION_CACHE_SIZE = 4096
+
+BINARY_OPERATORS = {"+": "add", "-": "sub", "*": "multi", "/": "div", "%": "mod", "^": "expo"}
+OPERATOR_CHARACTERS = frozenset("+-*/%^(),")
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_]\w*)
+      | (?P<symbol>[-+*/%^(),])
+    )""", re.VERBOSE)
+
+_CONSTANTS = {"inf": float("inf"), "nan": float("nan")}
+
+
+class ExpressionError(ValueError):
+    """
+    Raised when an expression cannot be parsed.
+    """
+
+
+class Number(NamedTuple):
+    value: float
+
+
+class Apply(NamedTuple):
+    operation: Operation
+    args: Tuple["Node", ...]
+
+
+Node = Union[Number, Apply]
+Call = Callable[[Operation, Tuple[float, ...]], float]
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    """
+    Splits an expression into (kind, text) tokens.
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise ExpressionError(f"Unexpected character {text[position:].lstrip()[0]!r}.")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent parser producing Number/Apply nodes.
+
+        sum     := product (("+" | "-") product)*
+        product := factor (("*" | "/" | "%") factor)*
+        factor  := ("-" | "+") factor | power
+        power   := primary ("^" factor)?
+        primary := number | "(" sum ")" | name "(" sum ("," sum)* ")" | name factor{arity}
+    """
+    def __init__(self, tokens, exact: bool = False):
+        self.tokens = tokens
+        self.position = 0
+        self.exact = exact
+
+    def peek(self) -> Optional[str]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][1]
+        return None
+
+    def take(self) -> Tuple[str, str]:
+        if self.position >= len(self.tokens):
+            raise ExpressionError("Unexpected end of expression.")
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def expect(self, symbol: str):
+        kind, text = self.take()
+        if kind != "symbol" or text != symbol:
+            raise ExpressionError(f"Expected {symbol!r} but found {text!r}.")
+
+    def parse(self) -> Node:
+        node = self.sum()
+        if self.position != len(self.tokens):
+            raise ExpressionError(f"Unexpected {self.tokens[self.position][1]!r}.")
+        return node
+
+    def binary(self, symbol: str, left: Node, right: Node) -> Node:
+        return Apply(_operation(BINARY_OPERATORS[symbol]), (left, right))
+
+    def sum(self) -> Node:
+        node = self.product()
+        while self.peek() in ("+", "-"):
+            symbol = self.take()[1]
+            node = self.binary(symbol, node, self.product())
+        return node
+
+    def product(self) -> Node:
+        node = self.factor()
+        while self.peek() in ("*", "/", "%"):
+            symbol = self.take()[1]
+            node = self.binary(symbol, node, self.factor())
+        return node
+
+    def factor(self) -> Node:
+        if self.peek() == "-":
+            self.take()
+            operand = self.factor()
+            if isinstance(operand, Number):
+                return Number(-operand.value)
+            return Apply(_operation("multi"), (Number(-1 if self.exact else -1.0), operand))
+        if self.peek() == "+":
+            self.take()
+            return self.factor()
+        return self.power()
+
+    def power(self) -> Node:
+        node = self.primary()
+        if self.peek() == "^":
+            self.take()
+            node = self.binary("^", node, self.factor())
+        return node
+
+    def primary(self) -> Node:
+        kind, text = self.take()
+        if kind == "number":
+            if self.exact:
+                from app.operations.exact import parse_number  # pylint: disable=import-outside-toplevel
+                try:
+                    return Number(parse_number(text))
+                except ValueError as error:
+                    # Only a number beyond the digit budget gets here; the tokenizer has checked the syntax.
+                    raise ExpressionError(str(error)) from None
+            return Number(float(text))
+        if kind == "symbol" and text == "(":
+            node = self.sum()
+            self.expect(")")
+            return node
+        if kind == "name":
+            if text.lower() in _CONSTANTS and get_operation(text) is None:
+                return Number(_CONSTANTS[text.lower()])
+            operation = _operation(text)
+            if self.peek() == "(":
+                self.take()
+                args = [self.sum()]
+                while self.peek() == ",":
+                    self.take()
+                    args.append(self.sum())
+                self.expect(")")
+                if len(args) == 1 and operation.arity > 1:
+                    # "add (1 + 2) 3": the parentheses group the first prefix operand.
+                    if self.peek() == "^":
+                        self.take()
+                        args = [self.binary("^", args[0], self.factor())]
+                    args += [self.factor() for _ in range(operation.arity - 1)]
+            else:
+                args = [self.factor() for _ in range(operation.arity)]
+            if len(args) != operation.arity:
+                raise ExpressionError(f"{operation.name} takes {operation.arity} operands, got {len(args)}.")
+            return Apply(operation, tuple(args))
+        raise ExpressionError(f"Unexpected {text!r}.")
+
+
+def _operation(name: str) -> Operation:
+    operation = get_operation(name)
+    if operation is None:
+        raise ExpressionError(f"Unknown operation {name!r}.")
+    return operation
+
+
+def parse(text: str, exact: bool = False) -> Node:
+    """
+    Parses an expression into a tree of Number and Apply nodes.
+
+    :param exact: Parse numbers as ints and Decimals instead of floats.
+    :raises ExpressionError: If the text is not a valid expression.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        raise ExpressionError("Empty expression.")
+    return _Parser(tokens, exact).parse()
+
+
+def _compile(node: Node) -> Callable[[Call], float]:
+    if isinstance(node, Number):
+        value = node.value
+        return lambda call: value
+    operation = node.operation
+    base = node.args[0]
+    if operation.name == "mod" and isinstance(base, Apply) and base.operation.name == "expo":
+        from app.operations.exact import POWMOD  # pylint: disable=import-outside-toplevel
+
+        args = tuple(_compile(arg) for arg in base.args + node.args[1:])
+        return lambda call: call(POWMOD, tuple(arg(call) for arg in args))
+    if len(node.args) == 2:
+        left, right = (_compile(arg) for arg in node.args)
+        return lambda call: call(operation, (left(call), right(call)))
+    args = tuple(_compile(arg) for arg in node.args)
+    return lambda call: call(operation, tuple(arg(call) for arg in args))
+
+
+def _direct_call(operation: Operation, operands: Tuple[float, ...]) -> float:
+    return operation.apply(operands)
+
+
+class Expression:
+    """
+    A parsed and compiled expression that can be evaluated repeatedly.
+    """
+    __slots__ = ("text", "tree", "_evaluate")
+
+    def __init__(self, text: str, tree: Node):
+        self.text = text
+        self.tree = tree
+        self._evaluate = _compile(tree)
+
+    def evaluate(self, call: Optional[Call] = None) -> float:
+        """
+        Computes the value of the expression.
+
+        :param call: Function used to apply each operation to its operands, e.g.
+                     OperationCache.call. Defaults to calling the operation directly.
+        :raises ValueError: As raised by the operations (e.g. division by zero).
+        """
+        return self._evaluate(call or _direct_call)
+
+    def single_operation(self) -> Optional[Tuple[Operation, Tuple[float, ...]]]:
+        """
+        Returns (operation, operands) when the expression is one operation applied
+        to numbers, so it can be recorded in history like a prefix command.
+        """
+        tree = self.tree
+        if isinstance(tree, Apply) and all(isinstance(arg, Number) for arg in tree.args):
+            return tree.operation, tuple(arg.value for arg in tree.args)
+        return None
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def _compile_cached(text: str, version: int, exact: bool) -> Expression:  # pylint: disable=unused-argument
+    return Expression(text, parse(text, exact))
+
+
+def compile_expression(text: str) -> Expression:
+    """
+    Returns the compiled expression for text, parsing it only on first use.
+    The cache is keyed on the text and invalidated when operations are
+    registered or removed.
+
+    :raises ExpressionError: If the text is not a valid expression.
+    """
+    return _compile_cached(text.strip(), registry_version(), get_config().exact_arithmetic)
+
+
+def looks_like_expression(text: str) -> bool:
+    """
+    Cheap check for operator characters, used to decide whether input that is
+    not a plain "<op> <num1> <num2>" command should go to the parser.
+    """
+    return not OPERATOR_CHARACTERS.isdisjoint(text)
+
+
+def expression_cache_info():
+    """
+    Hit/miss statistics of the compiled expression cache.
+    """
+    return _compile_cached.cache_info()
+
+
+def clear_expression_cache():
+    _compile_cached.cache_clear()
@@ -1,20 +1,76 @@
 # app/history/__init__.py
 
 import logging
-import pandas as pd
 import os 
-from dotenv import load_dotenv
+import weakref
+from contextlib import nullcontext
+from typing import NamedTuple, Optional
+
+from app.config import get_config
+from app.history.backends import HistoryBackend, open_log, open_reader
+from app.history.binlog import HistoryLog, HistoryLogError, MappedLog, encode_entry, encode_truncate
+from app.history.journal import Journal, recover
+from app.history.records import Record, RecordStore
+from app.history.spill import SpillingStore
+from app.history.versions import HistoryView, Snapshot, UndoLog
+
+# pandas is only imported by the CSV export/import paths, so that importing
+# this module (and the calculator) stays cheap.
+
+# Rows parsed at a time when importing or iterating a CSV history.
+CSV_CHUNK_SIZE = 100_000
+
+# File used by save, load and iter_history without a path when HISTORY_FILE is unset.
+DEFAULT_HISTORY_FILE = 'default.csv'
+
+
+class HistoryStats(NamedTuple):
+    """
+    Where the entries of a history are kept, reported by the history stats command.
+    """
+    entries: int
+    resident: int
+    spilled: int
+    capacity: int
+    resident_bytes: int
+    spilled_bytes: int
+
+    def __str__(self):
+        limit = f"capacity {self.capacity}" if self.capacity else "no capacity limit"
+        return (f"History: {self.entries} entries, {self.resident} resident ({self.resident_bytes} bytes), "
+                f"{self.spilled} spilled to disk ({self.spilled_bytes} bytes), {limit}")
 
-# Load environment variables from the .env file
-load_dotenv()
 
 class History:
     """
     Class to manage the history of calculations.
+
+    :param capacity: Entries kept in memory; older ones spill to a temporary file.
+                     Defaults to HISTORY_CAPACITY, where 0 keeps everything in memory.
+    :param undo_depth: Most changes undo_last can step back through. Defaults to
+                       HISTORY_UNDO_DEPTH, where 0 keeps every change.
     """
-    def __init__(self):
-        # Initialize an empty list to store calculations.
-        self.history = []
+    def __init__(self, capacity: Optional[int] = None, undo_depth: Optional[int] = None):
+        config = get_config()
+        self.capacity = config.history_capacity if capacity is None else capacity
+        # Calculations are kept in typed columns and rendered to strings on demand.
+        self.history = self._new_store()
+        # Binary log the history was last saved to or loaded from, how many leading
+        # entries it holds, and the lowest length the history shrank to since then.
+        self._log = None
+        self._log_synced = 0
+        self._log_low = 0
+        # Secondary indexes (app.history.query), built on the first query and then kept current.
+        self._index = None
+        # Changes that can be undone and redone (app.history.versions), and the
+        # views handed out by get_history that still read from the store.
+        self._changes = UndoLog(config.undo_depth if undo_depth is None else undo_depth, self._discard_store)
+        self._views = weakref.WeakValueDictionary()
+        # Write-ahead journal while autosaving (app.history.journal), with the same
+        # bookkeeping as the log above for what it has seen.
+        self._journal = None
+        self._journal_synced = 0
+        self._journal_low = 0
         logging.debug("Initialized History instance.")
 
     def add_calculation(self, calculation: str):
@@ -25,76 +81,424 @@ class History:
         if not isinstance(calculation, str):
             raise TypeError("Calculation must be a string.")
         self.history.append(calculation)
-        logging.debug(f"Added calculation: {calculation}")
+        self._added()
+        logging.debug("Added calculation: %s", calculation)
+
+    def add_record(self, operation: str, operands, result):
+        """
+        Adds a calculation from its parts without formatting it as a string.
+        :param operation: Name of the operation.
+        :param operands: Sequence of float operands.
+        :param result: Result of the operation.
+        """
+        self.history.add(operation, operands, result)
+        self._added()
+        logging.debug("Added calculation: %s %s = %s", operation, operands, result)
+
+    def _added(self, redoing: bool = False):
+        if self._index is not None:
+            self._index.add(len(self.history) - 1, self.history.entry(-1))
+        self._changes.added(redoing)
+        self._journal_changes()
+
+    def _replace_store(self, store, redoing: bool = False):
+        """
+        Makes store the current history. The old store is kept on the undo
+        stack as it is, so replacing costs O(1) whatever the history size.
+        """
+        self._changes.replaced(self.history, redoing)
+        self._swap_store(store)
+
+    def _new_store(self):
+        if self.capacity:
+            return SpillingStore(self.capacity, directory=get_config().spill_dir)
+        return RecordStore()
+
+    def stats(self) -> HistoryStats:
+        """
+        Reports how many entries are held in memory and how many have spilled to disk.
+        """
+        spilled = getattr(self.history, "spilled", 0)
+        return HistoryStats(len(self.history), len(self.history) - spilled, spilled, self.capacity,
+                            self.history.nbytes(), getattr(self.history, "spilled_bytes", 0))
+
+    def get_records(self):
+        """
+        Retrieves the calculations as Record tuples (operation, operands, result).
+        Entries that were added as free-form text are returned as strings.
+        :return: List of records.
+        """
+        return self.history.records()
 
     def clear_history(self):
         """
-        Clears all calculations from the history.
+        Clears all calculations from the history. The cleared entries are
+        kept for undo_last, not copied.
         """
-        self.history.clear()
+        if self.history:
+            self._replace_store(self._new_store())
         logging.debug("Cleared all history.")
 
     def undo_last(self):
         """
-        Removes the last calculation from the history.
+        Undoes the last change to the history: a calculation that was added,
+        or a clear, load or import. Can be repeated back to the first change.
         """
-        if self.history:
-            removed = self.history.pop()
-            logging.debug(f"Removed last calculation: {removed}")
+        step = self._changes.pop_undo()
+        if isinstance(step, Snapshot):
+            self._changes.push_redo(Snapshot(self.history))
+            self._swap_store(step.store)
+            logging.debug("Undid replacing the history; %d entries restored.", len(self.history))
+        elif step is not None:
+            entry = self.history.entry(-1)
+            self._pop()
+            self._changes.push_redo(entry)
+            logging.debug("Removed last calculation: %s", entry)
+        elif self.history:
+            logging.warning("Attempted to undo, but there is nothing left to undo.")
+            print("Nothing left to undo.")
         else:
             logging.warning("Attempted to undo, but history is already empty.")
             print("History is already empty.")
 
+    def redo_last(self) -> bool:
+        """
+        Reapplies the last change undone by undo_last. Redo is no longer
+        possible once a new change has been made.
+
+        :return: False if there was nothing to redo.
+        """
+        step = self._changes.pop_redo()
+        if step is None:
+            logging.warning("Attempted to redo, but there is nothing to redo.")
+            print("Nothing to redo.")
+            return False
+        if isinstance(step, Snapshot):
+            self._replace_store(step.store, redoing=True)
+        else:
+            self.history.append(step)
+            self._added(redoing=True)
+        logging.debug("Redid the last undone change.")
+        return True
+
+    def _swap_store(self, store):
+        self.history = store
+        self._log_low = 0
+        self._journal_low = 0
+        self._index = None
+        self._journal_changes()
+
+    def _pop(self):
+        """
+        Drops the last entry, first copying it into any get_history view that still shows it.
+        """
+        length = len(self.history) - 1
+        for view in list(self._views.values()):
+            view.detach_from(self.history, length)
+        self.history.pop()
+        self._log_low = min(self._log_low, length)
+        self._journal_low = min(self._journal_low, length)
+        if self._index is not None:
+            self._index.truncate(length)
+        self._journal_changes()
+
+    def _discard_store(self, store):
+        """
+        Closes a replaced store that can no longer be undone or redone (which
+        deletes its spill file), first copying it into any view that still shows it.
+        """
+        for view in list(self._views.values()):
+            view.detach_from(store, 0)
+        close = getattr(store, "close", None)
+        if close is not None:
+            close()
+
+    def _journal_changes(self):
+        """
+        Journals what changed since the last call, as binary log frames, when autosaving.
+        """
+        if self._journal is None:
+            return
+        length = len(self.history)
+        if self._journal_low == self._journal_synced == length - 1:
+            # The common case, one calculation added.
+            self._journal_synced = self._journal_low = length
+            self._journal.write(encode_entry(self.history.entry(-1)), length)
+            return
+        frames = []
+        start = self._journal_synced
+        if self._journal_low < self._journal_synced:
+            frames.append(encode_truncate(self._journal_low))
+            start = self._journal_low
+        frames.extend(encode_entry(entry) for entry in self.history.entries(start))
+        self._journal_synced = self._journal_low = length
+        self._journal.write(b"".join(frames), length)
+
+    def start_autosave(self, file_path: str = None) -> int:
+        """
+        Starts journaling every change and checkpointing the journal into a saved
+        history in the background (see app.history.journal).
+
+        Changes a crash left in the journal are applied to the saved history
+        first. The saved history then replaces this one, as with load; if there
+        is none yet, this history is saved there.
+
+        :param file_path: History log to autosave to. Defaults to the value of HISTORY_FILE.
+        :return: Number of changes recovered from the journal.
+        :raises HistoryLogError: If the file is not a history log.
+        """
+        if file_path is None:
+            file_path = get_config().history_file or DEFAULT_HISTORY_FILE
+        if _is_csv(file_path):
+            raise ValueError("Autosave needs a history log, not a CSV file.")
+        self.stop_autosave()
+        config = get_config()
+        recovered = recover(file_path, config.fsync_interval)
+        log = open_log(file_path, config.fsync_interval)
+        try:
+            self._replace_store(log.read(entries=self._new_store()))
+        except FileNotFoundError:
+            log.rewrite(self.history.entries())
+        self._journal_synced = self._journal_low = len(self.history)
+        self._journal = Journal(file_path, len(self.history), config.fsync_interval,
+                                config.journal_commit_interval, config.checkpoint_interval)
+        logging.info("Autosaving history to %s.", file_path)
+        return recovered
+
+    def stop_autosave(self):
+        """
+        Checkpoints the journal into the saved history and stops autosaving.
+        Does nothing if autosave is off.
+        """
+        if self._journal is None:
+            return
+        journal, self._journal = self._journal, None
+        journal.close()
+        if self._log is not None and self._log.path == journal.history_path:
+            # Checkpoints appended to it behind the back of this log object.
+            self._log = None
+        logging.info("Stopped autosaving history to %s.", journal.history_path)
+
+    def _autosaving(self, file_path: str) -> bool:
+        return self._journal is not None and self._journal.history_path == file_path
+
+    def where(self, query):
+        """
+        Finds the entries matching a query such as "op=div result>100" using the
+        operation and result indexes (see app.history.query). The indexes are
+        built on the first call and kept up to date afterwards.
+
+        :param query: Query text or a parsed Query.
+        :return: Positions of the matching entries, in order.
+        :raises QueryError: If the query text is invalid.
+        """
+        from app.history import query as history_query  # pylint: disable=import-outside-toplevel
+
+        if isinstance(query, str):
+            query = history_query.parse_query(query)
+        if self._index is None:
+            self._index = history_query.HistoryIndex.build(self.history)
+        return self._index.search(query)
+
     def get_history(self):
         """
-        Retrieves a copy of the list of calculations.
-        :return: List of calculations.
+        Retrieves the list of calculations as a snapshot that does not copy them.
+
+        The returned HistoryView reads from the current store and keeps showing
+        the same calculations after later changes: entries are only copied out
+        when undo is about to drop them, or when the view itself is modified.
+        :return: List-like view of the calculations.
         """
         logging.debug("Retrieved history.")
-        return self.history.copy()
+        view = HistoryView(self.history, len(self.history))
+        self._views[id(view)] = view
+        return view
 
     def save(self, file_path: str = None):
         """
-        Saves the history to a CSV file.
+        Saves the history to a file.
 
-        :param file_path: Path to the CSV file where history will be saved.
+        Paths ending in .csv are written as a full CSV export. Any other path is a
+        log in the backend open_log() selects (see app.history.backends): the
+        append-only binary log by default, or SQLite. When it is the log this
+        history was last saved to or loaded from, only the changes since then are
+        appended, otherwise the log is written from scratch. While autosaving to
+        file_path, saving checkpoints the journal into it.
+
+        :param file_path: Path to the file where history will be saved.
                           Defaults to the value of HISTORY_FILE environment variable or 'default.csv'.
         """
         if file_path is None:
-            # Retrieve from environment variable with a fallback
-            file_path = os.getenv("HISTORY_FILE", "default.csv")
-            logging.debug(f"No file_path provided. Using HISTORY_FILE from env: {file_path}")
-        df = pd.DataFrame({'calculations': self.history})
-        df.to_csv(file_path, index=False)
-        logging.info(f"History successfully saved to {file_path}.")
+            # Retrieve from the environment configuration with a fallback
+            file_path = get_config().history_file or DEFAULT_HISTORY_FILE
+            logging.debug("No file_path provided. Using HISTORY_FILE from env: %s", file_path)
+        try:
+            if self._autosaving(file_path):
+                self._journal.checkpoint()
+            elif _is_csv(file_path):
+                self.export_csv(file_path)
+            elif self._log is not None and self._log.path == file_path and os.path.exists(file_path):
+                truncate_to = self._log_low if self._log_low < self._log_synced else None
+                start = self._log_low if truncate_to is not None else self._log_synced
+                self._log.append(self.history.entries(start), truncate_to)
+                self._mark_log_synced(self._log)
+            else:
+                self._write_log(open_log(file_path, get_config().fsync_interval))
+        except HistoryLogError as error:
+            logging.error("%s", error)
+            print(error)
+            return
+        logging.info("History successfully saved to %s.", file_path)
         print(f"History successfully saved to {file_path}.")
 
     def load(self, file_path: str = None):
         """
-        Loads the history from a CSV file.
+        Loads the history from a file.
+
+        Paths ending in .csv are imported as CSV; any other path is read as a log
+        (binary or SQLite, see app.history.backends).
 
-        :param file_path: Path to the CSV file from which history will be loaded.
+        :param file_path: Path to the file from which history will be loaded.
                           Defaults to the value of HISTORY_FILE environment variable or 'default.csv'.
         """
         if file_path is None:
-            # Retrieve from environment variable with a fallback
-            file_path = os.getenv("HISTORY_FILE", "default.csv")
-            logging.debug(f"No file_path provided. Using HISTORY_FILE from env: {file_path}")
+            # Retrieve from the environment configuration with a fallback
+            file_path = get_config().history_file or DEFAULT_HISTORY_FILE
+            logging.debug("No file_path provided. Using HISTORY_FILE from env: %s", file_path)
+        if _is_csv(file_path):
+            self.import_csv(file_path)
+            return
+        if self._autosaving(file_path):
+            self._journal.checkpoint()
+        log = open_log(file_path, get_config().fsync_interval)
         try:
-            df = pd.read_csv(file_path)
-            if 'calculations' in df.columns:
-                self.history = df['calculations'].dropna().tolist()
-                logging.info(f"History successfully loaded from {file_path}.")
-                print(f"History successfully loaded from {file_path}.")
-            else:
-                logging.warning(f"'calculations' column not found in {file_path}.")
-                print(f"The file {file_path} does not contain 'calculations' column.")
+            self._replace_store(log.read(entries=self._new_store()))
+        except FileNotFoundError:
+            logging.error("The file %s was not found.", file_path)
+            print(f"The file {file_path} was not found.")
+            return
+        except HistoryLogError as error:
+            logging.error("%s", error)
+            print(error)
+            return
+        self._mark_log_synced(log)
+        logging.info("History successfully loaded from %s.", file_path)
+        print(f"History successfully loaded from {file_path}.")
+
+    def iter_history(self, file_path: str = None):
+        """
+        Yields the calculations saved in a file one at a time, without loading
+        them into this history. Memory use stays bounded whatever the file size.
+
+        :param file_path: History log or .csv file to read.
+                          Defaults to the value of HISTORY_FILE environment variable or 'default.csv'.
+        :raises FileNotFoundError: If the file does not exist.
+        :raises HistoryLogError: If a non-CSV file is not a history log.
+        """
+        if file_path is None:
+            file_path = get_config().history_file or DEFAULT_HISTORY_FILE
+        if _is_csv(file_path):
+            for chunk in _csv_chunks(file_path):
+                yield from chunk
+        else:
+            for entry in open_log(file_path, get_config().fsync_interval).iter_entries():
+                yield str(entry)
+
+    def open_saved(self, file_path: str = None):
+        """
+        Opens a saved history log for random access without loading it. Entries
+        and ranges are read through the log's offset index (see MappedLog), or
+        by primary key from a SQLite history (see SQLiteReader).
+        Close the result when done, or use it in a with statement.
+
+        :param file_path: History log to open. Defaults to the log last saved or
+                          loaded, then to the value of HISTORY_FILE.
+        :raises FileNotFoundError: If the file does not exist.
+        :raises HistoryLogError: If the file is not a binary history log.
+        """
+        if file_path is None:
+            file_path = self._log.path if self._log is not None else get_config().history_file or DEFAULT_HISTORY_FILE
+        if _is_csv(file_path):
+            raise HistoryLogError(f"{file_path} is a CSV export; only binary history logs are indexed.")
+        return open_reader(file_path)
+
+    def compact(self, file_path: str = None):
+        """
+        Rewrites a binary history log so it holds one record per saved entry,
+        dropping the records of undone and cleared calculations. Unsaved changes
+        are not written.
+
+        :param file_path: Log to compact. Defaults to the log last saved or loaded.
+        """
+        if file_path is None:
+            if self._log is None:
+                print("Nothing to compact: history has not been saved to a log yet.")
+                return
+            file_path = self._log.path
+        if _is_csv(file_path):
+            print("Only binary history logs can be compacted.")
+            return
+        if self._log is not None and self._log.path == file_path:
+            log = self._log
+        else:
+            log = open_log(file_path, get_config().fsync_interval)
+        try:
+            with self._journal.paused() if self._autosaving(file_path) else nullcontext():
+                before = _disk_size(file_path)
+                log.rewrite(log.read())
+        except FileNotFoundError:
+            logging.error("The file %s was not found.", file_path)
+            print(f"The file {file_path} was not found.")
+            return
+        except HistoryLogError as error:
+            logging.error("%s", error)
+            print(error)
+            return
+        after = _disk_size(file_path)
+        logging.info("History log %s compacted from %s to %s bytes.", file_path, before, after)
+        print(f"History log {file_path} compacted from {before} to {after} bytes.")
+
+    def export_csv(self, file_path: str):
+        """
+        Writes the whole history to a CSV file with a 'calculations' column.
+        """
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+
+        df = pd.DataFrame({'calculations': list(self.history)})
+        df.to_csv(file_path, index=False)
+
+    def import_csv(self, file_path: str):
+        """
+        Replaces the history with the 'calculations' column of a CSV file.
+        The file is parsed CSV_CHUNK_SIZE rows at a time.
+        """
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+
+        try:
+            entries = self._new_store()
+            for chunk in _csv_chunks(file_path):
+                entries.extend(chunk)
         except FileNotFoundError:
-            logging.error(f"The file {file_path} was not found.")
+            logging.error("The file %s was not found.", file_path)
             print(f"The file {file_path} was not found.")
         except pd.errors.EmptyDataError:
-            logging.error(f"The file {file_path} is empty.")
+            logging.error("The file %s is empty.", file_path)
             print(f"The file {file_path} is empty.")
+        except KeyError:
+            logging.warning("'calculations' column not found in %s.", file_path)
+            print(f"The file {file_path} does not contain 'calculations' column.")
+        else:
+            self._replace_store(entries)
+            logging.info("History successfully loaded from %s.", file_path)
+            print(f"History successfully loaded from {file_path}.")
+
+    def _write_log(self, log: HistoryBackend):
+        log.rewrite(self.history.entries())
+        self._mark_log_synced(log)
+
+    def _mark_log_synced(self, log: HistoryBackend):
+        self._log = log
+        self._log_synced = self._log_low = len(self.history)
 
     def get_history_with_logging(self):
         """
@@ -102,3 +506,34 @@ class History:
         """
         logging.info("History accessed.")
         return self.get_history()
+
+
+def _is_csv(file_path: str) -> bool:
+    return file_path.lower().endswith(".csv")
+
+
+def _disk_size(path: str) -> int:
+    """Size of a saved history: the file, or every file of an archive directory."""
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    return os.path.getsize(path)
+
+
+def _csv_chunks(file_path: str):
+    """
+    Yields the non-empty values of the 'calculations' column as lists of strings.
+
+    :raises KeyError: If the file has no 'calculations' column.
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    if 'calculations' not in pd.read_csv(file_path, nrows=0).columns:
+        raise KeyError('calculations')
+    with pd.read_csv(file_path, usecols=['calculations'], dtype={'calculations': str},
+                     chunksize=CSV_CHUNK_SIZE) as reader:
+        for chunk in reader:
+            yield chunk['calculations'].dropna().tolist()
+
+
+# Imported last: SharedHistory subclasses History.
+from app.history.shared import SharedHistory  # pylint: disable=wrong-import-position,cyclic-import  # noqa: E402
@@ -0,0 +1,295 @@
+# app/history/archive.py
+
+"""
+Segmented, compressed history archives.
+
+An archive is a directory holding a manifest and a series of segments:
+
+    history.archive/
+        manifest.json
+        segment-000000000000-1.gz
+        segment-000000100000-1.gz
+        ...
+
+Each segment holds HISTORY_SEGMENT_SIZE consecutive entries (the last one
+may hold fewer) encoded as binary log frames (see app.history.binlog) and
+compressed as a whole with gzip or lzma (HISTORY_ARCHIVE_CODEC). The
+manifest lists the segments in order with their first entry, entry count
+and raw and compressed sizes:
+
+    {"format": 1, "codec": "gzip", "segment_size": 100000, "entries": 250000,
+     "generation": 3, "segments": [{"file": "...", "first": 0, "entries": 100000,
+                                    "raw_bytes": ..., "bytes": ...}, ...]}
+
+Segments are never modified. A save writes new segment files (named with
+the next generation, so they never overwrite one the old manifest still
+lists), then replaces the manifest atomically, then deletes the files only
+the old manifest listed; a crash at any point leaves the previous archive
+readable. Appending keeps the full segments as they are and only rewrites
+the last, partial one (and, after an undo, the one holding the cut), so
+rotation into fixed-size segments costs at most one segment per save.
+
+Compression and decompression run in HISTORY_ARCHIVE_THREADS threads; zlib
+and lzma release the GIL while they work. Reads are lazy: segments are
+decompressed in order, at most one per thread ahead of the one being
+consumed, so memory use is bounded by a few segments.
+"""
+
+import gzip
+import json
+import logging
+import lzma
+import os
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from app.history.binlog import (
+    DEFAULT_FSYNC_INTERVAL, HistoryLogError, add_frame, buffer_frames, decode_entry, encode_entry,
+)
+from app.history.records import Entry, RecordStore, SavedEntries
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+CODECS = {
+    "gzip": (lambda data: gzip.compress(data, compresslevel=6), gzip.decompress, ".gz"),
+    "lzma": (lambda data: lzma.compress(data, preset=6), lzma.decompress, ".xz"),
+}
+DEFAULT_SEGMENT_SIZE = 100_000
+
+
+def _workers(threads: int) -> int:
+    return threads if threads > 0 else min(os.cpu_count() or 1, 8)
+
+
+class ArchiveLog:
+    """
+    Reader and writer for one segmented history archive.
+
+    :param path: Directory of the archive.
+    :param fsync_interval: 0 leaves flushing to the operating system; otherwise
+                           segments and manifest are fsynced on every save.
+    :param codec: "gzip" or "lzma" for new segments.
+    :param segment_size: Entries per segment.
+    :param threads: Threads compressing and decompressing segments; 0 picks one per CPU (up to 8).
+    """
+    def __init__(self, path: str, fsync_interval: int = DEFAULT_FSYNC_INTERVAL, codec: str = "gzip",
+                 segment_size: int = DEFAULT_SEGMENT_SIZE, threads: int = 0):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown archive codec {codec!r}. Choose one of: {', '.join(CODECS)}.")
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.codec = codec
+        self.segment_size = max(segment_size, 1)
+        self.workers = _workers(threads)
+
+    def manifest(self) -> dict:
+        """
+        Reads the manifest.
+
+        :raises FileNotFoundError: If the archive does not exist.
+        :raises HistoryLogError: If the directory is not a history archive.
+        """
+        if not os.path.isdir(self.path):
+            if os.path.exists(self.path):
+                raise HistoryLogError(f"{self.path} is not a history archive.")
+            raise FileNotFoundError(self.path)
+        try:
+            with open(os.path.join(self.path, MANIFEST), encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+        except (ValueError, FileNotFoundError):
+            raise HistoryLogError(f"{self.path} is not a history archive.") from None
+        if manifest.get("format") != FORMAT or manifest.get("codec") not in CODECS:
+            raise HistoryLogError(f"{self.path} is not a history archive in a supported format.")
+        return manifest
+
+    def _read_segment(self, codec: str, segment: dict) -> bytes:
+        with open(os.path.join(self.path, segment["file"]), "rb") as segment_file:
+            data = CODECS[codec][1](segment_file.read())
+        if len(data) != segment["raw_bytes"]:
+            raise HistoryLogError(f"Segment {segment['file']} of {self.path} is damaged.")
+        return data
+
+    def segment_data(self, manifest: dict, segments: Optional[List[dict]] = None) -> Iterator[bytes]:
+        """
+        Yields the decompressed contents of segments (default: all of them) in
+        order, decompressing up to one segment per thread ahead.
+        """
+        codec = manifest["codec"]
+        segments = manifest["segments"] if segments is None else segments
+        if self.workers == 1 or len(segments) <= 1:
+            for segment in segments:
+                yield self._read_segment(codec, segment)
+            return
+        remaining = iter(segments)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="archive-read") as pool:
+            pending = deque(pool.submit(self._read_segment, codec, segment)
+                            for segment in islice(remaining, self.workers))
+            while pending:
+                data = pending.popleft().result()
+                for segment in islice(remaining, 1):
+                    pending.append(pool.submit(self._read_segment, codec, segment))
+                yield data
+
+    def read(self, entries=None) -> RecordStore:
+        """
+        Loads every entry into a store.
+
+        :param entries: Empty store to load into. Defaults to a new RecordStore.
+        :raises FileNotFoundError: If the archive does not exist.
+        :raises HistoryLogError: If the directory is not a history archive.
+        """
+        if entries is None:
+            entries = RecordStore()
+        for data in self.segment_data(self.manifest()):
+            for kind, payload, _ in buffer_frames(data):
+                add_frame(entries, kind, payload)
+        return entries
+
+    def iter_entries(self) -> Iterator[Entry]:
+        """
+        Yields the archived entries one segment at a time.
+        """
+        for data in self.segment_data(self.manifest()):
+            for kind, payload, _ in buffer_frames(data):
+                yield decode_entry(kind, payload)
+
+    def rewrite(self, entries: Iterable[Entry]):
+        """
+        Replaces the archive with entries.
+        """
+        try:
+            manifest = self.manifest()
+        except (FileNotFoundError, HistoryLogError):
+            manifest = None
+        self._commit(manifest, [], 0, entries)
+
+    def append(self, entries: Iterable[Entry], truncate_to: int = None):
+        """
+        Adds entries after the archived ones. Full segments before the end (or
+        before truncate_to) are kept; the entries of the rest are re-cut into
+        segments together with the new ones.
+
+        :param truncate_to: If given, entries from this position on are dropped first.
+        """
+        manifest = self.manifest()
+        segments = manifest["segments"]
+        length = manifest["entries"] if truncate_to is None else min(truncate_to, manifest["entries"])
+        if manifest["codec"] != self.codec:
+            # Recompresses every segment with the configured codec.
+            self._commit(manifest, [], 0, _chain(self._entries(manifest, segments, 0, length), entries))
+            return
+        kept = []
+        for segment in segments:
+            end = segment["first"] + segment["entries"]
+            if end > length or (segment is segments[-1] and segment["entries"] < self.segment_size):
+                break
+            kept.append(segment)
+        start = kept[-1]["first"] + kept[-1]["entries"] if kept else 0
+        carried = self._entries(manifest, segments[len(kept):], start, length)
+        self._commit(manifest, kept, start, _chain(carried, entries))
+
+    def _entries(self, manifest: dict, segments: List[dict], start: int, stop: int) -> Iterator[Entry]:
+        """Entries from start to stop, read from segments (which begin at start)."""
+        position = start
+        for data in self.segment_data(manifest, segments):
+            for kind, payload, _ in buffer_frames(data):
+                if position >= stop:
+                    return
+                yield decode_entry(kind, payload)
+                position += 1
+
+    def _commit(self, manifest: Optional[dict], kept: List[dict], start: int, entries: Iterable[Entry]):
+        """
+        Writes entries as new segments from position start, then a manifest
+        listing kept followed by them, then deletes unreferenced segments.
+
+        :raises HistoryLogError: If path is a regular file.
+        """
+        if os.path.exists(self.path) and not os.path.isdir(self.path):
+            raise HistoryLogError(f"{self.path} is a file, not a history archive directory.")
+        generation = manifest["generation"] + 1 if manifest else 1
+        os.makedirs(self.path, exist_ok=True)
+        compress, _, extension = CODECS[self.codec]
+        written = list(kept)
+        entries = iter(entries)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="archive-write") as pool:
+            # One segment per thread is encoded and compressed at a time, which bounds memory use.
+            while True:
+                batch = []
+                for _ in range(self.workers):
+                    items = list(islice(entries, self.segment_size))
+                    if not items:
+                        break
+                    batch.append((b"".join(map(encode_entry, items)), len(items)))
+                if not batch:
+                    break
+                for (chunk, count), compressed in zip(batch, pool.map(compress, [chunk for chunk, _ in batch])):
+                    name = f"segment-{start:012d}-{generation}{extension}"
+                    self._write(name, compressed)
+                    written.append({"file": name, "first": start, "entries": count,
+                                    "raw_bytes": len(chunk), "bytes": len(compressed)})
+                    start += count
+        new_manifest = {"format": FORMAT, "codec": self.codec, "segment_size": self.segment_size,
+                        "entries": start, "generation": generation, "segments": written}
+        self._write(MANIFEST, json.dumps(new_manifest, indent=1).encode("utf-8"))
+        referenced = {segment["file"] for segment in written} | {MANIFEST}
+        for name in os.listdir(self.path):
+            if name.startswith("segment-") and name not in referenced:
+                os.remove(os.path.join(self.path, name))
+        logging.debug("Archive %s now holds %d entries in %d segments.", self.path, start, len(written))
+
+    def _write(self, name: str, data: bytes):
+        """Writes a file of the archive atomically."""
+        path = os.path.join(self.path, name)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as output:
+            output.write(data)
+            if self.fsync_interval:
+                output.flush()
+                os.fsync(output.fileno())
+        os.replace(temp_path, path)
+
+    def sync(self):
+        """
+        Nothing to do: every save is complete on disk when it returns.
+        """
+
+
+def _chain(first: Iterator[Entry], second: Iterable[Entry]) -> Iterator[Entry]:
+    yield from first
+    yield from second
+
+
+class ArchiveReader(SavedEntries):
+    """
+    Random access to the entries of an archive, with the interface of MappedLog.
+    The segment holding the last entry asked for is kept decoded.
+
+    :raises FileNotFoundError: If the archive does not exist.
+    :raises HistoryLogError: If the directory is not a history archive.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._archive = ArchiveLog(path, threads=1)
+        self._manifest = self._archive.manifest()
+        self._firsts = [segment["first"] for segment in self._manifest["segments"]]
+        self._length = self._manifest["entries"]
+        self._cached = (None, [])
+
+    def _segment(self, number: int) -> List[Entry]:
+        if self._cached[0] != number:
+            data = self._archive._read_segment(  # pylint: disable=protected-access
+                self._manifest["codec"], self._manifest["segments"][number])
+            self._cached = (number, [decode_entry(kind, payload) for kind, payload, _ in buffer_frames(data)])
+        return self._cached[1]
+
+    def entry(self, index: int) -> Entry:
+        index = self._position(index)
+        number = bisect_right(self._firsts, index) - 1
+        return self._segment(number)[index - self._firsts[number]]
+
+    def close(self):
+        self._cached = (None, [])
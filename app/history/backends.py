@@ -0,0 +1,105 @@
+# app/history/backends.py
+
+"""
+Storage backends for saved histories.
+
+History saves to and loads from any object with the HistoryBackend
+interface; open_log() picks the implementation for a path:
+
+    *.csv                   full CSV export/import (handled by History itself)
+    *.db, *.sqlite(3)       SQLiteLog (app.history.sqlite)
+    *.archive               ArchiveLog, a directory of compressed segments
+                            (app.history.archive)
+    anything else           HISTORY_BACKEND: "binlog" (HistoryLog, the
+                            default), "sqlite" or "archive"
+
+open_reader() does the same for the random-access readers used by history
+tail and history get. The SQLite and archive backends (and sqlite3, the
+compression codecs and the thread pool) are only imported when a path
+selects them.
+"""
+
+from typing import Iterable, Iterator, Optional, Protocol
+
+from app.config import get_config
+from app.history.binlog import HistoryLog, MappedLog
+from app.history.records import Entry, RecordStore
+
+# File name extensions that select SQLite or an archive whatever HISTORY_BACKEND says.
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+ARCHIVE_EXTENSION = ".archive"
+
+
+class HistoryBackend(Protocol):
+    """
+    What History needs from a saved-history backend.
+    """
+    path: str
+
+    def read(self, entries=None) -> RecordStore:
+        """Loads every entry (into entries, an empty store, if given)."""
+
+    def iter_entries(self) -> Iterator[Entry]:
+        """Yields the saved entries without building a history."""
+
+    def append(self, entries: Iterable[Entry], truncate_to: Optional[int] = None) -> None:
+        """Saves entries after the stored ones, cutting back to truncate_to entries first if given."""
+
+    def rewrite(self, entries: Iterable[Entry]) -> None:
+        """Atomically replaces everything stored with entries."""
+
+    def sync(self) -> None:
+        """Forces saved entries to disk."""
+
+
+def backend_name(path: str) -> str:
+    """
+    Name of the backend used for a (non-CSV) path. HISTORY_BACKEND is
+    checked against app.config.HISTORY_BACKENDS when the configuration is read.
+    """
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return "sqlite"
+    if path.lower().rstrip("/").endswith(ARCHIVE_EXTENSION):
+        return "archive"
+    return get_config().history_backend
+
+
+def open_log(path: str, fsync_interval: Optional[int] = None) -> HistoryBackend:
+    """
+    Returns the backend for a saved history at path.
+
+    :param fsync_interval: Defaults to HISTORY_FSYNC_INTERVAL.
+    """
+    config = get_config()
+    if fsync_interval is None:
+        fsync_interval = config.fsync_interval
+    backend = backend_name(path)
+    if backend == "sqlite":
+        from app.history.sqlite import SQLiteLog  # pylint: disable=import-outside-toplevel
+
+        return SQLiteLog(path, fsync_interval)
+    if backend == "archive":
+        from app.history.archive import ArchiveLog  # pylint: disable=import-outside-toplevel
+
+        return ArchiveLog(path, fsync_interval, config.archive_codec, config.segment_size, config.archive_threads)
+    return HistoryLog(path, fsync_interval)
+
+
+def open_reader(path: str):
+    """
+    Opens a saved history for random access (MappedLog, SQLiteReader or
+    ArchiveReader, which share the SavedEntries interface).
+
+    :raises FileNotFoundError: If the file does not exist.
+    :raises HistoryLogError: If the file is not a saved history.
+    """
+    backend = backend_name(path)
+    if backend == "sqlite":
+        from app.history.sqlite import SQLiteReader  # pylint: disable=import-outside-toplevel
+
+        return SQLiteReader(path)
+    if backend == "archive":
+        from app.history.archive import ArchiveReader  # pylint: disable=import-outside-toplevel
+
+        return ArchiveReader(path)
+    return MappedLog(path)
@@ -0,0 +1,411 @@
+# app/history/binlog.py
+
+"""
+Append-only binary history log.
+
+The file starts with an 8 byte magic header followed by framed records.
+Each frame is a 1 byte record type and a 4 byte little-endian payload
+length, then the payload:
+
+    ADD       UTF-8 text of one calculation, appended to the history.
+    RECORD1   Operand and result as doubles, then the operation name.
+    RECORD2   Both operands and the result as doubles, then the operation name.
+    TRUNCATE  8 byte entry count; the history is cut back to that length
+              (written when entries saved earlier were undone or cleared).
+
+Saving only appends the frames for what changed since the last save, and
+loading replays the frames while reading the file in fixed-size blocks, so
+memory use does not grow with the size of the file. compact() rewrites the
+file so that it holds one frame per current entry (RECORD1 or RECORD2 for a
+calculation, ADD for free-form text) and no TRUNCATE frames.
+
+Next to the log, "<log>.idx" holds the file offset of every current entry's
+frame as little-endian 64-bit integers, after a 16 byte header with its own
+magic and the log size it describes. Appends and rewrites keep it up to
+date; MappedLog rebuilds it whenever that size does not match the log (for
+example after a crash between the two writes) and then serves any entry or
+range by memory-mapping both files, without reading the rest of the log.
+"""
+
+import io
+import logging
+import mmap
+import os
+import struct
+from array import array
+from typing import Iterable, Iterator, List, Tuple
+
+from app.history.records import Entry, Record, RecordStore, SavedEntries
+
+MAGIC = b"CALCLOG1"
+FRAME = struct.Struct("<BI")
+COUNT = struct.Struct("<Q")
+VALUES1 = struct.Struct("<dd")
+VALUES2 = struct.Struct("<ddd")
+INDEX_MAGIC = b"CALCIDX1"
+INDEX_HEADER = struct.Struct("<8sQ")
+OFFSET = struct.Struct("<Q")
+ADD = 1
+TRUNCATE = 2
+RECORD1 = 3
+RECORD2 = 4
+
+# fsync after this many appended frames; 0 leaves flushing to the operating system.
+DEFAULT_FSYNC_INTERVAL = 1
+# Bytes read from the log at a time when replaying it.
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class HistoryLogError(ValueError):
+    """
+    Raised when a file is not a history log or contains an unknown record.
+    """
+
+
+def encode_entry(entry: Entry) -> bytes:
+    if isinstance(entry, Record):
+        name = entry.operation.encode("utf-8")
+        if len(entry.operands) == 2:
+            values = VALUES2.pack(entry.operands[0], entry.operands[1], entry.result)
+            return FRAME.pack(RECORD2, len(values) + len(name)) + values + name
+        values = VALUES1.pack(entry.operands[0], entry.result)
+        return FRAME.pack(RECORD1, len(values) + len(name)) + values + name
+    payload = entry.encode("utf-8")
+    return FRAME.pack(ADD, len(payload)) + payload
+
+
+def encode_truncate(length: int) -> bytes:
+    return FRAME.pack(TRUNCATE, COUNT.size) + COUNT.pack(length)
+
+
+def index_path(log_path: str) -> str:
+    return f"{log_path}.idx"
+
+
+def _pack_offsets(offsets: List[int]) -> bytes:
+    return struct.pack(f"<{len(offsets)}Q", *offsets)
+
+
+def decode_entry(kind: int, payload) -> Entry:
+    """
+    Turns the payload of an ADD, RECORD1 or RECORD2 frame back into an entry.
+    """
+    if kind == RECORD2:
+        a, b, result = VALUES2.unpack_from(payload)
+        return Record(str(payload[VALUES2.size:], "utf-8"), (a, b), result)
+    if kind == RECORD1:
+        a, result = VALUES1.unpack_from(payload)
+        return Record(str(payload[VALUES1.size:], "utf-8"), (a,), result)
+    return str(payload, "utf-8")
+
+
+def add_frame(entries, kind: int, payload) -> None:
+    """
+    Appends the entry of an ADD, RECORD1 or RECORD2 frame to a store without
+    building a Record first.
+    """
+    if kind == RECORD2:
+        a, b, result = VALUES2.unpack_from(payload)
+        entries.add(str(payload[VALUES2.size:], "utf-8"), (a, b), result)
+    elif kind == RECORD1:
+        a, result = VALUES1.unpack_from(payload)
+        entries.add(str(payload[VALUES1.size:], "utf-8"), (a,), result)
+    else:
+        entries.append_text(str(payload, "utf-8"))
+
+
+def iter_frames(stream, offset: int = 0, block_size: int = READ_BLOCK_SIZE):
+    """
+    Yields (record type, payload, offset) for each complete frame from the current
+    position of a binary stream to its end, reading block_size bytes at a time.
+    A payload is only valid until the next frame is requested.
+
+    :param offset: Position of the stream when called; yielded offsets are relative to it.
+    :return: The offset just past the last complete frame and the number of
+             trailing bytes that did not form a complete frame.
+    """
+    pending = b""
+    while True:
+        block = stream.read(block_size)
+        data = pending + block if pending else block
+        view = memoryview(data)
+        position = 0
+        end = len(data)
+        while position + FRAME.size <= end:
+            kind, length = FRAME.unpack_from(view, position)
+            start = position + FRAME.size
+            if start + length > end:
+                break
+            yield kind, view[start:start + length], offset + position
+            position = start + length
+        offset += position
+        pending = bytes(view[position:])
+        if not block:
+            return offset, len(pending)
+
+
+def buffer_frames(data: bytes) -> Iterator[Tuple[int, memoryview, int]]:
+    """
+    Yields (record type, payload, offset) for each complete frame in a buffer
+    that holds frames only (see iter_frames).
+    """
+    return iter_frames(io.BytesIO(data), block_size=max(len(data), 1))
+
+
+class HistoryLog:
+    """
+    Reader and writer for one history log file.
+
+    :param path: Location of the log file.
+    :param fsync_interval: Number of appended frames after which the file is fsynced.
+                           Saves are batched until the threshold is reached; 0 disables fsync.
+    """
+    def __init__(self, path: str, fsync_interval: int = DEFAULT_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self._unsynced = 0
+        # Offset just past the last complete frame we have read or written, None if unknown.
+        self._end = None
+
+    def frames(self, block_size: int = READ_BLOCK_SIZE) -> Iterator[Tuple[int, memoryview, int]]:
+        """
+        Yields (record type, payload, offset) for each complete frame, reading the
+        file block_size bytes at a time (see iter_frames).
+
+        A frame cut short by a crash during a write is ignored and will be
+        overwritten by the next append.
+
+        :raises FileNotFoundError: If the log does not exist.
+        :raises HistoryLogError: If the file is not a history log.
+        """
+        with open(self.path, "rb") as log_file:
+            if log_file.read(len(MAGIC)) != MAGIC:
+                raise HistoryLogError(f"{self.path} is not a history log.")
+            end, leftover = yield from iter_frames(log_file, len(MAGIC), block_size)
+        if leftover:
+            logging.warning("Ignoring %d bytes of incomplete record at the end of %s.", leftover, self.path)
+        self._end = end
+
+    def read(self, block_size: int = READ_BLOCK_SIZE, entries=None) -> RecordStore:
+        """
+        Replays the log into a RecordStore. Besides the result, only one block of
+        the file is held in memory at a time.
+
+        :param entries: Empty store to replay into. Defaults to a new RecordStore.
+        :return: The entries described by the log.
+        :raises FileNotFoundError: If the log does not exist.
+        :raises HistoryLogError: If the file is not a history log.
+        """
+        if entries is None:
+            entries = RecordStore()
+        for kind, payload, offset in self.frames(block_size):
+            if kind in (ADD, RECORD1, RECORD2):
+                add_frame(entries, kind, payload)
+            elif kind == TRUNCATE:
+                entries.truncate(COUNT.unpack_from(payload)[0])
+            else:
+                raise HistoryLogError(f"Unknown record type {kind} in {self.path} at offset {offset}.")
+        return entries
+
+    def iter_entries(self, block_size: int = READ_BLOCK_SIZE) -> Iterator[Entry]:
+        """
+        Yields the entries described by the log without building the history.
+
+        An entry is only final once no later TRUNCATE frame cuts it off, so the log
+        is read twice: the first pass notes the TRUNCATE frames, the second yields
+        the entries that survive them. Memory use is bounded by one block plus one
+        integer per TRUNCATE frame.
+
+        :raises FileNotFoundError: If the log does not exist.
+        :raises HistoryLogError: If the file is not a history log.
+        """
+        # For each TRUNCATE frame, the shortest length the history is cut to from there on.
+        cuts = []
+        for kind, payload, offset in self.frames(block_size):
+            if kind == TRUNCATE:
+                cuts.append(COUNT.unpack_from(payload)[0])
+            elif kind not in (ADD, RECORD1, RECORD2):
+                raise HistoryLogError(f"Unknown record type {kind} in {self.path} at offset {offset}.")
+        for index in range(len(cuts) - 2, -1, -1):
+            cuts[index] = min(cuts[index], cuts[index + 1])
+
+        length = 0
+        next_cut = 0
+        for kind, payload, _ in self.frames(block_size):
+            if kind == TRUNCATE:
+                length = min(length, COUNT.unpack_from(payload)[0])
+                next_cut += 1
+                continue
+            position = length
+            length += 1
+            if next_cut < len(cuts) and position >= cuts[next_cut]:
+                # Undone or cleared by a later TRUNCATE frame.
+                continue
+            yield decode_entry(kind, payload)
+
+    def append(self, entries: Iterable[Entry], truncate_to: int = None):
+        """
+        Appends entries to the log in a single write.
+
+        :param entries: Calculations to append.
+        :param truncate_to: If given, a TRUNCATE frame cutting the history back to
+                            this length is written before the new entries.
+        """
+        frames = [encode_entry(entry) for entry in entries]
+        if truncate_to is not None:
+            frames.insert(0, encode_truncate(truncate_to))
+        if not frames:
+            return
+        if self._end is None:
+            self._end = os.path.getsize(self.path)
+        start = self._end
+        offsets = []
+        position = start
+        for frame in frames:
+            if frame[0] != TRUNCATE:
+                offsets.append(position)
+            position += len(frame)
+        data = b"".join(frames)
+        with open(self.path, "r+b") as log_file:
+            log_file.seek(self._end)
+            log_file.write(data)
+            log_file.truncate()
+            self._unsynced += len(frames)
+            if self.fsync_interval and self._unsynced >= self.fsync_interval:
+                self._fsync(log_file)
+        self._end += len(data)
+        self._update_index(start, truncate_to, offsets)
+
+    def _update_index(self, previous_end: int, truncate_to, offsets: List[int]):
+        """
+        Extends the offset index after an append. An index that does not describe
+        the log as it was before the append is left alone; it is stale and
+        MappedLog will rebuild it.
+        """
+        try:
+            with open(index_path(self.path), "r+b") as index_file:
+                header = index_file.read(INDEX_HEADER.size)
+                if len(header) != INDEX_HEADER.size or INDEX_HEADER.unpack(header) != (INDEX_MAGIC, previous_end):
+                    return
+                size = index_file.seek(0, os.SEEK_END)
+                if truncate_to is not None:
+                    size = min(size, INDEX_HEADER.size + OFFSET.size * truncate_to)
+                index_file.seek(size)
+                index_file.write(_pack_offsets(offsets))
+                index_file.truncate()
+                index_file.seek(0)
+                index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, self._end))
+        except FileNotFoundError:
+            pass
+
+    def rewrite(self, entries: Iterable[Entry]):
+        """
+        Atomically replaces the log with one frame per entry: RECORD1 or RECORD2
+        for a calculation, ADD for free-form text.
+        """
+        temp_path = f"{self.path}.tmp"
+        frames = [encode_entry(entry) for entry in entries]
+        offsets = []
+        position = len(MAGIC)
+        for frame in frames:
+            offsets.append(position)
+            position += len(frame)
+        with open(temp_path, "wb") as log_file:
+            log_file.write(MAGIC)
+            log_file.write(b"".join(frames))
+            self._end = log_file.tell()
+            self._fsync(log_file)
+        os.replace(temp_path, self.path)
+        self._write_index(offsets)
+
+    def _write_index(self, offsets: List[int]):
+        temp_path = f"{index_path(self.path)}.tmp"
+        with open(temp_path, "wb") as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, self._end))
+            index_file.write(_pack_offsets(offsets))
+        os.replace(temp_path, index_path(self.path))
+
+    def build_index(self) -> int:
+        """
+        Writes the offset index for the log from one pass over its frames.
+
+        :return: Size of the log up to its last complete frame.
+        """
+        offsets = array("Q")
+        for kind, payload, offset in self.frames():
+            if kind == TRUNCATE:
+                del offsets[COUNT.unpack_from(payload)[0]:]
+            elif kind in (ADD, RECORD1, RECORD2):
+                offsets.append(offset)
+            else:
+                raise HistoryLogError(f"Unknown record type {kind} in {self.path} at offset {offset}.")
+        self._write_index(offsets.tolist())
+        return self._end
+
+    def sync(self):
+        """
+        Forces any batched appends to disk.
+        """
+        if self._unsynced and os.path.exists(self.path):
+            with open(self.path, "rb") as log_file:
+                self._fsync(log_file)
+
+    def _fsync(self, log_file):
+        log_file.flush()
+        os.fsync(log_file.fileno())
+        self._unsynced = 0
+
+
+class MappedLog(SavedEntries):
+    """
+    Read-only random access to the entries of a saved history log.
+
+    Both the log and its offset index are memory-mapped, so len(), indexing and
+    slicing only touch the pages of the entries asked for. Indexing and
+    iteration return the rendered strings, like RecordStore.
+
+    :param path: Location of the log file.
+    :raises FileNotFoundError: If the log does not exist.
+    :raises HistoryLogError: If the file is not a history log.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._log_file = open(path, "rb")  # pylint: disable=consider-using-with
+        try:
+            size = os.fstat(self._log_file.fileno()).st_size
+            if self._log_file.read(len(MAGIC)) != MAGIC:
+                raise HistoryLogError(f"{path} is not a history log.")
+            if not self._index_matches(size):
+                logging.info("Rebuilding the offset index of %s.", path)
+                # A torn tail is left out of the index and the mapping.
+                size = HistoryLog(path, 0).build_index()
+            self._log = mmap.mmap(self._log_file.fileno(), size, access=mmap.ACCESS_READ)
+            with open(index_path(path), "rb") as index_file:
+                self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._log_file.close()
+            raise
+        self._length = (len(self._index) - INDEX_HEADER.size) // OFFSET.size
+
+    def _index_matches(self, size: int) -> bool:
+        try:
+            with open(index_path(self.path), "rb") as index_file:
+                header = index_file.read(INDEX_HEADER.size)
+        except FileNotFoundError:
+            return False
+        return len(header) == INDEX_HEADER.size and INDEX_HEADER.unpack(header) == (INDEX_MAGIC, size)
+
+    def entry(self, index: int) -> Entry:
+        """
+        Returns the entry at index as a Record, or as a string for text entries.
+        """
+        position = INDEX_HEADER.size + OFFSET.size * self._position(index)
+        offset = OFFSET.unpack_from(self._index, position)[0]
+        kind, length = FRAME.unpack_from(self._log, offset)
+        start = offset + FRAME.size
+        return decode_entry(kind, self._log[start:start + length])
+
+    def close(self):
+        self._index.close()
+        self._log.close()
+        self._log_file.close()
@@ -0,0 +1,283 @@
+# app/history/journal.py
+
+"""
+Write-ahead journal for autosaving a history.
+
+With autosave on (History.start_autosave), every change to the history is
+journaled as it is made, and a background thread folds the journal into the
+saved history, so a crash loses at most the last commit interval instead of
+everything since the last save.
+
+The journal, "<history>.journal", starts with an 8 byte magic header and the
+number of entries the saved history held when the journal was started. Then
+come batches: a 4 byte payload length and the payload's CRC-32, followed by
+binary log frames (see app.history.binlog). An added entry is an ADD, RECORD1
+or RECORD2 frame, an undo a TRUNCATE frame, and a history that was replaced
+(clear, load, import, or undoing one of those) a TRUNCATE to 0 followed by
+its entries.
+
+Changes are buffered in memory and committed in groups: every
+commit_interval seconds the checkpoint thread writes everything pending as
+one batch and fsyncs once. With a commit_interval of 0 each change is
+written and fsynced before the call that made it returns.
+
+Every checkpoint_interval seconds (and on save and close) the journal is
+checkpointed: it is renamed to "<history>.journal.ckpt" and a new one is
+started, then the renamed journal is applied to the saved history with the
+backend's append(entries, truncate_to), the history is fsynced and the
+renamed journal deleted. Only the rename is done while changes wait, so the
+REPL is not blocked while the history is written. truncate_to is always
+passed, which makes applying the same journal twice harmless.
+
+recover() applies the journals a crash left behind, oldest first. A batch
+cut short or corrupted by a crash mid-write fails its length or CRC check;
+it and anything after it were never committed and are ignored.
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import List, Tuple
+
+from app.history.backends import HistoryBackend, open_log
+from app.history.binlog import ADD, COUNT, FRAME, RECORD1, RECORD2, TRUNCATE, HistoryLogError, decode_entry
+
+JOURNAL_MAGIC = b"CALCWAL1"
+HEADER = struct.Struct("<8sQ")
+BATCH = struct.Struct("<II")
+
+# Seconds between group commits, and between checkpoints (0 checkpoints only on save and close).
+DEFAULT_COMMIT_INTERVAL = 0.05
+DEFAULT_CHECKPOINT_INTERVAL = 30.0
+
+
+def journal_path(history_path: str) -> str:
+    return f"{history_path}.journal"
+
+
+def checkpoint_path(history_path: str) -> str:
+    return f"{history_path}.journal.ckpt"
+
+
+def read_journal(path: str) -> Tuple[int, List[Tuple[int, bytes]]]:
+    """
+    Reads a journal.
+
+    :return: The saved history length the journal starts from, and the
+             (record type, payload) of every frame in its committed batches.
+    :raises FileNotFoundError: If the journal does not exist.
+    :raises HistoryLogError: If the file is not a journal.
+    """
+    with open(path, "rb") as journal_file:
+        data = journal_file.read()
+    if len(data) < HEADER.size or data[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+        raise HistoryLogError(f"{path} is not a history journal.")
+    base = HEADER.unpack_from(data)[1]
+    frames = []
+    position = HEADER.size
+    while position + BATCH.size <= len(data):
+        length, checksum = BATCH.unpack_from(data, position)
+        start = position + BATCH.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+        offset = 0
+        while offset < length:
+            kind, size = FRAME.unpack_from(payload, offset)
+            offset += FRAME.size
+            frames.append((kind, payload[offset:offset + size]))
+            offset += size
+        position = start + length
+    if position < len(data):
+        logging.warning("Ignoring %d bytes of uncommitted changes at the end of %s.", len(data) - position, path)
+    return base, frames
+
+
+def apply_journal(path: str, log: HistoryBackend) -> int:
+    """
+    Applies the committed changes of a journal to a saved history and fsyncs it.
+
+    :return: Number of changes (frames) applied.
+    :raises HistoryLogError: If the file is not a journal or holds an unknown record.
+    """
+    base, frames = read_journal(path)
+    if not frames:
+        return 0
+    # Entries from position low on are replaced by tail.
+    low, tail = base, []
+    for kind, payload in frames:
+        if kind == TRUNCATE:
+            length = COUNT.unpack_from(payload)[0]
+            if length < low:
+                low, tail = length, []
+            else:
+                del tail[length - low:]
+        elif kind in (ADD, RECORD1, RECORD2):
+            tail.append(decode_entry(kind, payload))
+        else:
+            raise HistoryLogError(f"Unknown record type {kind} in {path}.")
+    if not os.path.exists(log.path):
+        log.rewrite([])
+    log.append(tail, truncate_to=low)
+    log.sync()
+    return len(frames)
+
+
+def recover(history_path: str, fsync_interval: int = None) -> int:
+    """
+    Applies and deletes the journals left next to a saved history, if any.
+
+    :return: Number of changes recovered.
+    """
+    recovered = 0
+    for path in (checkpoint_path(history_path), journal_path(history_path)):
+        if os.path.exists(path):
+            recovered += apply_journal(path, open_log(history_path, fsync_interval))
+            os.remove(path)
+    if recovered:
+        logging.warning("Recovered %d unsaved changes to %s from its journal.", recovered, history_path)
+    return recovered
+
+
+class Journal:
+    """
+    Journal of the changes to a history saved at history_path, with the thread
+    that commits and checkpoints it.
+
+    :param history_path: Saved history the journal is checkpointed into. It
+                         must hold the first base entries of the history.
+    :param base: Number of entries in the saved history.
+    :param fsync_interval: Passed to the history's backend (see open_log).
+    :param commit_interval: Seconds between group commits; 0 commits every change.
+    :param checkpoint_interval: Seconds between checkpoints; 0 checkpoints only on save and close.
+    """
+    def __init__(self, history_path: str, base: int, fsync_interval: int = None,
+                 commit_interval: float = DEFAULT_COMMIT_INTERVAL,
+                 checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL):
+        self.history_path = history_path
+        self.path = journal_path(history_path)
+        self.fsync_interval = fsync_interval
+        self.commit_interval = commit_interval
+        self.checkpoint_interval = checkpoint_interval
+        # _lock guards the pending changes; _commit_lock the journal file; _checkpoint_lock the saved history.
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+        self._pending: List[bytes] = []
+        self._length = self._committed_length = base
+        self._written = 0
+        self._file = self._create(base)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="history-checkpointer", daemon=True)
+        self._thread.start()
+
+    def _create(self, base: int):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as journal_file:
+            journal_file.write(HEADER.pack(JOURNAL_MAGIC, base))
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(temp_path, self.path)
+        return open(self.path, "ab")  # pylint: disable=consider-using-with
+
+    def write(self, frames: bytes, length: int):
+        """
+        Journals a change.
+
+        :param frames: Binary log frames describing it.
+        :param length: Length of the history after it.
+        """
+        with self._lock:
+            self._pending.append(frames)
+            self._length = length
+        if not self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        """
+        Writes the pending changes as one batch and fsyncs the journal.
+        """
+        with self._commit_lock:
+            self._commit()
+
+    def _commit(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            length = self._length
+        if pending:
+            payload = b"".join(pending)
+            self._file.write(BATCH.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._written += len(payload)
+        self._committed_length = length
+
+    def checkpoint(self) -> int:
+        """
+        Commits the pending changes and applies the journal to the saved history.
+
+        :return: Number of changes applied.
+        """
+        with self._checkpoint_lock:
+            return self._checkpoint()
+
+    @contextmanager
+    def paused(self):
+        """
+        Checkpoints, then keeps further checkpoints from touching the saved
+        history until the with block ends (for rewriting it, as compact does).
+        """
+        with self._checkpoint_lock:
+            self._checkpoint()
+            yield
+
+    def _checkpoint(self) -> int:
+        # A checkpoint that failed left its journal behind; it comes first.
+        applied = self._apply_renamed()
+        with self._commit_lock:
+            self._commit()
+            if not self._written:
+                return applied
+            self._file.close()
+            os.replace(self.path, checkpoint_path(self.history_path))
+            self._file = self._create(self._committed_length)
+            self._written = 0
+        return applied + self._apply_renamed()
+
+    def _apply_renamed(self) -> int:
+        path = checkpoint_path(self.history_path)
+        if not os.path.exists(path):
+            return 0
+        # A fresh backend: the saved history may have been rewritten since the last checkpoint.
+        applied = apply_journal(path, open_log(self.history_path, self.fsync_interval))
+        os.remove(path)
+        logging.debug("Checkpointed %d changes into %s.", applied, self.history_path)
+        return applied
+
+    def _run(self):
+        interval = self.commit_interval or self.checkpoint_interval or None
+        next_checkpoint = time.monotonic() + self.checkpoint_interval
+        while not self._stopped.wait(interval):
+            try:
+                self.commit()
+                if self.checkpoint_interval and time.monotonic() >= next_checkpoint:
+                    self.checkpoint()
+                    next_checkpoint = time.monotonic() + self.checkpoint_interval
+            except (OSError, HistoryLogError) as error:
+                # The changes stay in the journal and are applied by the next checkpoint or recover().
+                logging.error("Autosave of %s failed: %s", self.history_path, error)
+
+    def close(self):
+        """
+        Stops the thread, checkpoints everything journaled and removes the journal.
+        """
+        self._stopped.set()
+        self._thread.join()
+        self.checkpoint()
+        with self._commit_lock:
+            self._file.close()
+            os.remove(self.path)
@@ -0,0 +1,240 @@
+# app/history/query.py
+
+"""
+Secondary indexes and queries over calculation history.
+
+A query such as "op=div result>100" is answered from two indexes instead of
+rendering and testing every entry:
+
+    by operation  the positions of each operation's entries, in order
+    by result     (result, position) pairs sorted by result, so a range of
+                  results is found by binary search
+
+Both are updated as entries are added, undone or cleared. New results go
+to a small unsorted tail that is merged into the sorted part once it grows
+past an eighth of it, which keeps appends amortized O(log n). Only entries
+stored as records (operation, operands, result) are indexed; free-form
+text entries never match a query.
+
+The indexes are built with NumPy on first use, so this module is only
+imported when history is queried.
+"""
+
+import bisect
+import re
+from array import array
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from app.history.records import Entry, Record, RecordStore
+from app.operations import get_operation
+
+# The unsorted tail is merged once it holds this many entries (or an eighth of the sorted part).
+MERGE_THRESHOLD = 4096
+
+_CONDITION = re.compile(r"\s*(\w+)\s*(>=|<=|==|=|>|<)\s*([^\s<>=]+)\s*")
+
+
+class QueryError(ValueError):
+    """
+    Raised when a history query cannot be parsed.
+    """
+
+
+class Query(NamedTuple):
+    """
+    Conditions of a history query. Unset fields do not restrict the result.
+    """
+    operation: Optional[str] = None
+    low: float = float("-inf")
+    high: float = float("inf")
+    include_low: bool = True
+    include_high: bool = True
+
+    def matches(self, entry: Entry) -> bool:
+        """
+        Tests one entry against the query, the way a full scan would.
+        """
+        if not isinstance(entry, Record):
+            return False
+        if self.operation is not None and entry.operation != self.operation:
+            return False
+        return not self.filters_result or self.accepts_result(entry.result)
+
+    def accepts_result(self, result: float) -> bool:
+        return ((result > self.low or (self.include_low and result == self.low))
+                and (result < self.high or (self.include_high and result == self.high)))
+
+    @property
+    def filters_result(self) -> bool:
+        return self.low != float("-inf") or self.high != float("inf") or not (self.include_low and self.include_high)
+
+
+def parse_query(text: str) -> Query:
+    """
+    Parses conditions such as "op=div result>100 result<=500".
+
+    Supported fields are op (equality only; aliases resolve to the registered
+    name) and result (=, <, <=, >, >=). Conditions are combined with AND.
+
+    :raises QueryError: If the text is not a valid query.
+    """
+    query = Query()
+    position = 0
+    text = text.strip()
+    if not text:
+        raise QueryError("Empty query.")
+    while position < len(text):
+        match = _CONDITION.match(text, position)
+        if match is None:
+            raise QueryError(f"Cannot parse {text[position:].strip()!r}.")
+        field, operator, value = match.groups()
+        position = match.end()
+        if field == "op":
+            if operator not in ("=", "=="):
+                raise QueryError("op only supports '='.")
+            operation = get_operation(value)
+            query = query._replace(operation=operation.name if operation is not None else value)
+        elif field == "result":
+            try:
+                number = float(value)
+            except ValueError as error:
+                raise QueryError(f"{value!r} is not a number.") from error
+            if operator in ("=", "==", ">", ">=") and (number > query.low or (number == query.low and operator == ">")):
+                query = query._replace(low=number, include_low=operator != ">")
+            if operator in ("=", "==", "<", "<=") and (number < query.high or (number == query.high and operator == "<")):
+                query = query._replace(high=number, include_high=operator != "<")
+        else:
+            raise QueryError(f"Unknown field {field!r}; use op or result.")
+    return query
+
+
+class HistoryIndex:
+    """
+    Operation and result indexes over the positions of a history.
+    """
+    def __init__(self):
+        self._by_op = {}
+        self._sorted_results = np.empty(0, dtype=np.float64)
+        self._sorted_positions = np.empty(0, dtype=np.int64)
+        # Every position in the sorted part is below this.
+        self._sorted_end = 0
+        self._pending_results = array("d")
+        self._pending_positions = array("q")
+
+    @classmethod
+    def build(cls, store) -> "HistoryIndex":
+        """
+        Indexes every entry of a RecordStore (with array operations) or of any
+        store that yields its entries.
+        """
+        index = cls()
+        if isinstance(store, RecordStore):
+            codes, results, names = store.columns()
+            codes = np.array(codes, dtype=np.uint16)
+            results = np.array(results, dtype=np.float64)
+            for code, (name, _) in enumerate(names):
+                if code:
+                    positions = np.flatnonzero(codes == code)
+                    if len(positions):
+                        index._add_op_positions(name, positions)
+            indexed = (codes != 0) & ~np.isnan(results)
+        else:
+            results = array("d")
+            indexed = array("b")
+            by_op = {}
+            for position, entry in enumerate(store.entries()):
+                is_record = isinstance(entry, Record)
+                results.append(entry.result if is_record else 0.0)
+                indexed.append(is_record and entry.result == entry.result)
+                if is_record:
+                    by_op.setdefault(entry.operation, array("q")).append(position)
+            index._by_op = by_op
+            results = np.array(results, dtype=np.float64)
+            indexed = np.array(indexed, dtype=bool)
+        positions = np.flatnonzero(indexed)
+        order = np.argsort(results[positions], kind="stable")
+        index._sorted_results = results[positions][order]
+        index._sorted_positions = positions[order]
+        index._sorted_end = len(store)
+        return index
+
+    def _add_op_positions(self, name: str, positions):
+        existing = self._by_op.get(name)
+        if existing is not None:
+            positions = np.union1d(np.array(existing, dtype=np.int64), positions)
+        self._by_op[name] = array("q", positions.astype(np.int64).tobytes())
+
+    def add(self, position: int, entry: Entry):
+        """
+        Indexes the entry just appended at position.
+        """
+        if not isinstance(entry, Record):
+            return
+        positions = self._by_op.get(entry.operation)
+        if positions is None:
+            positions = self._by_op[entry.operation] = array("q")
+        positions.append(position)
+        if entry.result == entry.result:
+            self._pending_results.append(entry.result)
+            self._pending_positions.append(position)
+            if len(self._pending_positions) > max(MERGE_THRESHOLD, len(self._sorted_positions) // 8):
+                self._merge()
+
+    def _merge(self):
+        results = np.concatenate([self._sorted_results, np.array(self._pending_results, dtype=np.float64)])
+        positions = np.concatenate([self._sorted_positions, np.array(self._pending_positions, dtype=np.int64)])
+        # Stable, so entries with equal results stay in position order.
+        order = np.argsort(results, kind="stable")
+        self._sorted_results = results[order]
+        self._sorted_positions = positions[order]
+        self._sorted_end = int(self._pending_positions[-1]) + 1
+        self._pending_results = array("d")
+        self._pending_positions = array("q")
+
+    def truncate(self, length: int):
+        """
+        Forgets every position from length onwards (after undo or clear).
+        """
+        for positions in self._by_op.values():
+            del positions[bisect.bisect_left(positions, length):]
+        cut = bisect.bisect_left(self._pending_positions, length)
+        del self._pending_results[cut:]
+        del self._pending_positions[cut:]
+        if length < self._sorted_end:
+            keep = self._sorted_positions < length
+            self._sorted_results = self._sorted_results[keep]
+            self._sorted_positions = self._sorted_positions[keep]
+            self._sorted_end = length
+
+    def _result_positions(self, query: Query) -> np.ndarray:
+        start = np.searchsorted(self._sorted_results, query.low, side="left" if query.include_low else "right")
+        stop = np.searchsorted(self._sorted_results, query.high, side="right" if query.include_high else "left")
+        found = self._sorted_positions[start:stop]
+        pending = [position for result, position in zip(self._pending_results, self._pending_positions)
+                   if query.accepts_result(result)]
+        if pending:
+            found = np.concatenate([found, np.array(pending, dtype=np.int64)])
+        return np.sort(found)
+
+    def search(self, query: Query) -> List[int]:
+        """
+        Returns the positions of the entries matching the query, in order.
+        """
+        if query.operation is not None:
+            by_op = np.array(self._by_op.get(query.operation, ()), dtype=np.int64)
+            if not query.filters_result:
+                return by_op.tolist()
+            return np.intersect1d(by_op, self._result_positions(query), assume_unique=True).tolist()
+        if query.filters_result:
+            return self._result_positions(query).tolist()
+        positions = [np.array(positions, dtype=np.int64) for positions in self._by_op.values()]
+        return np.sort(np.concatenate(positions)).tolist() if positions else []
+
+
+def scan(entries, query: Query) -> List[int]:
+    """
+    Answers a query by testing every entry; the baseline the indexes replace.
+    """
+    return [position for position, entry in enumerate(entries) if query.matches(entry)]
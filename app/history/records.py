@@ -0,0 +1,281 @@
+# app/history/records.py
+
+"""
+Compact, column-oriented storage for calculation history.
+
+Calculations are kept as parallel arrays instead of one formatted string per
+entry: a small integer op code per entry (array('H')) and the operands and
+result as doubles (array('d')). An entry costs 26 bytes plus amortized array
+growth, and the "<op> <a> <b> = <result>" string is only rendered when it is
+asked for. Entries that do not fit that shape (free-form text, complex
+results, more than two operands) are stored as plain strings on the side.
+"""
+
+from array import array
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# Op code 0 marks an entry stored as plain text.
+TEXT = 0
+MAX_CODES = 0xFFFF
+
+
+class Record(NamedTuple):
+    """
+    One calculation: operation name, operands and result.
+    """
+    operation: str
+    operands: Tuple[float, ...]
+    result: float
+
+    def __str__(self):
+        operands = " ".join(map(str, self.operands))
+        return f"{self.operation} {operands} = {self.result}"
+
+
+Entry = Union[Record, str]
+
+
+def parse_calculation(text: str):
+    """
+    Turns "<op> <a> [<b>] = <result>" back into a Record when rendering the
+    Record gives exactly the same text, so storing it compactly is lossless.
+
+    :return: The Record, or None if the text has to be kept as a string.
+    """
+    parts = text.split(" ")
+    if len(parts) not in (4, 5) or parts[-2] != "=" or not parts[0]:
+        return None
+    try:
+        numbers = [float(part) for part in parts[1:-2]]
+        result = float(parts[-1])
+    except ValueError:
+        return None
+    if any(str(number) != part for number, part in zip(numbers, parts[1:-2])) or str(result) != parts[-1]:
+        return None
+    return Record(parts[0], tuple(numbers), result)
+
+
+class RecordStore:
+    """
+    List-like container of calculations backed by typed arrays.
+
+    Indexing and iteration return the rendered strings, so the store can be
+    used wherever a list of calculation strings was used before; entry() and
+    records() give access to the structured values without parsing.
+    """
+    __slots__ = ("_ops", "_a", "_b", "_results", "_text", "_names", "_codes")
+
+    def __init__(self, entries=()):
+        self._ops = array("H")
+        self._a = array("d")
+        self._b = array("d")
+        self._results = array("d")
+        self._text = {}
+        # Op code -> (name, arity); code 0 is reserved for text entries.
+        self._names = [("", 0)]
+        self._codes = {}
+        self.extend(entries)
+
+    def _code(self, operation: str, arity: int) -> int:
+        key = (operation, arity)
+        code = self._codes.get(key)
+        if code is None:
+            if len(self._names) > MAX_CODES:
+                return TEXT
+            code = len(self._names)
+            self._names.append(key)
+            self._codes[key] = code
+        return code
+
+    def add(self, operation: str, operands, result) -> None:
+        """
+        Appends a calculation from its parts. Falls back to text storage when
+        the values cannot be represented as doubles.
+        """
+        operands = tuple(operands)
+        if (type(result) is not float or len(operands) not in (1, 2)  # pylint: disable=unidiomatic-typecheck
+                or any(type(operand) is not float for operand in operands)):  # pylint: disable=unidiomatic-typecheck
+            self.append_text(str(Record(operation, operands, result)))
+            return
+        code = self._code(operation, len(operands))
+        if code == TEXT:
+            self.append_text(str(Record(operation, operands, result)))
+            return
+        self._ops.append(code)
+        self._a.append(operands[0])
+        self._b.append(operands[1] if len(operands) == 2 else 0.0)
+        self._results.append(result)
+
+    def append(self, entry: Entry) -> None:
+        """
+        Appends a Record or a calculation string. Strings in the canonical
+        format are stored compactly, anything else is kept verbatim.
+        """
+        if isinstance(entry, Record):
+            self.add(entry.operation, entry.operands, entry.result)
+            return
+        record = parse_calculation(entry)
+        if record is None:
+            self.append_text(entry)
+        else:
+            self.add(record.operation, record.operands, record.result)
+
+    def append_text(self, text: str) -> None:
+        """
+        Appends an entry that is stored and returned verbatim.
+        """
+        self._text[len(self._ops)] = text
+        self._ops.append(TEXT)
+        self._a.append(0.0)
+        self._b.append(0.0)
+        self._results.append(0.0)
+
+    def extend(self, entries) -> None:
+        for entry in entries:
+            self.append(entry)
+
+    def entry(self, index: int) -> Entry:
+        """
+        Returns the entry at index as a Record, or as a string for text entries.
+        """
+        if index < 0:
+            index += len(self._ops)
+        code = self._ops[index]
+        if code == TEXT:
+            return self._text[index]
+        name, arity = self._names[code]
+        operands = (self._a[index], self._b[index]) if arity == 2 else (self._a[index],)
+        return Record(name, operands, self._results[index])
+
+    def entries(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Entry]:
+        """
+        Yields the entries from start up to stop (the end by default) as Records or strings.
+        """
+        for index in range(start, len(self._ops) if stop is None else min(stop, len(self._ops))):
+            yield self.entry(index)
+
+    def records(self) -> List[Entry]:
+        return list(self.entries())
+
+    def columns(self):
+        """
+        The op code and result columns and the op code -> (name, arity) table,
+        for building indexes in bulk. Text entries have op code 0.
+        """
+        return self._ops, self._results, self._names
+
+    def pop(self) -> str:
+        """
+        Removes the last entry and returns it rendered.
+        """
+        removed = self[-1]
+        index = len(self._ops) - 1
+        self._text.pop(index, None)
+        for column in (self._ops, self._a, self._b, self._results):
+            column.pop()
+        return removed
+
+    def truncate(self, length: int) -> None:
+        """
+        Drops every entry from length onwards.
+        """
+        for index in [index for index in self._text if index >= length]:
+            del self._text[index]
+        for column in (self._ops, self._a, self._b, self._results):
+            del column[length:]
+
+    def drop_head(self, count: int) -> None:
+        """
+        Drops the first count entries; the remaining entries move to the front.
+        """
+        self._text = {index - count: text for index, text in self._text.items() if index >= count}
+        for column in (self._ops, self._a, self._b, self._results):
+            del column[:count]
+
+    def clear(self) -> None:
+        self.truncate(0)
+
+    def copy(self) -> List[str]:
+        return list(self)
+
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by the columns and text entries, in bytes.
+        """
+        columns = sum(column.buffer_info()[1] * column.itemsize
+                      for column in (self._ops, self._a, self._b, self._results))
+        return columns + sum(len(text) for text in self._text.values())
+
+    def __len__(self):
+        return len(self._ops)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [str(self.entry(i)) for i in range(*index.indices(len(self._ops)))]
+        if not -len(self._ops) <= index < len(self._ops):
+            raise IndexError("history index out of range")
+        return str(self.entry(index))
+
+    def __iter__(self):
+        for index in range(len(self._ops)):
+            yield str(self.entry(index))
+
+    def __eq__(self, other):
+        if isinstance(other, (RecordStore, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"RecordStore({list(self)!r})"
+
+
+class SavedEntries:
+    """
+    Base of the read-only random-access views of a saved history (MappedLog,
+    SQLiteReader, ArchiveReader). Subclasses set _length and implement entry()
+    and close(); indexing and iteration return the rendered strings, like
+    RecordStore. Close a reader when done, or use it in a with statement.
+    """
+    _length = 0
+
+    def entry(self, index: int) -> Entry:
+        raise NotImplementedError
+
+    def _position(self, index: int) -> int:
+        """
+        The position of index counted from the start, for subclasses' entry().
+        """
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("history index out of range")
+        return index
+
+    def entries(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Entry]:
+        stop = self._length if stop is None else min(stop, self._length)
+        for index in range(start, stop):
+            yield self.entry(index)
+
+    def close(self) -> None:
+        """Releases the files or connection the reader holds."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step == 1:
+                return [str(entry) for entry in self.entries(start, stop)]
+            return [str(self.entry(i)) for i in range(start, stop, step)]
+        return str(self.entry(index))
+
+    def __iter__(self):
+        for entry in self.entries():
+            yield str(entry)
@@ -0,0 +1,183 @@
+# app/history/shared.py
+
+"""
+History that can be used by many threads at once.
+
+History itself takes no locks: undo_last checks and then pops, save reads
+the store while it is written, and so on. SharedHistory serializes every
+operation on one reentrant lock, except the one that threads do all the
+time, adding a calculation:
+
+- each thread appends its calculations to a buffer of its own, guarded by
+  a lock that only that thread and the merger ever take, together with a
+  number from a process-wide counter;
+- any other operation (or a buffer reaching MERGE_SIZE entries) takes the
+  history lock and merges every buffer into the store in counter order.
+
+Merging holds all the buffer locks at once, so it takes a consistent cut:
+every calculation numbered before the cut is merged, none after it. The
+history therefore sees calculations in one total order that respects the
+order of each thread, save writes a snapshot of that order, and nothing
+is lost or applied twice. get_history returns a view that takes the
+history lock for its reads.
+
+While autosaving (History.start_autosave), each calculation is merged as
+soon as it is added, so that it reaches the journal.
+
+Code that reads the history attribute directly should hold no expectation
+of consistency while other threads write; use get_history() instead.
+"""
+
+import functools
+import heapq
+import itertools
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from app.history import History
+from app.history.versions import HistoryView
+
+# A thread merges its own buffer once it holds this many calculations.
+MERGE_SIZE = 1024
+
+
+class _Buffer:
+    """
+    Calculations added by one thread and not merged yet, as (number, arguments).
+    """
+    __slots__ = ("lock", "items", "thread")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items: List[Tuple[int, tuple]] = []
+        self.thread = threading.current_thread()
+
+
+def _synchronized(method):
+    """
+    Runs a History method under the history lock, after merging the buffers.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:  # pylint: disable=protected-access
+            self._merge()  # pylint: disable=protected-access
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SharedHistory(History):
+    """
+    Thread-safe History with per-thread append buffers.
+
+    :param capacity: As for History.
+    :param undo_depth: As for History.
+    """
+    def __init__(self, capacity: Optional[int] = None, undo_depth: Optional[int] = None):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._buffers: List[_Buffer] = []
+        self._sequence = itertools.count()
+        self._dirty = False
+        self._merging = False
+        self._store = None
+        super().__init__(capacity, undo_depth)
+
+    @property
+    def history(self):
+        """
+        The store, with every calculation added so far merged into it.
+        """
+        if self._dirty and not self._merging:
+            with self._lock:
+                self._merge()
+        return self._store
+
+    @history.setter
+    def history(self, store):
+        self._store = store
+
+    def add_calculation(self, calculation: str):
+        if not isinstance(calculation, str):
+            raise TypeError("Calculation must be a string.")
+        self._buffer((calculation,))
+        logging.debug("Added calculation: %s", calculation)
+
+    def add_record(self, operation: str, operands, result):
+        self._buffer((operation, operands, result))
+        logging.debug("Added calculation: %s %s = %s", operation, operands, result)
+
+    def _buffer(self, arguments: tuple):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = _Buffer()
+            with self._lock:
+                self._buffers.append(buffer)
+        with buffer.lock:
+            buffer.items.append((next(self._sequence), arguments))
+            self._dirty = True
+            # While autosaving, calculations are merged as they come so that they are journaled.
+            full = len(buffer.items) >= MERGE_SIZE or self._journal is not None
+        if full:
+            with self._lock:
+                self._merge()
+
+    def _merge(self):
+        """
+        Moves every buffered calculation into the store, in the order they were
+        numbered. Must be called with the history lock held.
+        """
+        if not self._dirty:
+            return
+        self._dirty = False
+        buffers = self._buffers
+        for buffer in buffers:
+            buffer.lock.acquire()
+        try:
+            pending = [buffer.items for buffer in buffers if buffer.items]
+            for buffer in buffers:
+                if buffer.items:
+                    buffer.items = []
+        finally:
+            for buffer in buffers:
+                buffer.lock.release()
+        # Buffers of threads that have exited are empty now and will not be used again.
+        self._buffers = [buffer for buffer in buffers if buffer.thread.is_alive()]
+
+        self._merging = True
+        try:
+            for _, arguments in heapq.merge(*pending, key=lambda item: item[0]):
+                if len(arguments) == 1:
+                    self._store.append(arguments[0])
+                else:
+                    self._store.add(*arguments)
+                self._added()
+        finally:
+            self._merging = False
+
+    def get_history(self):
+        """
+        Retrieves the calculations as a view, like History.get_history. Reads
+        from the view take the history lock, so it stays consistent while
+        other threads add, undo or clear.
+        """
+        with self._lock:
+            self._merge()
+            view = HistoryView(self._store, len(self._store), self._lock)
+            self._views[id(view)] = view
+        return view
+
+    clear_history = _synchronized(History.clear_history)
+    undo_last = _synchronized(History.undo_last)
+    redo_last = _synchronized(History.redo_last)
+    stats = _synchronized(History.stats)
+    get_records = _synchronized(History.get_records)
+    where = _synchronized(History.where)
+    save = _synchronized(History.save)
+    load = _synchronized(History.load)
+    compact = _synchronized(History.compact)
+    open_saved = _synchronized(History.open_saved)
+    export_csv = _synchronized(History.export_csv)
+    import_csv = _synchronized(History.import_csv)
+    start_autosave = _synchronized(History.start_autosave)
+    stop_autosave = _synchronized(History.stop_autosave)
@@ -0,0 +1,214 @@
+# app/history/spill.py
+
+"""
+History storage with a bounded number of entries in memory.
+
+SpillingStore behaves like RecordStore, but keeps only the most recent
+`capacity` entries resident. When that is exceeded, the oldest entries are
+written in one batch to an unnamed temporary file (using the binary log's
+frame format) and dropped from memory. Spilled entries stay part of the
+history: iteration, indexing and saving read them back from the file, and
+undo/truncate move the last spilled batch back into memory when they reach it.
+
+Batches are a quarter of the capacity, so eviction costs amortized O(1) per
+entry and the memory held for the spilled part is two integers per batch.
+"""
+
+import bisect
+from typing import Iterator, List, Optional
+
+from app.history.binlog import buffer_frames, decode_entry, encode_entry
+from app.history.records import Entry, RecordStore
+
+
+class SpillingStore:
+    """
+    List-like container of calculations that spills its oldest entries to disk.
+
+    :param capacity: Maximum number of entries kept in memory.
+    :param entries: Initial entries.
+    :param directory: Where the spill file is created. Defaults to the system temp directory.
+    """
+    __slots__ = ("capacity", "batch", "directory", "_resident", "_file", "_starts", "_offsets", "_spilled", "_size")
+
+    def __init__(self, capacity: int, entries=(), directory: Optional[str] = None):
+        if capacity < 1:
+            raise ValueError("History capacity must be at least 1.")
+        self.capacity = capacity
+        self.batch = max(1, capacity // 4)
+        self.directory = directory
+        self._resident = RecordStore()
+        self._file = None
+        # Index of the first entry and file offset of each spilled batch.
+        self._starts: List[int] = []
+        self._offsets: List[int] = []
+        self._spilled = 0
+        self._size = 0
+        self.extend(entries)
+
+    @property
+    def resident(self) -> int:
+        """Number of entries held in memory."""
+        return len(self._resident)
+
+    @property
+    def spilled(self) -> int:
+        """Number of entries written to the spill file."""
+        return self._spilled
+
+    @property
+    def spilled_bytes(self) -> int:
+        """Size of the spilled entries on disk."""
+        return self._size
+
+    def add(self, operation: str, operands, result) -> None:
+        self._resident.add(operation, operands, result)
+        self._evict()
+
+    def append(self, entry: Entry) -> None:
+        self._resident.append(entry)
+        self._evict()
+
+    def append_text(self, text: str) -> None:
+        self._resident.append_text(text)
+        self._evict()
+
+    def extend(self, entries) -> None:
+        for entry in entries:
+            self.append(entry)
+
+    def _evict(self):
+        if len(self._resident) <= self.capacity:
+            return
+        count = max(self.batch, len(self._resident) - self.capacity)
+        if self._file is None:
+            import tempfile  # pylint: disable=import-outside-toplevel
+
+            self._file = tempfile.TemporaryFile(prefix="history-spill-", dir=self.directory)
+        data = b"".join(encode_entry(entry) for entry in self._resident.entries(0, count))
+        self._file.seek(self._size)
+        self._file.write(data)
+        self._starts.append(self._spilled)
+        self._offsets.append(self._size)
+        self._spilled += count
+        self._size += len(data)
+        self._resident.drop_head(count)
+
+    def _read_batch(self, batch: int) -> Iterator[Entry]:
+        end = self._offsets[batch + 1] if batch + 1 < len(self._offsets) else self._size
+        self._file.seek(self._offsets[batch])
+        for kind, payload, _ in buffer_frames(self._file.read(end - self._offsets[batch])):
+            yield decode_entry(kind, payload)
+
+    def _restore_last_batch(self):
+        """
+        Moves the last spilled batch back in front of the resident entries.
+        """
+        batch = len(self._starts) - 1
+        restored = RecordStore(self._read_batch(batch))
+        restored.extend(self._resident.entries())
+        self._resident = restored
+        self._spilled = self._starts.pop()
+        self._size = self._offsets.pop()
+        self._file.truncate(self._size)
+
+    def entry(self, index: int) -> Entry:
+        """
+        Returns the entry at index as a Record, or as a string for text entries.
+        """
+        if index < 0:
+            index += len(self)
+        if index >= self._spilled:
+            return self._resident.entry(index - self._spilled)
+        batch = bisect.bisect_right(self._starts, index) - 1
+        for position, entry in enumerate(self._read_batch(batch), self._starts[batch]):
+            if position == index:
+                return entry
+        raise IndexError("history index out of range")
+
+    def entries(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Entry]:
+        """
+        Yields the entries from start up to stop as Records or strings, reading
+        spilled batches from disk one at a time.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start < self._spilled:
+            for batch in range(bisect.bisect_right(self._starts, start) - 1, len(self._starts)):
+                if self._starts[batch] >= stop:
+                    return
+                for position, entry in enumerate(self._read_batch(batch), self._starts[batch]):
+                    if position >= stop:
+                        return
+                    if position >= start:
+                        yield entry
+        yield from self._resident.entries(max(start - self._spilled, 0), stop - self._spilled)
+
+    def records(self) -> List[Entry]:
+        return list(self.entries())
+
+    def pop(self) -> str:
+        """
+        Removes the last entry and returns it rendered.
+        """
+        if not self._resident and self._spilled:
+            self._restore_last_batch()
+        return self._resident.pop()
+
+    def truncate(self, length: int) -> None:
+        """
+        Drops every entry from length onwards.
+        """
+        while length < self._spilled:
+            self._resident.clear()
+            self._restore_last_batch()
+        self._resident.truncate(length - self._spilled)
+
+    def clear(self) -> None:
+        self._resident.clear()
+        self._starts.clear()
+        self._offsets.clear()
+        self._spilled = self._size = 0
+        if self._file is not None:
+            self._file.truncate(0)
+
+    def close(self) -> None:
+        """
+        Closes and so deletes the spill file. Spilled entries can no longer be read.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def copy(self) -> List[str]:
+        return list(self)
+
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by the resident entries, in bytes.
+        """
+        return self._resident.nbytes()
+
+    def __len__(self):
+        return self._spilled + len(self._resident)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return [str(entry) for entry in self.entries(start, stop)]
+            return [str(self.entry(i)) for i in range(start, stop, step)]
+        if not -len(self) <= index < len(self):
+            raise IndexError("history index out of range")
+        return str(self.entry(index))
+
+    def __iter__(self):
+        for entry in self.entries():
+            yield str(entry)
+
+    def __eq__(self, other):
+        if isinstance(other, (SpillingStore, RecordStore, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SpillingStore(capacity={self.capacity}, resident={self.resident}, spilled={self.spilled})"
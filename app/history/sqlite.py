@@ -0,0 +1,241 @@
+# app/history/sqlite.py
+
+"""
+SQLite history backend.
+
+Stores a saved history in one table, one row per entry, keyed by its
+position in the history:
+
+    entries(position INTEGER PRIMARY KEY, operation TEXT, a REAL, b REAL,
+            result REAL, text TEXT, created REAL)
+
+Calculations are stored as their operation, operands and result (b is NULL
+for one-operand operations); free-form entries as text with a NULL
+operation. SQLite has no NaN (it binds it as NULL), so non-finite numbers
+are stored as the TEXT 'nan', 'inf' or '-inf' and converted back on read.
+created is the time.time() at which the entry was saved, and operation and
+created are indexed for ad hoc queries with the sqlite3 shell.
+
+SQLiteLog has the interface of HistoryLog (see app.history.backends), so
+History saves incrementally to it: an append deletes the rows of undone
+entries and inserts the new ones in a single transaction, executemany()ing
+INSERT_BATCH_SIZE rows at a time. The database is in WAL mode, so readers
+never block the writer; HISTORY_FSYNC_INTERVAL maps to the synchronous
+pragma (1 is FULL, any other positive value NORMAL, 0 OFF). Reads step
+through a cursor READ_BATCH_SIZE rows at a time rather than fetching the
+whole table, and SQLiteReader serves history tail/get by primary key.
+"""
+
+import math
+import os
+import sqlite3
+import time
+from contextlib import closing
+from itertools import islice
+from typing import Iterable, Iterator
+
+from app.history.binlog import DEFAULT_FSYNC_INTERVAL, HistoryLogError
+from app.history.records import Entry, Record, RecordStore, SavedEntries
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    position INTEGER PRIMARY KEY,
+    operation TEXT,
+    a REAL,
+    b REAL,
+    result REAL,
+    text TEXT,
+    created REAL NOT NULL
+);
+"""
+INDEXES = {
+    "entries_operation": "CREATE INDEX IF NOT EXISTS entries_operation ON entries (operation)",
+    "entries_created": "CREATE INDEX IF NOT EXISTS entries_created ON entries (created)",
+}
+COLUMNS = "operation, a, b, result, text"
+INSERT = "INSERT INTO entries (position, operation, a, b, result, text, created) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+# Rows passed to one executemany() call inside a save transaction.
+INSERT_BATCH_SIZE = 10_000
+# Rows fetched from the cursor at a time when reading.
+READ_BATCH_SIZE = 10_000
+
+
+def _real(value):
+    return str(value) if isinstance(value, float) and not math.isfinite(value) else value
+
+
+def _number(value):
+    return float(value) if isinstance(value, str) else value
+
+
+def _row(position: int, entry: Entry, created: float) -> tuple:
+    if isinstance(entry, Record):
+        operands = entry.operands
+        return (position, entry.operation, _real(operands[0]), _real(operands[1]) if len(operands) == 2 else None,
+                _real(entry.result), None, created)
+    return position, None, None, None, None, entry, created
+
+
+def _entry(operation, a, b, result, text) -> Entry:
+    if operation is None:
+        return text
+    return Record(operation, (_number(a),) if b is None else (_number(a), _number(b)), _number(result))
+
+
+class SQLiteLog:
+    """
+    Reader and writer for one SQLite history database.
+
+    :param path: Location of the database file.
+    :param fsync_interval: 1 syncs every save (synchronous=FULL), 0 never
+                           (OFF), anything else at WAL checkpoints (NORMAL).
+    """
+    def __init__(self, path: str, fsync_interval: int = DEFAULT_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+
+    def connect(self, create: bool = True) -> sqlite3.Connection:
+        """
+        Opens the database in WAL mode, creating the table if needed.
+
+        :param create: If False, a missing database raises FileNotFoundError.
+        :raises HistoryLogError: If the file is not a SQLite history database.
+        """
+        if not create and not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            synchronous = "FULL" if self.fsync_interval == 1 else "NORMAL" if self.fsync_interval else "OFF"
+            connection.execute(f"PRAGMA synchronous={synchronous}")
+            connection.executescript(SCHEMA + "".join(f"{statement};\n" for statement in INDEXES.values()))
+        except sqlite3.DatabaseError as error:
+            connection.close()
+            raise HistoryLogError(f"{self.path} is not a history database: {error}") from None
+        return connection
+
+    def read(self, entries=None) -> RecordStore:
+        """
+        Loads every entry into a store.
+
+        :param entries: Empty store to load into. Defaults to a new RecordStore.
+        :raises FileNotFoundError: If the database does not exist.
+        :raises HistoryLogError: If the file is not a history database.
+        """
+        if entries is None:
+            entries = RecordStore()
+        for entry in self.iter_entries():
+            if isinstance(entry, Record):
+                entries.add(*entry)
+            else:
+                entries.append_text(entry)
+        return entries
+
+    def iter_entries(self, start: int = 0, stop: int = None) -> Iterator[Entry]:
+        """
+        Yields the entries from position start up to stop, fetching
+        READ_BATCH_SIZE rows at a time.
+
+        :raises FileNotFoundError: If the database does not exist.
+        :raises HistoryLogError: If the file is not a history database.
+        """
+        query = f"SELECT {COLUMNS} FROM entries WHERE position >= ?"
+        parameters = [start]
+        if stop is not None:
+            query += " AND position < ?"
+            parameters.append(stop)
+        with closing(self.connect(create=False)) as connection:
+            cursor = connection.execute(query + " ORDER BY position", parameters)
+            while True:
+                rows = cursor.fetchmany(READ_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield _entry(*row)
+
+    def append(self, entries: Iterable[Entry], truncate_to: int = None):
+        """
+        Saves entries after the ones already stored, in one transaction.
+
+        :param entries: Calculations to append.
+        :param truncate_to: If given, entries from this position on are deleted first.
+        """
+        with closing(self.connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                if truncate_to is not None:
+                    connection.execute("DELETE FROM entries WHERE position >= ?", (truncate_to,))
+                start = connection.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM entries").fetchone()[0]
+                self._insert(connection, start, entries)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def rewrite(self, entries: Iterable[Entry]):
+        """
+        Atomically replaces the stored history with entries. The indexes are
+        rebuilt after the rows are inserted, which is faster than updating them
+        row by row.
+        """
+        with closing(self.connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("DELETE FROM entries")
+                for name in INDEXES:
+                    connection.execute(f"DROP INDEX {name}")
+                self._insert(connection, 0, entries)
+                for statement in INDEXES.values():
+                    connection.execute(statement)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    @staticmethod
+    def _insert(connection: sqlite3.Connection, start: int, entries: Iterable[Entry]):
+        created = time.time()
+        rows = (_row(position, entry, created) for position, entry in enumerate(entries, start))
+        while True:
+            batch = list(islice(rows, INSERT_BATCH_SIZE))
+            if not batch:
+                break
+            connection.executemany(INSERT, batch)
+
+    def sync(self):
+        """
+        Checkpoints the write-ahead log into the database file.
+        """
+        if os.path.exists(self.path):
+            with closing(self.connect()) as connection:
+                connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class SQLiteReader(SavedEntries):
+    """
+    Read-only random access to a SQLite history, with the interface of MappedLog.
+
+    :raises FileNotFoundError: If the database does not exist.
+    :raises HistoryLogError: If the file is not a history database.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._log = SQLiteLog(path)
+        self._connection = self._log.connect(create=False)
+        self._length = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def entry(self, index: int) -> Entry:
+        row = self._connection.execute(f"SELECT {COLUMNS} FROM entries WHERE position = ?",
+                                       (self._position(index),)).fetchone()
+        return _entry(*row)
+
+    def entries(self, start: int = 0, stop: int = None) -> Iterator[Entry]:
+        stop = self._length if stop is None else min(stop, self._length)
+        cursor = self._connection.execute(
+            f"SELECT {COLUMNS} FROM entries WHERE position >= ? AND position < ? ORDER BY position", (start, stop))
+        for row in cursor:
+            yield _entry(*row)
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,228 @@
+# app/history/versions.py
+
+"""
+Undo/redo bookkeeping and copy-on-write views for History.
+
+Nothing here copies the history. The undo stack records what each change
+did rather than what the history looked like before it:
+
+- a run of added calculations is a single integer (how many were added),
+  so a million additions cost one stack slot;
+- clear, load and import replace the whole store, and the replaced store
+  is kept as a Snapshot. The old store is shared as is, not copied.
+
+Undoing an addition pops the entry and puts it on the redo stack; undoing a
+replacement swaps the stores back. Any new change empties the redo stack.
+
+The undo stack holds at most `depth` changes (HISTORY_UNDO_DEPTH); older
+ones are forgotten. Snapshots that fall off either stack are handed to a
+discard callback, which History uses to close spilled stores' files.
+
+HistoryView is what History.get_history() returns: the store and a length,
+created in O(1). The entries are only copied out of the store when the
+history is about to drop entries the view still shows (undo), or when the
+caller modifies the view. Views of a SharedHistory (app.history.shared)
+take the history's lock for each read, so that no thread drops or spills
+entries while a view reads them.
+"""
+
+from collections import deque
+from collections.abc import MutableSequence
+from typing import Callable, Deque, List, NamedTuple, Optional, Union
+
+from app.history.records import Entry
+
+# Entries rendered per lock acquisition when iterating a locked view.
+LOCKED_ITERATION_CHUNK = 1024
+
+
+class Snapshot(NamedTuple):
+    """
+    A store that was replaced by clear, load or import.
+    """
+    store: object
+
+
+# An undo step is a number of additions or a Snapshot; a redo step is an
+# undone entry or a Snapshot.
+UndoStep = Union[int, Snapshot]
+RedoStep = Union[Entry, Snapshot]
+
+
+class UndoLog:
+    """
+    Undo and redo stacks of a History.
+
+    :param depth: Most changes that can be undone; 0 keeps every change.
+    :param discard: Called with each replaced store that can no longer be undone or redone.
+    """
+    __slots__ = ("depth", "_undo", "_redo", "_count", "_discard")
+
+    def __init__(self, depth: int = 0, discard: Optional[Callable[[object], None]] = None):
+        self.depth = depth
+        self._undo: Deque[UndoStep] = deque()
+        self._redo: List[RedoStep] = []
+        self._count = 0
+        self._discard = discard
+
+    def added(self, redoing: bool = False) -> None:
+        """
+        Records that one entry was appended. New additions discard the redo stack.
+        """
+        if self._undo and not isinstance(self._undo[-1], Snapshot):
+            self._undo[-1] += 1
+        else:
+            self._undo.append(1)
+        self._count += 1
+        self._trim()
+        if not redoing and self._redo:
+            self._clear_redo()
+
+    def replaced(self, store, redoing: bool = False) -> None:
+        """
+        Records that store was replaced as a whole.
+        """
+        self._undo.append(Snapshot(store))
+        self._count += 1
+        self._trim()
+        if not redoing and self._redo:
+            self._clear_redo()
+
+    def _trim(self) -> None:
+        """
+        Forgets the oldest changes beyond depth.
+        """
+        while self.depth and self._count > self.depth:
+            oldest = self._undo[0]
+            if isinstance(oldest, Snapshot):
+                self._undo.popleft()
+                self._dropped(oldest)
+            elif oldest == 1:
+                self._undo.popleft()
+            else:
+                self._undo[0] = oldest - 1
+            self._count -= 1
+
+    def _clear_redo(self) -> None:
+        for step in self._redo:
+            if isinstance(step, Snapshot):
+                self._dropped(step)
+        self._redo.clear()
+
+    def _dropped(self, snapshot: Snapshot) -> None:
+        if self._discard is not None:
+            self._discard(snapshot.store)
+
+    def pop_undo(self) -> Optional[UndoStep]:
+        """
+        Takes the most recent change off the undo stack: 1 for an addition or
+        the Snapshot of a replaced store. None when there is nothing to undo.
+        """
+        if not self._undo:
+            return None
+        self._count -= 1
+        step = self._undo[-1]
+        if isinstance(step, Snapshot) or step == 1:
+            return self._undo.pop()
+        self._undo[-1] = step - 1
+        return 1
+
+    def push_redo(self, step: RedoStep) -> None:
+        self._redo.append(step)
+
+    def pop_redo(self) -> Optional[RedoStep]:
+        return self._redo.pop() if self._redo else None
+
+    def __len__(self):
+        """Number of changes that can be undone."""
+        return self._count
+
+
+class HistoryView(MutableSequence):
+    """
+    Read-only-until-written view of the first `length` entries of a store.
+
+    Reads go to the store and render entries on demand. The first write, or
+    a call to detach(), copies the entries into a private list, after which
+    the view no longer depends on the store.
+
+    :param lock: Lock held by whoever modifies the store, taken around every read.
+    """
+    __slots__ = ("_store", "_length", "_items", "_lock", "__weakref__")
+
+    def __init__(self, store, length: int, lock=None):
+        self._store = store
+        self._length = length
+        self._items: Optional[List[str]] = None
+        self._lock = lock
+
+    def detach(self) -> None:
+        """
+        Copies the viewed entries out of the store.
+        """
+        if self._items is None:
+            self._items = [str(entry) for entry in self._store.entries(0, self._length)]
+            self._store = None
+
+    def detach_from(self, store, length: int) -> None:
+        """
+        Detaches the view if it shows entries of store at or beyond length,
+        which the history is about to drop.
+        """
+        if self._store is store and self._length > length:
+            self.detach()
+
+    def __len__(self):
+        return self._length if self._items is None else len(self._items)
+
+    def __getitem__(self, index):
+        if self._lock is not None:
+            with self._lock:
+                return self._get(index)
+        return self._get(index)
+
+    def _get(self, index):
+        if self._items is not None:
+            return self._items[index]
+        if isinstance(index, slice):
+            return [str(self._store.entry(i)) for i in range(*index.indices(self._length))]
+        if not -self._length <= index < self._length:
+            raise IndexError("history index out of range")
+        return str(self._store.entry(index + self._length if index < 0 else index))
+
+    def __iter__(self):
+        if self._lock is not None:
+            # Renders a chunk at a time under the lock, so writers are never blocked for long.
+            start = 0
+            while True:
+                chunk = self[start:start + LOCKED_ITERATION_CHUNK]
+                if not chunk:
+                    return
+                yield from chunk
+                start += len(chunk)
+        if self._items is not None:
+            yield from self._items
+            return
+        for entry in self._store.entries(0, self._length):
+            yield str(entry)
+
+    def __setitem__(self, index, value):
+        self.detach()
+        self._items[index] = value
+
+    def __delitem__(self, index):
+        self.detach()
+        del self._items[index]
+
+    def insert(self, index, value):
+        self.detach()
+        self._items.insert(index, value)
+
+    def __eq__(self, other):
+        if isinstance(other, (HistoryView, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        # Shown like the list get_history used to return.
+        return repr(list(self))
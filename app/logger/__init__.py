@@ -0,0 +1,216 @@
+# app/logger/__init__.py
+
+"""
+Non-blocking logging for the calculator.
+
+The root logger gets a QueueHandler, so a logging call in the command loop
+only appends the record to an in-memory queue. A QueueListener thread takes
+records off the queue, formats them and writes them to the log file, flushing
+the file whenever it has caught up with the queue rather than after every
+record. The file is rotated once it reaches LOG_MAX_BYTES, keeping
+LOG_BACKUP_COUNT old files.
+
+For long batch runs, a LogSampler on the queue handler can thin out records
+before they are queued (so dropped records cost no formatting or I/O):
+
+    LOG_SAMPLE_RATE=N       keep 1 in N INFO and DEBUG records of each type
+    LOG_RATE_LIMIT=R        keep at most R records of each type per second
+    LOG_SUMMARY_INTERVAL=S  every S seconds, log how many records of each
+                            type there were, e.g. "10000 add ops, 3
+                            division_by_zero errors", and how many were dropped
+
+A record's type is its "aggregate" attribute (set with extra=), the
+operation for calculation records, or else its message format string.
+Without these settings no filter is installed.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+from app.config import get_config
+from app.history.records import Record
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The standard handler merges the message and its %-style arguments before
+    enqueueing. Records stay in this process, so the (immutable) arguments can
+    travel with the record and be formatted off the hot path instead.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _BufferedFileHandler(RotatingFileHandler):
+    """
+    File handler whose writes go through the file buffer; the listener flushes
+    it once the queue is drained instead of once per record. With maxBytes
+    set, the file is rotated once it has reached that size.
+    """
+    def shouldRollover(self, record):
+        # The stock check formats every record a second time to measure it;
+        # the position in the file is enough to stay within a record of the limit.
+        return self.maxBytes > 0 and self.stream is not None and self.stream.tell() >= self.maxBytes
+
+    def flush(self):
+        pass
+
+    def flush_buffer(self):
+        super().flush()
+
+    def close(self):
+        self.flush_buffer()
+        super().close()
+
+
+class _BatchingQueueListener(QueueListener):
+    """
+    QueueListener that flushes its handlers only when the queue runs empty.
+    """
+    def dequeue(self, block):
+        if block and self.queue.empty():
+            for handler in self.handlers:
+                handler.flush_buffer()
+        return self.queue.get(block)
+
+
+class LogSampler(logging.Filter):
+    """
+    Drops records by type (1 in every, and at most rate_limit per second) and
+    logs a summary of all records with the first record after each
+    summary_interval seconds, and on flush().
+
+    :param every: Keep 1 in this many records of each type below WARNING.
+    :param rate_limit: Most records of each type kept per second; 0 for no limit.
+    :param summary_interval: Seconds between summaries; 0 for none.
+    """
+    def __init__(self, every: int = 1, rate_limit: float = 0, summary_interval: float = 0):
+        super().__init__()
+        self.every = every
+        self.rate_limit = rate_limit
+        self.summary_interval = summary_interval
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._windows: Dict[str, tuple] = {}
+        self._dropped = 0
+        self._started = time.monotonic()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if "summary" in record.__dict__:
+            return True
+        key = _record_type(record)
+        now = time.monotonic()
+        with self._lock:
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+            keep = self.every <= 1 or record.levelno >= logging.WARNING or count % self.every == 1
+            if keep and self.rate_limit:
+                start, kept = self._windows.get(key, (now, 0))
+                if now - start >= 1.0:
+                    start, kept = now, 0
+                keep = kept < self.rate_limit
+                self._windows[key] = (start, kept + keep)
+            if not keep:
+                self._dropped += 1
+            summary = self._take_summary(now) if self.summary_interval and \
+                now - self._started >= self.summary_interval else None
+        if summary:
+            logging.getLogger(__name__).info("%s", summary, extra={"summary": True})
+        return keep
+
+    def _take_summary(self, now: float) -> Optional[str]:
+        counts, dropped, seconds = self._counts, self._dropped, now - self._started
+        self._counts, self._dropped, self._started = {}, 0, now
+        if not counts:
+            return None
+        types = ", ".join(f"{count} {key}" for key, count in sorted(counts.items(), key=lambda item: -item[1]))
+        return (f"Log summary for the last {seconds:.1f}s: {types} "
+                f"({sum(counts.values())} records, {dropped} not written).")
+
+    def flush(self):
+        """
+        Logs the summary of the current interval now, if there is anything in it.
+        """
+        with self._lock:
+            summary = self._take_summary(time.monotonic())
+        if summary:
+            logging.getLogger(__name__).info("%s", summary, extra={"summary": True})
+
+
+def _record_type(record: logging.LogRecord) -> str:
+    aggregate = record.__dict__.get("aggregate")
+    if aggregate is not None:
+        return aggregate
+    args = record.args
+    if args and isinstance(args, tuple) and isinstance(args[0], Record):
+        return f"{args[0].operation} ops"
+    return f"'{record.msg}'"
+
+
+def configure_logging(log_file: Optional[str] = None, level: int = logging.INFO) -> bool:
+    """
+    Routes the root logger through a queue to a file written by a background
+    thread. Like logging.basicConfig, this does nothing if the root logger
+    already has handlers.
+
+    :param log_file: File to append to. Defaults to LOG_FILE from the configuration.
+    :param level: Level for the root logger.
+    :return: True if logging was configured by this call.
+    """
+    global _listener, _queue_handler  # pylint: disable=global-statement
+    root = logging.getLogger()
+    if root.handlers:
+        return False
+
+    # LOG_FORMAT does not use the caller's file/line, thread or process, so skip
+    # collecting them for every record (see "Optimization" in the logging HOWTO).
+    logging._srcfile = None  # pylint: disable=protected-access
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    config = get_config()
+    file_handler = _BufferedFileHandler(log_file or config.log_file, mode='a', maxBytes=config.log_max_bytes,
+                                        backupCount=config.log_backup_count)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _DeferredQueueHandler(log_queue)
+    if config.log_sample_rate > 1 or config.log_rate_limit > 0 or config.log_summary_interval > 0:
+        _queue_handler.addFilter(LogSampler(config.log_sample_rate, config.log_rate_limit,
+                                            config.log_summary_interval))
+    _listener = _BatchingQueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    atexit.register(shutdown_logging)
+    return True
+
+
+def shutdown_logging():
+    """
+    Writes out every queued record, stops the listener thread and detaches the
+    queue handler. Safe to call more than once.
+    """
+    global _listener, _queue_handler  # pylint: disable=global-statement
+    if _listener is None:
+        return
+    for sampler in _queue_handler.filters:
+        sampler.flush()
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
@@ -0,0 +1,263 @@
+# app/metrics/__init__.py
+
+"""
+Built-in metrics for the calculator.
+
+Counts every command by name and every error by kind, and keeps latency
+histograms for each command and, for calculations, for each stage:
+
+    dispatch  routing the input to an operation
+    parse     converting the operands
+    compute   running the operation (or the result cache)
+    history   appending the result to history
+    log       the logging call
+
+Latencies are integer nanoseconds from time.perf_counter_ns(). A histogram
+bucket is the bit length of the value, i.e. powers of two, so recording an
+observation is two additions and an index, with no search or allocation.
+
+The stats command prints a summary. When METRICS_FILE is set, a background
+thread also writes the metrics in the Prometheus text exposition format to
+that file every METRICS_INTERVAL seconds (atomically, through a temporary
+file and os.replace), for a local scraper such as node_exporter's textfile
+collector.
+"""
+
+import atexit
+import os
+import threading
+from typing import Dict, List, Optional
+
+from app.config import get_config
+
+STAGES = ("dispatch", "parse", "compute", "history", "log")
+
+# Bucket i counts values below 2 ** i ns (and at least 2 ** (i - 1) ns); 64 buckets
+# cover any perf_counter_ns() difference, so observe() needs no bounds check.
+BUCKETS = 64
+# Upper bounds written to the exposition file: powers of 4 from 256 ns to about 1.07 s.
+EXPORTED_BUCKETS = range(8, 32, 2)
+
+_metrics: Optional["Metrics"] = None
+_exporter: Optional["MetricsExporter"] = None
+
+
+class Histogram:
+    """
+    Latency histogram with power-of-two nanosecond buckets.
+    """
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.total = 0
+
+    def observe(self, nanoseconds: int) -> None:
+        self.counts[nanoseconds.bit_length()] += 1
+        self.total += nanoseconds
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def cumulative(self, bucket: int) -> int:
+        """Number of observations below 2 ** bucket ns."""
+        return sum(self.counts[:bucket + 1])
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile, in seconds.
+        """
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return 2 ** bucket / 1e9
+        return 0.0
+
+    @property
+    def mean(self) -> float:
+        """Mean observation in seconds."""
+        count = self.count
+        return self.total / count / 1e9 if count else 0.0
+
+
+class Metrics:
+    """
+    Command counters, error counters and latency histograms.
+    """
+    def __init__(self):
+        self.commands: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.latency: Dict[str, Histogram] = {}
+        self.stages: Dict[str, List[Histogram]] = {}
+
+    def observe_command(self, command: str, nanoseconds: int) -> None:
+        """
+        Counts one command and records how long it took.
+        """
+        histogram = self.latency.get(command)
+        if histogram is None:
+            histogram = self.latency[command] = Histogram()
+            self.commands[command] = 0
+        self.commands[command] += 1
+        histogram.observe(nanoseconds)
+
+    def observe_stages(self, command: str, *nanoseconds: int) -> None:
+        """
+        Records the time a calculation spent in each of STAGES, in that order.
+        """
+        histograms = self.stages.get(command)
+        if histograms is None:
+            histograms = self.stages[command] = [Histogram() for _ in STAGES]
+        for histogram, value in zip(histograms, nanoseconds):
+            histogram.counts[value.bit_length()] += 1
+            histogram.total += value
+
+    def count_error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def reset(self) -> None:
+        self.commands.clear()
+        self.errors.clear()
+        self.latency.clear()
+        self.stages.clear()
+
+    def summary(self) -> str:
+        """
+        Human readable report for the stats command.
+        """
+        lines = [f"Metrics: {sum(self.commands.values())} commands, {sum(self.errors.values())} errors"]
+        for command in sorted(self.commands):
+            histogram = self.latency[command]
+            lines.append(f"  {command}: {self.commands[command]} commands, "
+                         f"p50 {_us(histogram.quantile(0.5))}, p99 {_us(histogram.quantile(0.99))}, "
+                         f"mean {_us(histogram.mean)}")
+            if command in self.stages:
+                stages = ", ".join(f"{stage} {_us(histogram.mean)}"
+                                   for stage, histogram in zip(STAGES, self.stages[command]))
+                lines.append(f"    mean by stage: {stages}")
+        if self.errors:
+            errors = ", ".join(f"{kind} {count}" for kind, count in sorted(self.errors.items()))
+            lines.append(f"  errors: {errors}")
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = ["# HELP calculator_commands_total Commands executed, by command.",
+                 "# TYPE calculator_commands_total counter"]
+        lines += [f'calculator_commands_total{{command="{command}"}} {count}'
+                  for command, count in sorted(self.commands.items())]
+        lines += ["# HELP calculator_errors_total Commands that failed, by kind of error.",
+                  "# TYPE calculator_errors_total counter"]
+        lines += [f'calculator_errors_total{{kind="{kind}"}} {count}' for kind, count in sorted(self.errors.items())]
+        lines += ["# HELP calculator_command_duration_seconds Time to execute a command.",
+                  "# TYPE calculator_command_duration_seconds histogram"]
+        for command, histogram in sorted(self.latency.items()):
+            lines += _histogram_lines("calculator_command_duration_seconds", f'command="{command}"', histogram)
+        lines += ["# HELP calculator_stage_duration_seconds Time a calculation spent in each stage.",
+                  "# TYPE calculator_stage_duration_seconds histogram"]
+        for command, histograms in sorted(self.stages.items()):
+            for stage, histogram in zip(STAGES, histograms):
+                lines += _histogram_lines("calculator_stage_duration_seconds",
+                                          f'command="{command}",stage="{stage}"', histogram)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Writes the Prometheus text to path, replacing it atomically.
+        """
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.prometheus())
+        os.replace(temporary, path)
+
+
+def _us(seconds: float) -> str:
+    return f"{seconds * 1e6:.1f}us"
+
+
+def _histogram_lines(name: str, labels: str, histogram: Histogram) -> List[str]:
+    lines = [f'{name}_bucket{{{labels},le="{2 ** bucket / 1e9:g}"}} {histogram.cumulative(bucket)}'
+             for bucket in EXPORTED_BUCKETS]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.total / 1e9:.9f}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+class MetricsExporter(threading.Thread):
+    """
+    Daemon thread that writes the metrics to a file every interval seconds.
+    """
+    def __init__(self, metrics: Metrics, path: str, interval: float):
+        super().__init__(name="metrics-exporter", daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.metrics.write(self.path)
+
+    def stop(self):
+        """
+        Stops the thread and writes the final values.
+        """
+        self._stopped.set()
+        self.join()
+        self.metrics.write(self.path)
+
+
+def get_metrics() -> Optional[Metrics]:
+    """
+    Returns the process metrics, or None when configure_metrics has not enabled them.
+    """
+    return _metrics
+
+
+def count_error(kind: str) -> None:
+    """
+    Counts an error of the given kind, if metrics are enabled.
+    """
+    if _metrics is not None:
+        _metrics.count_error(kind)
+
+
+def configure_metrics(path: Optional[str] = None, interval: Optional[float] = None) -> bool:
+    """
+    Enables metrics collection and, when a file is configured, starts the
+    exporter thread. Does nothing if metrics are already enabled or
+    METRICS_ENABLED is off.
+
+    :param path: Prometheus text file to write. Defaults to METRICS_FILE; None writes no file.
+    :param interval: Seconds between writes. Defaults to METRICS_INTERVAL.
+    :return: True if metrics were enabled by this call.
+    """
+    global _metrics, _exporter  # pylint: disable=global-statement
+    config = get_config()
+    if _metrics is not None or not config.metrics_enabled:
+        return False
+    _metrics = Metrics()
+    path = path or config.metrics_file
+    if path:
+        _exporter = MetricsExporter(_metrics, path, interval or config.metrics_interval)
+        _exporter.start()
+        atexit.register(shutdown_metrics)
+    return True
+
+
+def shutdown_metrics():
+    """
+    Stops the exporter thread after a final write and disables metrics.
+    Safe to call more than once.
+    """
+    global _metrics, _exporter  # pylint: disable=global-statement
+    if _exporter is not None:
+        _exporter.stop()
+        _exporter = None
+    _metrics = None
@@ -5,6 +5,11 @@ from app.operations.multiplication import multi
 from app.operations.subtraction import sub
 from app.operations.exponent import expo
 from app.operations.modulus import mod
+from app.operations.cache import CacheStats, OperationCache
+from app.operations.registry import (
+    Operation, register, unregister, get_operation, list_operations,
+    operation_names, operation_labels, load_plugins, registry_version,
+)
 
 def addition(a: float, b: float) -> float:
     return add(a,b)  # This is the actual math part: we add the two numbers together and return the result.
@@ -26,8 +31,29 @@ def modulus(a:float, b:float)-> float:
 def division(a: float, b: float) -> float:
     
     return div(a,b)
+
+# Built-in operations. The scalar functions are registered directly (one call layer);
+# the array versions in app.operations.vectorized and the int/Decimal/Fraction versions
+# in app.operations.exact are only imported when used.
+register(Operation("add", add, vectorized="app.operations.vectorized:addition",
+                   exact="app.operations.exact:add"))
+register(Operation("sub", sub, label="subtract", aliases=("subtract",),
+                   vectorized="app.operations.vectorized:subtraction",
+                   exact="app.operations.exact:sub"))
+register(Operation("multi", multi, label="multiply", aliases=("multiply",),
+                   vectorized="app.operations.vectorized:multiplication",
+                   exact="app.operations.exact:multi"))
+register(Operation("div", div, label="divide", aliases=("divide",),
+                   vectorized="app.operations.vectorized:division",
+                   exact="app.operations.exact:div", can_raise=True))
+register(Operation("expo", expo, label="exponent", aliases=("exponent",),
+                   vectorized="app.operations.vectorized:exponent",
+                   exact="app.operations.exact:expo", can_raise=True))
+register(Operation("mod", mod, label="modulus", aliases=("modulus",),
+                   vectorized="app.operations.vectorized:modulus",
+                   exact="app.operations.exact:mod", can_raise=True))
 """
 def exponent(a: float, b: float) -> float:
     return 
 
-    """
\ No newline at end of file
+    """
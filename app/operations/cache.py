@@ -0,0 +1,109 @@
+"""
+Size-bounded LRU cache for operation results.
+
+Results are keyed on (operation name, operands). Floats are normalized so
+that every NaN maps to the same key and 0.0 and -0.0 map to different keys
+(they compare equal but can produce different results, e.g. multi 5 -0.0).
+Calls that raise are never cached.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+_NAN = ("nan",)
+_ZERO = ("zero", 1.0)
+_NEGATIVE_ZERO = ("zero", -1.0)
+
+
+class CacheStats(NamedTuple):
+    """
+    Counters reported by the cache command.
+    """
+    size: int
+    capacity: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self):
+        return (f"Cache: {self.size}/{self.capacity} entries, {self.hits} hits, {self.misses} misses, "
+                f"{self.evictions} evictions, {self.expirations} expirations, "
+                f"hit rate {self.hit_rate:.1%}")
+
+
+def _key_part(value):
+    if type(value) is float:  # pylint: disable=unidiomatic-typecheck
+        if value != value:  # pylint: disable=comparison-with-itself
+            return _NAN
+        if value == 0.0:
+            return _NEGATIVE_ZERO if math.copysign(1.0, value) < 0 else _ZERO
+        return value
+    # Keep ints, Decimals, ... apart from equal floats: their results differ in type.
+    return (type(value), value)
+
+
+class OperationCache:
+    """
+    LRU cache in front of operation dispatch.
+
+    :param capacity: Maximum number of results kept; the least recently used is evicted.
+    :param ttl: Seconds a result stays valid, or None to keep results until evicted.
+    """
+    def __init__(self, capacity: int = 1024, ttl: Optional[float] = None):
+        if capacity < 1:
+            raise ValueError("Cache capacity must be at least 1.")
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def call(self, operation, operands):
+        """
+        Returns operation.apply(operands), from the cache when possible.
+
+        :param operation: Operation from the registry.
+        :param operands: Sequence of operands.
+        """
+        key = (operation.name,) + tuple(map(_key_part, operands))
+        cached = self._entries.get(key)
+        if cached is not None:
+            result, expires = cached
+            if expires is None or expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            del self._entries[key]
+            self.expirations += 1
+        self.misses += 1
+        result = operation.apply(operands)
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (result, expires)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def clear(self):
+        """
+        Drops all cached results and resets the counters.
+        """
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> CacheStats:
+        return CacheStats(len(self._entries), self.capacity, self.hits, self.misses,
+                          self.evictions, self.expirations)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,303 @@
+"""
+Exact versions of the calculator operations.
+
+Operands are ints, Decimals or Fractions (as produced by parse_number when
+EXACT_ARITHMETIC is set). Arithmetic on them is done without rounding:
+
+- ints stay ints, except for division, which gives a Fraction unless it is exact;
+- Decimal operands give Decimal results when the exact result has a finite
+  decimal expansion, and a Fraction otherwise (e.g. 1.0 / 3);
+- a float operand makes the whole calculation a float one, as in Python.
+
+When both operands are floats the plain float implementation is used, so
+the exact path costs nothing for float inputs.
+
+No exact number may have more than EXPONENT_DIGIT_BUDGET digits: parse_number
+rejects longer operands (and exponents such as 1e3000000) before building
+them, and every operation checks its operands and its result with
+check_number(). Exponentiation is the one operation whose cost grows with its
+result: 7 ^ 10000000 has 8.5 million digits. estimate_digits() predicts the
+size of a result from the logarithms of the operands in O(1), and expo()
+rejects any exponentiation whose result would exceed the budget before
+computing it. powmod() evaluates "a ^ b % m" with three-argument pow, whose
+cost only depends on the size of m.
+
+Python refuses to convert ints of more than 4300 digits to and from strings
+by default (sys.get_int_max_str_digits). digit_budget() is clamped to that
+limit, so every number within the budget can be parsed and printed; raise it
+with PYTHONINTMAXSTRDIGITS or -X int_max_str_digits for larger results.
+"""
+
+import functools
+import math
+import sys
+from decimal import Decimal, InvalidOperation
+from fractions import Fraction
+from typing import Optional, Union
+
+from app.config import get_config
+from app.operations.exponent import expo as float_expo
+from app.operations.modulus import mod as float_mod
+from app.operations.registry import Operation
+
+Number = Union[int, float, Decimal, Fraction]
+
+# log10(2), for the number of decimal digits of an int from its bit length.
+_LOG10_2 = math.log10(2)
+
+
+def digit_budget() -> int:
+    """
+    Returns EXPONENT_DIGIT_BUDGET, or Python's limit on int/str conversions
+    if that is lower.
+    """
+    budget = get_config().digit_budget
+    get_limit = getattr(sys, "get_int_max_str_digits", None)
+    limit = get_limit() if get_limit is not None else 0
+    return min(budget, limit) if limit else budget
+
+
+def number_digits(value: Number) -> int:
+    """
+    Approximate number of decimal digits of an exact number (numerator and
+    denominator together), computed without converting it to a string.
+    """
+    if isinstance(value, int):
+        return int(value.bit_length() * _LOG10_2) + 1
+    if isinstance(value, Decimal):
+        if not value.is_finite():
+            return 1
+        _, digits, power = value.as_tuple()
+        return len(digits) + abs(power)
+    if isinstance(value, Fraction):
+        return int((value.numerator.bit_length() + value.denominator.bit_length()) * _LOG10_2) + 2
+    return 1
+
+
+def check_number(value: Number, what: str = "Result", budget: Optional[int] = None) -> Number:
+    """
+    Rejects an exact number of more than budget (EXPONENT_DIGIT_BUDGET) digits.
+
+    :return: value.
+    :raises ValueError: If value is larger than the budget.
+    """
+    if budget is None:
+        budget = digit_budget()
+    digits = number_digits(value)
+    if digits > budget:
+        raise ValueError(f"{what} has about {digits} digits, more than the limit of {budget}.")
+    return value
+
+
+def _within_budget(operation):
+    """
+    Checks the operands of an exact operation before it runs and its result after.
+    """
+    @functools.wraps(operation)
+    def wrapper(*operands):
+        budget = digit_budget()
+        for operand in operands:
+            check_number(operand, "Operand", budget)
+        return check_number(operation(*operands), "Result", budget)
+    return wrapper
+
+
+def parse_number(text: str) -> Number:
+    """
+    Parses an operand exactly: "12" is an int, "1.5" or "2e3" a Decimal and
+    "1/3" a Fraction. inf and nan stay floats.
+
+    :raises ValueError: If text is not a number, or a number of more than
+                        EXPONENT_DIGIT_BUDGET digits.
+    """
+    budget = digit_budget()
+    if len(text) > budget + 2:
+        raise ValueError(f"Operand has {len(text)} characters, more than the limit of {budget} digits.")
+    try:
+        if "/" in text:
+            return _normalize(Fraction(text))
+        if text.lstrip("+-").isdigit():
+            return int(text)
+        value = Decimal(text)
+    except (ValueError, ZeroDivisionError, InvalidOperation):
+        raise ValueError(f"could not convert string to a number: {text!r}") from None
+    if not value.is_finite():
+        return float(value)
+    # Decimal("1e3000000") is cheap, but would become a 3000001-digit int in any operation.
+    return check_number(value, "Operand", budget)
+
+
+def _normalize(value: Fraction, decimal: bool = False) -> Number:
+    """
+    Returns an exact result in the simplest type: an int for whole numbers
+    (a Decimal if the operands were Decimals), a Decimal for terminating
+    fractions of Decimal operands, and the Fraction otherwise.
+    """
+    numerator, denominator = value.numerator, value.denominator
+    if not decimal:
+        return numerator if denominator == 1 else value
+    twos = (denominator & -denominator).bit_length() - 1
+    fives = 0
+    rest = denominator >> twos
+    while rest % 5 == 0:
+        rest //= 5
+        fives += 1
+    if rest != 1:
+        return value
+    places = max(twos, fives)
+    scaled = numerator * (10 ** places // denominator)
+    # Built from a string so that no context precision rounds the digits.
+    return Decimal(f"{scaled}e-{places}")
+
+
+def _exact(a: Number, b: Number):
+    """
+    Converts a pair of exact operands to Fractions.
+
+    :return: (a, b, whether a Decimal was involved), or None if an operand is a
+             float and the calculation has to be done in floats.
+    """
+    if isinstance(a, float) or isinstance(b, float):
+        return None
+    return Fraction(a), Fraction(b), isinstance(a, Decimal) or isinstance(b, Decimal)
+
+
+@_within_budget
+def add(a: Number, b: Number) -> Number:
+    if type(a) is int and type(b) is int:  # pylint: disable=unidiomatic-typecheck
+        return a + b
+    exact = _exact(a, b)
+    if exact is None:
+        return float(a) + float(b)
+    return _normalize(exact[0] + exact[1], exact[2])
+
+
+@_within_budget
+def sub(a: Number, b: Number) -> Number:
+    if type(a) is int and type(b) is int:  # pylint: disable=unidiomatic-typecheck
+        return a - b
+    exact = _exact(a, b)
+    if exact is None:
+        return float(a) - float(b)
+    return _normalize(exact[0] - exact[1], exact[2])
+
+
+@_within_budget
+def multi(a: Number, b: Number) -> Number:
+    if type(a) is int and type(b) is int:  # pylint: disable=unidiomatic-typecheck
+        return a * b
+    exact = _exact(a, b)
+    if exact is None:
+        return float(a) * float(b)
+    return _normalize(exact[0] * exact[1], exact[2])
+
+
+@_within_budget
+def div(a: Number, b: Number) -> Number:
+    if b == 0:
+        raise ValueError("Division by zero is not allowed.")
+    exact = _exact(a, b)
+    if exact is None:
+        return float(a) / float(b)
+    return _normalize(exact[0] / exact[1], exact[2])
+
+
+@_within_budget
+def mod(a: Number, b: Number) -> Number:
+    if type(a) is int and type(b) is int and b != 0:  # pylint: disable=unidiomatic-typecheck
+        return a % b
+    exact = _exact(a, b)
+    if exact is None:
+        return float_mod(float(a), float(b))
+    if b == 0:
+        raise ValueError("Modulus by zero is not allowed.")
+    return _normalize(exact[0] % exact[1], exact[2])
+
+
+def estimate_digits(base: Number, exponent: int) -> int:
+    """
+    Estimates how many decimal digits the exact value of base ** exponent has
+    (numerator and denominator together), from the logarithms of the operands.
+    The product is exact, so it does not overflow however large exponent is.
+    """
+    if base in (0, 1, -1):
+        return 1
+    if isinstance(base, Decimal):
+        # Avoids building the integer ratio of something like 1e999999.
+        _, digits, power = base.as_tuple()
+        magnitude = len(digits) + abs(power)
+        return abs(exponent) * magnitude + 1
+    ratio = Fraction(base)
+    per_power = math.log10(abs(ratio.numerator)) + math.log10(ratio.denominator)
+    return int(abs(exponent) * Fraction(per_power)) + 1
+
+
+def check_digits(base: Number, exponent: int, budget: Optional[int] = None) -> None:
+    """
+    Rejects an exponentiation whose exact result would be larger than the
+    digit budget (EXPONENT_DIGIT_BUDGET by default).
+
+    :raises ValueError: If the estimate exceeds the budget.
+    """
+    if budget is None:
+        budget = digit_budget()
+    # Any other base gains at least log10(2) digits per power; an int compares
+    # with a float exactly, so a runaway exponent is refused without float math.
+    if base not in (0, 1, -1) and abs(exponent) > budget / _LOG10_2:
+        raise ValueError(f"Result would have more than the limit of {budget} digits.")
+    digits = estimate_digits(base, exponent)
+    if digits > budget:
+        raise ValueError(f"Result would have about {digits} digits, more than the limit of {budget}.")
+
+
+def _integral(value: Number) -> Optional[int]:
+    """
+    Returns value as an int if it is a whole number, otherwise None.
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, Decimal):
+        return int(value) if value.is_finite() and value == value.to_integral_value() else None
+    return value.numerator if value.denominator == 1 else None
+
+
+@_within_budget
+def expo(a: Number, b: Number) -> Number:
+    exponent = None
+    if not isinstance(a, float) and not (isinstance(a, Decimal) and not a.is_finite()):
+        exponent = _integral(b) if not isinstance(b, float) else None
+    if exponent is None:
+        # Fractional exponents have no exact result; compute them in floats.
+        return float_expo(float(a), float(b))
+    if a == 0 and exponent < 0:
+        raise ValueError("Zero cannot be raised to a negative power.")
+    check_digits(a, exponent)
+    if type(a) is int and exponent >= 0:  # pylint: disable=unidiomatic-typecheck
+        return a ** exponent
+    return _normalize(Fraction(a) ** exponent, isinstance(a, Decimal) or isinstance(b, Decimal))
+
+
+@_within_budget
+def powmod(a: Number, b: Number, m: Number) -> Number:
+    """
+    Computes (a ^ b) % m. When a, b and m are whole numbers and b is not
+    negative this is pow(a, b, m), which never builds a ^ b; otherwise it is
+    expo followed by mod, with the usual digit budget.
+    """
+    base, exponent, modulus = _integral(a), _integral(b), _integral(m)
+    if base is None or exponent is None or modulus is None or exponent < 0:
+        return mod(expo(a, b), m)
+    if modulus == 0:
+        raise ValueError("Modulus by zero is not allowed.")
+    result = pow(base, exponent, modulus)
+    if any(isinstance(value, float) for value in (a, b, m)):
+        return float(result)
+    if any(isinstance(value, Decimal) for value in (a, b, m)):
+        return Decimal(result)
+    return result
+
+
+# Not registered: expressions use it for "a ^ b % m" (see app.expressions).
+POWMOD = Operation("powmod", powmod, arity=3, label="modular exponent", can_raise=True)
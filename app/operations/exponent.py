@@ -1,2 +1,7 @@
 def expo(a: float, b: float) -> float:
-    return a**b
\ No newline at end of file
+    try:
+        return a**b
+    except OverflowError:
+        raise ValueError("Result is too large to represent.") from None
+    except ZeroDivisionError:
+        raise ValueError("Zero cannot be raised to a negative power.") from None
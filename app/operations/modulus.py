@@ -1,2 +1,4 @@
 def mod(a: float, b: float) -> float:
-    return a%b
\ No newline at end of file
+    if b == 0:
+        raise ValueError("Modulus by zero is not allowed.")
+    return a%b
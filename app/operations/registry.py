@@ -0,0 +1,187 @@
+"""
+Central registry of calculator operations.
+
+Operations are looked up by name or alias with a single dict access.
+Third-party packages can add operations by exposing an Operation object
+under the "calculator.operations" entry point group, e.g. in pyproject.toml:
+
+    [project.entry-points."calculator.operations"]
+    hypot = "my_package.ops:HYPOT"
+"""
+
+import importlib
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+ENTRY_POINT_GROUP = "calculator.operations"
+
+
+class Operation:
+    """
+    An operation the calculator can dispatch to, plus its metadata.
+
+    :param name: Canonical name typed by the user and recorded in history.
+    :param func: Scalar implementation taking `arity` floats.
+    :param arity: Number of operands.
+    :param label: Human readable name used in error messages.
+    :param aliases: Additional names that dispatch to this operation.
+    :param vectorized: Array implementation, either a callable or a "module:function"
+                       string that is imported on first use.
+    :param can_raise: Whether func may raise ValueError for some inputs.
+    :param exact: Implementation for int, Decimal and Fraction operands, either a callable
+                  or a "module:function" string that is imported on first use.
+                  Defaults to func.
+    """
+    __slots__ = ("name", "func", "arity", "label", "aliases", "can_raise", "_vectorized", "_exact")
+
+    def __init__(self, name: str, func: Callable[..., float], arity: int = 2, label: Optional[str] = None,
+                 aliases: Tuple[str, ...] = (), vectorized=None, can_raise: bool = False, exact=None):
+        self.name = name
+        self.func = func
+        self.arity = arity
+        self.label = label or name
+        self.aliases = tuple(aliases)
+        self.can_raise = can_raise
+        self._vectorized = vectorized
+        self._exact = exact
+
+    @property
+    def vectorized(self) -> Optional[Callable]:
+        """
+        The array implementation, importing it on first access.
+        """
+        if isinstance(self._vectorized, str):
+            module_name, _, attribute = self._vectorized.partition(":")
+            self._vectorized = getattr(importlib.import_module(module_name), attribute)
+        return self._vectorized
+
+    @property
+    def exact(self) -> Callable:
+        """
+        The implementation for exact operands, importing it on first access.
+        """
+        if isinstance(self._exact, str):
+            module_name, _, attribute = self._exact.partition(":")
+            self._exact = getattr(importlib.import_module(module_name), attribute)
+        return self._exact or self.func
+
+    def apply(self, operands):
+        """
+        Computes the operation: func when every operand is a float, the exact
+        implementation otherwise (see app.operations.exact).
+        """
+        for operand in operands:
+            if type(operand) is not float:  # pylint: disable=unidiomatic-typecheck
+                return self.exact(*operands)
+        return self.func(*operands)
+
+    def __repr__(self):
+        return f"Operation({self.name!r}, arity={self.arity})"
+
+
+_registry: Dict[str, Operation] = {}
+_operations: List[Operation] = []
+_plugins_loaded = False
+# Incremented on every change so that callers caching lookups can tell when to refresh.
+_version = 0
+
+
+def register(operation: Operation, replace: bool = False) -> Operation:
+    """
+    Adds an operation to the registry under its name and aliases.
+
+    :param operation: The operation to register.
+    :param replace: Allow replacing an operation registered under the same name.
+    :return: The registered operation.
+    :raises ValueError: If a name or alias is already taken and replace is False.
+    """
+    global _version  # pylint: disable=global-statement
+    keys = (operation.name,) + operation.aliases
+    taken = [key for key in keys if key in _registry]
+    if taken and not replace:
+        raise ValueError(f"Operation name already registered: {', '.join(taken)}")
+    for key in taken:
+        unregister(key)
+    for key in keys:
+        _registry[key] = operation
+    _operations.append(operation)
+    _version += 1
+    return operation
+
+
+def unregister(name: str):
+    """
+    Removes an operation and all of its aliases from the registry.
+    """
+    global _version  # pylint: disable=global-statement
+    operation = _registry.get(name)
+    if operation is None:
+        return
+    for key in (operation.name,) + operation.aliases:
+        if _registry.get(key) is operation:
+            del _registry[key]
+    _operations.remove(operation)
+    _version += 1
+
+
+def registry_version() -> int:
+    """
+    Returns a number that changes whenever an operation is registered or removed.
+    """
+    return _version
+
+
+def get_operation(name: str) -> Optional[Operation]:
+    """
+    Returns the operation registered under a name or alias, or None.
+    """
+    return _registry.get(name)
+
+
+def list_operations() -> List[Operation]:
+    """
+    Returns the registered operations in registration order.
+    """
+    return list(_operations)
+
+
+def operation_names() -> List[str]:
+    """
+    Returns the canonical operation names, e.g. for help output.
+    """
+    return [operation.name for operation in _operations]
+
+
+def operation_labels() -> List[str]:
+    """
+    Returns the human readable operation names, e.g. for error messages.
+    """
+    return [operation.label for operation in _operations]
+
+
+def load_plugins(force: bool = False) -> int:
+    """
+    Registers operations advertised through the calculator.operations entry point group.
+    Broken plugins are logged and skipped.
+
+    :param force: Scan the entry points again even if they were already loaded.
+    :return: Number of operations registered.
+    """
+    global _plugins_loaded  # pylint: disable=global-statement
+    if _plugins_loaded and not force:
+        return 0
+    # importlib.metadata is slow to import; only pay for it when scanning for plugins.
+    from importlib.metadata import entry_points  # pylint: disable=import-outside-toplevel
+
+    _plugins_loaded = True
+    loaded = 0
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            operation = entry_point.load()
+            if not isinstance(operation, Operation):
+                raise TypeError(f"{entry_point.value} is not an Operation")
+            register(operation)
+            loaded += 1
+        except Exception as error:  # pylint: disable=broad-except
+            logging.error("Failed to load operation plugin %s: %s", entry_point.name, error)
+    return loaded
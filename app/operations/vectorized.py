@@ -0,0 +1,82 @@
+"""
+Array versions of the calculator operations.
+
+Each function takes two array-likes (NumPy arrays, array.array, memoryview,
+lists or scalars that broadcast) and evaluates the whole batch in one NumPy
+call. Instead of raising, rows that would fail in the scalar API (division
+by zero, overflow, results that are not real numbers) come back as NaN and
+are flagged in the error mask.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+
+class VectorResult(NamedTuple):
+    """
+    Result of a vectorized operation.
+
+    values: float64 array of results, NaN where the row failed.
+    errors: boolean array, True where the row failed.
+    """
+    values: np.ndarray
+    errors: np.ndarray
+
+
+def _operands(a, b):
+    return np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+
+
+def _finish(values: np.ndarray, errors: np.ndarray) -> VectorResult:
+    values[errors] = np.nan
+    return VectorResult(values, errors)
+
+
+def _overflowed(values: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # A non-finite result is only an error when both inputs were finite.
+    return ~np.isfinite(values) & np.isfinite(a) & np.isfinite(b)
+
+
+def addition(a, b) -> VectorResult:
+    a, b = _operands(a, b)
+    with np.errstate(all="ignore"):
+        values = np.add(a, b)
+    return _finish(values, _overflowed(values, a, b))
+
+
+def subtraction(a, b) -> VectorResult:
+    a, b = _operands(a, b)
+    with np.errstate(all="ignore"):
+        values = np.subtract(a, b)
+    return _finish(values, _overflowed(values, a, b))
+
+
+def multiplication(a, b) -> VectorResult:
+    a, b = _operands(a, b)
+    with np.errstate(all="ignore"):
+        values = np.multiply(a, b)
+    return _finish(values, _overflowed(values, a, b))
+
+
+def division(a, b) -> VectorResult:
+    a, b = _operands(a, b)
+    with np.errstate(all="ignore"):
+        values = np.true_divide(a, b)
+    return _finish(values, (b == 0) | _overflowed(values, a, b))
+
+
+def exponent(a, b) -> VectorResult:
+    a, b = _operands(a, b)
+    with np.errstate(all="ignore"):
+        values = np.power(a, b)
+    # Zero to a negative power and negative bases with fractional exponents also land here.
+    return _finish(values, _overflowed(values, a, b))
+
+
+def modulus(a, b) -> VectorResult:
+    a, b = _operands(a, b)
+    with np.errstate(all="ignore"):
+        # np.mod follows Python's sign rules for %, unlike np.fmod.
+        values = np.mod(a, b)
+    return _finish(values, (b == 0) | _overflowed(values, a, b))
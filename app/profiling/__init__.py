@@ -0,0 +1,273 @@
+# app/profiling/__init__.py
+
+"""
+Opt-in profiling for the calculator.
+
+Two profilers are available:
+
+    cprofile  deterministic profile of every call (cProfile); writes
+              <prefix>.pstats and <prefix>.collapsed
+    sample    a daemon thread records the stack of the profiled thread every
+              PROFILE_INTERVAL seconds; much lower overhead, writes
+              <prefix>.collapsed
+
+.collapsed files hold one "outer;inner;leaf weight" line per stack, the
+input format of flamegraph.pl and speedscope. For cProfile the stacks are
+rebuilt from the caller/callee graph, attributing each function's own time
+to its callers in proportion to the time they spent calling it; weights are
+microseconds. For sampling they are exact and weights are sample counts.
+
+A whole run is profiled with PROFILE=cprofile|sample or main's --profile
+flag, and a window of a long session with the "profile start" and "profile
+stop" commands. Nothing is installed unless one of those is used, and
+cProfile and pstats are only imported then, so there is no overhead when
+profiling is off.
+"""
+
+import os
+import sys
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import List, Optional
+
+from app.config import get_config
+
+MODES = ("cprofile", "sample")
+# Frames kept in a stack rebuilt from cProfile data, and the lightest stack kept, in microseconds.
+MAX_STACK_DEPTH = 64
+MIN_STACK_WEIGHT = 0.5
+
+_active: Optional["Profiler"] = None
+_windows = 0
+
+
+class ProfilingError(RuntimeError):
+    """
+    Raised when a profile is started twice or stopped when none is running.
+    """
+
+
+class Profiler:
+    """
+    Common interface of the profilers.
+    """
+    mode = ""
+
+    def start(self) -> None:
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        raise NotImplementedError
+
+    def write(self, prefix: str) -> List[str]:
+        """
+        Writes the output files for prefix and returns their paths.
+        """
+        raise NotImplementedError
+
+
+class CProfiler(Profiler):
+    """
+    Deterministic profiler backed by cProfile.
+    """
+    mode = "cprofile"
+
+    def __init__(self):
+        import cProfile  # pylint: disable=import-outside-toplevel
+
+        self._profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+
+    def write(self, prefix: str) -> List[str]:
+        import pstats  # pylint: disable=import-outside-toplevel
+
+        stats_path, collapsed_path = f"{prefix}.pstats", f"{prefix}.collapsed"
+        self._profile.dump_stats(stats_path)
+        stats = pstats.Stats(self._profile).stats  # pylint: disable=no-member
+        _write_collapsed(collapsed_path, collapsed_from_stats(stats))
+        return [stats_path, collapsed_path]
+
+
+class SamplingProfiler(Profiler):
+    """
+    Statistical profiler: a daemon thread samples the stack of one thread.
+
+    :param interval: Seconds between samples.
+    :param thread_id: Thread to sample. Defaults to the thread calling start().
+    """
+    mode = "sample"
+
+    def __init__(self, interval: float, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def write(self, prefix: str) -> List[str]:
+        path = f"{prefix}.collapsed"
+        _write_collapsed(path, self.samples.items())
+        return [path]
+
+
+def _label(function) -> str:
+    filename, _, name = function
+    return f"{os.path.basename(filename)}:{name}" if filename != "~" else name
+
+
+def collapsed_from_stats(stats: dict, max_depth: int = MAX_STACK_DEPTH):
+    """
+    Rebuilds folded stacks from pstats data ({function: (cc, nc, tt, ct, callers)}).
+
+    The stacks below each function are built once, from the time spent on each
+    caller -> callee edge, and reused wherever the function is called from, so
+    the work grows with the size of the output rather than with the number of
+    paths through the call graph. Recursive calls (edges back to a function
+    whose stacks are being built) are dropped, stacks are cut at max_depth
+    frames, and stacks lighter than half a microsecond are left out.
+
+    :return: (stack, microseconds) pairs.
+    """
+    callees = defaultdict(list)
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller].append((function, edge[3]))
+    # function -> {stack below and including it: microseconds if it is entered with a share of 1}
+    below = {}
+    building = set()
+
+    def build(function):
+        building.add(function)
+        label = _label(function)
+        stacks = Counter({label: stats[function][2] * 1e6})
+        for callee, time_via_edge in callees[function]:
+            callee_total = stats[callee][3]
+            if callee_total <= 0 or callee in building:
+                continue
+            if callee not in below:
+                build(callee)
+            share = min(time_via_edge / callee_total, 1.0)
+            for stack, weight in below[callee].items():
+                weight *= share
+                if weight >= MIN_STACK_WEIGHT and stack.count(";") < max_depth - 1:
+                    stacks[f"{label};{stack}"] += weight
+        building.discard(function)
+        below[function] = stacks
+
+    folded = Counter()
+    for function, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            if function not in below:
+                build(function)
+            folded.update(below[function])
+    return [(stack, round(weight)) for stack, weight in folded.items() if round(weight) > 0]
+
+
+def _write_collapsed(path: str, stacks) -> None:
+    with open(path, "w", encoding="utf-8") as output:
+        for stack, weight in sorted(stacks):
+            output.write(f"{stack} {weight}\n")
+
+
+def make_profiler(mode: str) -> Profiler:
+    """
+    Creates a profiler for mode ("cprofile" or "sample").
+
+    :raises ValueError: For an unknown mode.
+    """
+    if mode == "cprofile":
+        return CProfiler()
+    if mode == "sample":
+        return SamplingProfiler(get_config().profile_interval)
+    raise ValueError(f"Unknown profiler {mode!r}. Choose one of: {', '.join(MODES)}.")
+
+
+def active_profile() -> Optional[Profiler]:
+    """
+    The profiler that is running, or None.
+    """
+    return _active
+
+
+def start_profile(mode: Optional[str] = None) -> Profiler:
+    """
+    Starts profiling the calling thread.
+
+    :param mode: "cprofile" or "sample". Defaults to PROFILE, then to cprofile.
+    :raises ProfilingError: If a profile is already running.
+    :raises ValueError: For an unknown mode.
+    """
+    global _active  # pylint: disable=global-statement
+    if _active is not None:
+        raise ProfilingError(f"A {_active.mode} profile is already running.")
+    profiler = make_profiler(mode or get_config().profile or "cprofile")
+    profiler.start()
+    _active = profiler
+    return profiler
+
+
+def stop_profile(prefix: Optional[str] = None) -> List[str]:
+    """
+    Stops the running profile and writes its output.
+
+    :param prefix: Output path without extension. Defaults to PROFILE_OUTPUT
+                   followed by the number of the window, e.g. calculator-profile-1.
+    :return: Paths of the files written.
+    :raises ProfilingError: If no profile is running.
+    """
+    global _active, _windows  # pylint: disable=global-statement
+    if _active is None:
+        raise ProfilingError("No profile is running.")
+    profiler, _active = _active, None
+    profiler.stop()
+    if prefix is None:
+        _windows += 1
+        prefix = f"{get_config().profile_output}-{_windows}"
+    return profiler.write(prefix)
+
+
+@contextmanager
+def profiled(mode: Optional[str], prefix: Optional[str] = None):
+    """
+    Profiles the body of a with statement when mode is set, writing the
+    output to prefix (default PROFILE_OUTPUT) on exit, even after an error.
+    With mode None the body runs untouched.
+    """
+    if not mode:
+        yield None
+        return
+    profiler = start_profile(mode)
+    try:
+        yield profiler
+    finally:
+        if _active is profiler:
+            paths = stop_profile(prefix or get_config().profile_output)
+            print(f"Profile written to {', '.join(paths)}.", file=sys.stderr)
@@ -0,0 +1,264 @@
+# app/server/__init__.py
+
+"""
+asyncio server mode: many concurrent calculator sessions over TCP or a Unix socket.
+
+The protocol is JSON lines. Each request is an object with a "command" (any
+line the interactive calculator accepts) and an optional "id" that is echoed
+back; a bare JSON string is accepted as the command too:
+
+    {"id": 1, "command": "add 2 3"}
+    -> {"id": 1, "ok": true, "output": "Result: 5.0", "result": 5.0}
+
+Every connection has its own History, saved by save/load/compact to a file
+of its own, "session-<pid>-<n><ext>" in the server's history directory, so
+sessions never write to each other's log. Plain "<op> <num1> <num2>" requests
+from all connections are micro-batched: they are queued, and once per event
+loop iteration the queued calculations are grouped by operation and computed
+together (through the vectorized implementation for large groups). Other
+commands run through execute_command() exactly as in the interactive loop.
+
+Each connection handles one request at a time and waits for its response to
+be written (StreamWriter.drain) before reading the next line, so a client
+that sends faster than it reads results is throttled by TCP flow control.
+
+JSON has no NaN or infinity: such results are sent as the strings "nan",
+"inf" and "-inf".
+"""
+
+import asyncio
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import redirect_stdout
+from typing import List, Optional, Tuple
+
+from app.calculator import HISTORY_FILE, execute_command, log_error, parse_operation, record_calculation
+from app.history import History
+from app.metrics import get_metrics
+from app.operations import Operation, OperationCache
+
+# Groups at least this large are computed with the operation's vectorized implementation.
+VECTORIZE_THRESHOLD = 64
+# Upper bound on calculations evaluated in one batch.
+MAX_BATCH_SIZE = 4096
+# Longest request line accepted, in bytes.
+MAX_LINE_LENGTH = 64 * 1024
+# Directory holding the saved history of each session.
+SERVER_HISTORY_DIR = "server-history"
+
+
+class MicroBatcher:
+    """
+    Collects calculations from concurrent sessions and evaluates them in batches.
+    """
+    def __init__(self, max_batch_size: int = MAX_BATCH_SIZE, vectorize_threshold: int = VECTORIZE_THRESHOLD):
+        self.max_batch_size = max_batch_size
+        self.vectorize_threshold = vectorize_threshold
+        self._pending: List[Tuple[Operation, List[float], asyncio.Future]] = []
+        self._scheduled = False
+        self.batches = 0
+        self.calculations = 0
+
+    def submit(self, operation: Operation, numbers: List[float]) -> asyncio.Future:
+        """
+        Queues a calculation. The future resolves to the result, or raises the
+        error the scalar operation raised (e.g. ValueError for division by zero).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((operation, numbers, future))
+        if len(self._pending) >= self.max_batch_size:
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self.flush)
+        return future
+
+    def flush(self):
+        """
+        Evaluates everything queued so far.
+        """
+        self._scheduled = False
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        self.batches += 1
+        self.calculations += len(pending)
+        groups = defaultdict(list)
+        for item in pending:
+            groups[item[0]].append(item)
+        for operation, items in groups.items():
+            # Exact (int, Decimal, Fraction) operands are never vectorized: NumPy would round them to floats.
+            if (len(items) >= self.vectorize_threshold and operation.arity == 2 and operation.vectorized
+                    and type(items[0][1][0]) is float):  # pylint: disable=unidiomatic-typecheck
+                self._evaluate_vectorized(operation, items)
+            else:
+                self._evaluate_scalar(operation, items)
+
+    @staticmethod
+    def _evaluate_scalar(operation, items):
+        for _, numbers, future in items:
+            if future.cancelled():
+                continue
+            try:
+                future.set_result(operation.apply(numbers))
+            except Exception as error:  # pylint: disable=broad-except
+                # Delivered to the one request that caused it; the rest of the batch carries on.
+                future.set_exception(error)
+
+    def _evaluate_vectorized(self, operation, items):
+        values, errors = operation.vectorized([item[1][0] for item in items], [item[1][1] for item in items])
+        failed = []
+        for (_, numbers, future), value, error in zip(items, values.tolist(), errors.tolist()):
+            if error:
+                # Let the scalar function produce the exact result or error message.
+                failed.append((operation, numbers, future))
+            elif not future.cancelled():
+                future.set_result(value)
+        self._evaluate_scalar(operation, failed)
+
+
+class CalculatorServer:
+    """
+    Serves calculator sessions over JSON lines.
+
+    :param history_file: Name whose extension (and so backend) the per-session
+                         logs used by save, load and compact take.
+    :param cache: Optional result cache for commands that are not batched.
+    :param history_dir: Directory the per-session logs are written to, created
+                        when a session first needs it.
+    """
+    def __init__(self, history_file: str = HISTORY_FILE, cache: Optional[OperationCache] = None,
+                 batcher: Optional[MicroBatcher] = None, history_dir: str = SERVER_HISTORY_DIR):
+        self.history_file = history_file
+        self.history_dir = history_dir
+        self.cache = cache
+        self.batcher = batcher or MicroBatcher()
+        self.sessions = 0
+        self._session_ids = itertools.count(1)
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765, unix_path: Optional[str] = None):
+        """
+        Starts listening. Use port 0 to pick a free port (see address).
+        """
+        if unix_path:
+            self._server = await asyncio.start_unix_server(self.handle, unix_path, limit=MAX_LINE_LENGTH)
+        else:
+            self._server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE_LENGTH,
+                                                      backlog=4096)
+        logging.info("Calculator server listening on %s.", self.address)
+        return self
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname() if self._server else None
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Runs one session: reads requests line by line until exit or EOF.
+        """
+        history = History()
+        history_file = self.session_file(next(self._session_ids))
+        self.sessions += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self._send(writer, {"ok": False, "error": "Request line too long."})
+                    break
+                if not line:
+                    break
+                response, keep_going = await self.process(line, history, history_file)
+                await self._send(writer, response)
+                if not keep_going:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    def session_file(self, session_id: int) -> str:
+        """
+        Path of the log the save, load and compact commands of a session use.
+        """
+        extension = os.path.splitext(self.history_file)[1]
+        return os.path.join(self.history_dir, f"session-{os.getpid()}-{session_id}{extension}")
+
+    async def process(self, line: bytes, history: History, history_file: Optional[str] = None):
+        """
+        Executes one JSON request against a session's history.
+
+        :param history_file: The session's log (see session_file). Defaults to a new session's.
+
+        :return: The response object and False if the session should end.
+        """
+        try:
+            request = json.loads(line)
+            if isinstance(request, str):
+                request = {"command": request}
+            command = request["command"].strip()
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return {"ok": False, "error": "Invalid request. Send {\"command\": \"...\"} as one JSON line."}, True
+        response = {"id": request["id"]} if "id" in request else {}
+
+        parsed = parse_operation(command)
+        if parsed is not None:
+            operation, numbers = parsed
+            started = time.perf_counter_ns()
+            try:
+                result = await self.batcher.submit(operation, numbers)
+            except (ValueError, ArithmeticError) as error:
+                log_error(error)
+                response.update(ok=False, output=str(error), error=str(error))
+                return response, True
+            record_calculation(history, operation.name, numbers, result)
+            metrics = get_metrics()
+            if metrics is not None:
+                # Includes the time spent waiting for the micro-batch.
+                metrics.observe_command(operation.name, time.perf_counter_ns() - started)
+            response.update(ok=True, output=f"Result: {result}",
+                            result=result if isinstance(result, float) and math.isfinite(result) else str(result))
+            return response, True
+
+        if history_file is None:
+            history_file = self.session_file(next(self._session_ids))
+        os.makedirs(self.history_dir, exist_ok=True)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            keep_going = execute_command(command, history, history_file, self.cache)
+        response.update(ok=True, output=output.getvalue().rstrip("\n"))
+        return response, keep_going
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, response: dict):
+        writer.write(json.dumps(response, allow_nan=False).encode("utf-8") + b"\n")
+        # Waits while the client is not reading: this is what applies backpressure.
+        await writer.drain()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8765, unix_path: Optional[str] = None,
+                cache: Optional[OperationCache] = None):
+    """
+    Runs a calculator server until cancelled.
+    """
+    server = await CalculatorServer(cache=cache).start(host, port, unix_path)
+    where = unix_path or f"{server.address[0]}:{server.address[1]}"
+    print(f"Calculator server listening on {where}")
+    await server.serve_forever()
@@ -0,0 +1,63 @@
+"""benchmarks/bench_dispatch.py
+
+Measures the cost of picking an operation for a command: the old if/elif
+chain against the registry lookup, and a full execute_command() call.
+
+Run with: python -m benchmarks.bench_dispatch [--number N]
+"""
+
+import argparse
+import io
+import timeit
+from contextlib import redirect_stdout
+
+from app.calculator import execute_command
+from app.history import History
+from app.operations import addition, subtraction, multiplication, division, exponent, modulus
+from app.operations import get_operation
+
+NAMES = ["add", "sub", "multi", "div", "expo", "mod", "nope"]
+
+
+def if_chain(operation):
+    """The dispatch calculator() used before the registry existed."""
+    if operation == "add":
+        return addition
+    elif operation == "sub":
+        return subtraction
+    elif operation == "multi":
+        return multiplication
+    elif operation == "div":
+        return division
+    elif operation == "expo":
+        return exponent
+    elif operation == "mod":
+        return modulus
+    return None
+
+
+def per_call_ns(stmt, number):
+    """Best of three runs, in nanoseconds per call."""
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number * 1e9
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--number", type=int, default=200_000, help="calls per measurement")
+    args = parser.parse_args(argv)
+
+    print(f"{'operation':<10}{'if/elif ns':>12}{'registry ns':>13}")
+    for name in NAMES:
+        chain = per_call_ns(lambda name=name: if_chain(name), args.number)
+        lookup = per_call_ns(lambda name=name: get_operation(name), args.number)
+        print(f"{name:<10}{chain:>12.1f}{lookup:>13.1f}")
+
+    history = History()
+    sink = io.StringIO()
+    with redirect_stdout(sink):
+        full = per_call_ns(lambda: execute_command("mod 7 3", history), args.number // 10)
+    print(f"\nexecute_command('mod 7 3'): {full:.0f} ns/command")
+
+
+if __name__ == "__main__":
+    main()
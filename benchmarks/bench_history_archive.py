@@ -0,0 +1,72 @@
+"""benchmarks/bench_history_archive.py
+
+Compares segmented, compressed history archives (gzip and lzma) with the
+plain CSV export at N entries: size on disk and compression ratio against
+the uncompressed binary frames, save throughput, and load throughput with
+one decompression thread and with --threads.
+
+Run with: python -m benchmarks.bench_history_archive [--size N] [--segment-size K] [--threads T]
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from app.history import History, archive
+from benchmarks.bench_history_backends import filled_history
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        func(*args)
+    return time.perf_counter() - start
+
+
+def _disk_size(path):
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path))
+    return os.path.getsize(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--segment-size", type=int, default=archive.DEFAULT_SEGMENT_SIZE)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    history = filled_history(args.size)
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "history.csv")
+        csv_save = _timed(history.save, csv_path)
+        csv_load = _timed(History(capacity=0).load, csv_path)
+        csv_size = _disk_size(csv_path)
+
+        rows = []
+        raw = None
+        for codec in archive.CODECS:
+            path = os.path.join(directory, f"history-{codec}.archive")
+            log = archive.ArchiveLog(path, 0, codec, args.segment_size, args.threads)
+            save = _timed(log.rewrite, history.history.entries())
+            raw = sum(segment["raw_bytes"] for segment in log.manifest()["segments"])
+            single = archive.ArchiveLog(path, 0, codec, args.segment_size, 1)
+            load_one = _timed(single.read)
+            load_many = _timed(log.read)
+            rows.append((f"{codec} archive", _disk_size(path), save, load_one, load_many))
+
+    size_mb = args.size / 1e6
+    print(f"{args.size} entries, {raw / 2**20:.1f} MB of binary frames, segments of {args.segment_size}")
+    print(f"{'format':<16}{'MB':>8}{'ratio':>8}{'save Me/s':>11}{'load Me/s':>11}{f'x{args.threads} Me/s':>11}")
+    print(f"{'CSV':<16}{csv_size / 2**20:>8.1f}{raw / csv_size:>8.2f}{size_mb / csv_save:>11.2f}"
+          f"{size_mb / csv_load:>11.2f}{'':>11}")
+    for name, size, save, load_one, load_many in rows:
+        print(f"{name:<16}{size / 2**20:>8.1f}{raw / size:>8.2f}{size_mb / save:>11.2f}"
+              f"{size_mb / load_one:>11.2f}{size_mb / load_many:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""benchmarks/bench_history_backends.py
+
+Compares the history storage backends (CSV export, binary log, SQLite) at N
+entries: a full save, an incremental save of K new entries after an undo,
+a load, and the size on disk.
+
+Run with: python -m benchmarks.bench_history_backends [--size N] [--increment K]
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from app.history import History
+from benchmarks.bench_history_memory import calculations
+
+FORMATS = (("csv", "CSV"), ("bin", "binary log"), ("db", "SQLite"))
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        func(*args)
+    return time.perf_counter() - start
+
+
+def filled_history(size):
+    history = History(capacity=0)
+    for op, operands, result in calculations(size):
+        history.add_record(op, operands, result)
+    return history
+
+
+def _disk_size(path):
+    return sum(os.path.getsize(name) for name in (path, f"{path}-wal", f"{path}.idx") if os.path.exists(name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--increment", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    print(f"{args.size} entries, incremental save of {args.increment} after an undo")
+    print(f"{'backend':<12}{'save s':>10}{'incr. ms':>10}{'load s':>10}{'MB':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for extension, name in FORMATS:
+            path = os.path.join(directory, f"history.{extension}")
+            history = filled_history(args.size)
+            save = _timed(history.save, path)
+            history.undo_last()
+            for op, operands, result in calculations(args.increment):
+                history.add_record(op, operands, result)
+            increment = _timed(history.save, path)
+            load = _timed(History(capacity=0).load, path)
+            print(f"{name:<12}{save:>10.2f}{increment * 1e3:>10.1f}{load:>10.2f}{_disk_size(path) / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""benchmarks/bench_history_memory.py
+
+Measures the memory held by a history of N calculations: the old list of
+formatted strings against the array-backed RecordStore used by History.
+
+Run with: python -m benchmarks.bench_history_memory [--size N]
+"""
+
+import argparse
+import random
+import tracemalloc
+
+from app.history import History
+
+
+def calculations(size):
+    """Yield (operation, operands, result) tuples like the calculator produces."""
+    rng = random.Random(0)
+    operations = ["add", "sub", "multi", "div", "expo", "mod"]
+    for _ in range(size):
+        a = round(rng.uniform(-1000, 1000), rng.randint(0, 6))
+        b = round(rng.uniform(1, 100), rng.randint(0, 6))
+        yield rng.choice(operations), (a, b), a / b
+
+
+def measure(build):
+    """Return the bytes still allocated by the object build() returns."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def string_list(size):
+    return [f"{op} {a} {b} = {result}" for op, (a, b), result in calculations(size)]
+
+
+def record_history(size):
+    history = History()
+    for op, operands, result in calculations(size):
+        history.add_record(op, operands, result)
+    return history
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    strings = measure(lambda: string_list(args.size))
+    records = measure(lambda: record_history(args.size))
+    scale = 1_000_000 / args.size
+    print(f"{'storage':<22}{'bytes/entry':>12}{'MB per 1M entries':>20}")
+    print(f"{'list of strings':<22}{strings / args.size:>12.1f}{strings * scale / 2**20:>20.1f}")
+    print(f"{'RecordStore columns':<22}{records / args.size:>12.1f}{records * scale / 2**20:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""benchmarks/bench_history_query.py
+
+Compares history queries answered from the secondary indexes with a full
+scan of every entry, at up to 10^7 entries.
+
+Run with: python -m benchmarks.bench_history_query [--size 10000000]
+"""
+
+import argparse
+import random
+import time
+
+from app.history import History
+from app.history.query import parse_query, scan
+
+QUERIES = ("op=div result>100", "result>=990 result<1000", "op=mod", "op=expo result<0")
+OPERATIONS = ("add", "sub", "multi", "div", "expo", "mod")
+
+
+def filled_history(size, seed=1):
+    rng = random.Random(seed)
+    history = History(capacity=0)
+    for i in range(size):
+        history.add_record(OPERATIONS[i % len(OPERATIONS)], (float(i), 2.0), rng.uniform(-100.0, 1000.0))
+    return history
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--size", type=int, default=10_000_000)
+    args = parser.parse_args(argv)
+
+    history = filled_history(args.size)
+    build, _ = _timed(history.where, "op=add")
+    print(f"{args.size} entries, index build {build:.3f}s")
+    print(f"{'query':<28}{'matches':>10}{'indexed ms':>14}{'scan ms':>12}{'speedup':>10}")
+    for text in QUERIES:
+        indexed, found = _timed(history.where, text)
+        scanned, expected = _timed(scan, history.history.entries(), parse_query(text))
+        assert found == expected, text
+        print(f"{text:<28}{len(found):>10}{indexed * 1e3:>14.2f}{scanned * 1e3:>12.0f}{scanned / indexed:>9.0f}x")
+
+    # Index maintenance: appends and undos after the build.
+    appended, _ = _timed(lambda: [history.add_record("div", (1.0, 1.0), 500.0) for _ in range(100_000)])
+    print(f"\nappend with indexes: {appended / 100_000 * 1e6:.2f} us/entry")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""benchmarks/bench_history_undo.py
+
+Measures what unlimited undo costs in a session of N calculations that is
+cleared every K entries: memory held by the History (whose undo stack keeps
+every cleared store) against the same entries in one RecordStore, and the
+latency of get_history, undoing a clear and redoing it.
+
+Run with: python -m benchmarks.bench_history_undo [--size N] [--clear-every K]
+"""
+
+import argparse
+import time
+
+from app.history import History, RecordStore
+from benchmarks.bench_history_memory import calculations, measure
+
+
+def session(size, clear_every):
+    history = History(capacity=0, undo_depth=0)
+    for count, (op, operands, result) in enumerate(calculations(size), 1):
+        history.add_record(op, operands, result)
+        if count % clear_every == 0:
+            history.clear_history()
+    return history
+
+
+def same_entries(size):
+    store = RecordStore()
+    for op, operands, result in calculations(size):
+        store.add(op, operands, result)
+    return store
+
+
+def _latency(func, repeat=1000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--clear-every", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    with_undo = measure(lambda: session(args.size, args.clear_every))
+    entries_only = measure(lambda: same_entries(args.size))
+    clears = args.size // args.clear_every
+    overhead = with_undo - entries_only
+    print(f"{args.size} entries, cleared {clears} times")
+    print(f"{'storage':<28}{'bytes/entry':>12}{'MB':>10}")
+    print(f"{'History with undo':<28}{with_undo / args.size:>12.1f}{with_undo / 2**20:>10.1f}")
+    print(f"{'entries in one RecordStore':<28}{entries_only / args.size:>12.1f}{entries_only / 2**20:>10.1f}")
+    print(f"undo overhead: {overhead / 2**20:.1f} MB ({overhead / max(clears, 1):.0f} bytes per clear)")
+
+    history = session(args.size, args.size + 1)
+    print(f"get_history on {len(history.history)} entries: {_latency(history.get_history) * 1e6:.2f} us")
+
+    def clear_undo_redo():
+        history.clear_history()
+        history.undo_last()
+        history.redo_last()
+        history.undo_last()
+    print(f"clear + undo + redo + undo: {_latency(clear_undo_redo) * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""benchmarks/bench_logging.py
+
+Batch throughput with logging enabled: a synchronous FileHandler (the old
+logging.basicConfig setup) against the queue pipeline in app.logger.
+
+Run with: python -m benchmarks.bench_logging [--commands N]
+"""
+
+import argparse
+import io
+import logging
+import os
+import tempfile
+import time
+
+from app.calculator import run_batch
+from app.logger import LOG_FORMAT, configure_logging, shutdown_logging
+
+
+def commands(count):
+    operations = ["add", "sub", "multi", "div", "expo", "mod"]
+    return [f"{operations[i % 6]} {i % 97 + 1} {i % 7 + 1}" for i in range(count)]
+
+
+def run_sync(lines, log_file):
+    """Old setup: every record is formatted and written by the calling thread."""
+    handler = logging.FileHandler(log_file, mode='a')
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    try:
+        start = time.perf_counter()
+        run_batch(lines, out=io.StringIO())
+        return time.perf_counter() - start
+    finally:
+        root.removeHandler(handler)
+        handler.close()
+
+
+def run_queued(lines, log_file):
+    """New setup: records are queued and written by the listener thread."""
+    configure_logging(log_file)
+    start = time.perf_counter()
+    try:
+        run_batch(lines, out=io.StringIO())
+        loop = time.perf_counter() - start
+    finally:
+        shutdown_logging()
+    return loop, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--commands", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    lines = commands(args.commands)
+    with tempfile.TemporaryDirectory() as directory:
+        sync = run_sync(lines, os.path.join(directory, "sync.log"))
+        loop, drained = run_queued(lines, os.path.join(directory, "queued.log"))
+
+    print(f"{args.commands:,} calculations with INFO logging to a file")
+    print(f"{'synchronous FileHandler':<36}{args.commands / sync:>12,.0f} commands/s")
+    print(f"{'queue handler (command loop)':<36}{args.commands / loop:>12,.0f} commands/s")
+    print(f"{'queue handler (incl. final drain)':<36}{args.commands / drained:>12,.0f} commands/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""benchmarks/bench_parallel.py
+
+Measures batch throughput with run_batch() and with run_parallel() at an
+increasing number of worker processes.
+
+Run with: python -m benchmarks.bench_parallel [--lines N] [--max-workers N] [--chunk-size N]
+"""
+
+import argparse
+import io
+import os
+
+from app.calculator import run_batch
+from app.calculator.parallel import DEFAULT_CHUNK_SIZE, run_parallel
+from app.history import History
+from app.operations import operation_names
+
+
+def command_lines(count):
+    """A command file of mostly calculations with a few stateful commands."""
+    names = operation_names()
+    lines = []
+    for i in range(count):
+        if i % 10_000 == 9_999:
+            lines.append("undo")
+        elif i % 7 == 0:
+            lines.append(f"({i % 97 + 1} + {i % 13}) * 2 ^ 3 % 11")
+        else:
+            lines.append(f"{names[i % len(names)]} {i % 97 + 1} {i % 7 + 1}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    lines = command_lines(args.lines)
+    print(f"{args.lines} lines, {os.cpu_count()} CPUs")
+    stats = run_batch(lines, out=io.StringIO(), history=History())
+    baseline = stats.lines_per_second
+    print(f"{'sequential':<12}{baseline:>14,.0f} lines/sec")
+    workers = 1
+    while workers <= args.max_workers:
+        stats = run_parallel(lines, workers, args.chunk_size, out=io.StringIO(), history=History())
+        print(f"{workers:>2} workers  {stats.lines_per_second:>14,.0f} lines/sec"
+              f"  ({stats.lines_per_second / baseline:.2f}x)")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""benchmarks/bench_server.py
+
+Load test for the asyncio server: opens many concurrent connections that each
+send calculations one after another, and reports request latency percentiles.
+
+Run with: python -m benchmarks.bench_server [--connections 1000] [--requests 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def client(port, requests, latencies, start_gate):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=2**20)
+    await start_gate.wait()
+    operations = ["add", "sub", "multi", "div", "expo", "mod"]
+    for i in range(requests):
+        line = json.dumps({"id": i, "command": f"{operations[i % 6]} {i + 1} {i % 5 + 1}"})
+        sent = time.perf_counter()
+        writer.write(line.encode() + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - sent)
+        assert response["ok"] and response["id"] == i, response
+    writer.write(b'"exit"\n')
+    await writer.drain()
+    await reader.readline()
+    writer.close()
+
+
+async def load_test(port, connections, requests):
+    latencies = []
+    start_gate = asyncio.Event()
+    tasks = [asyncio.create_task(client(port, requests, latencies, start_gate)) for _ in range(connections)]
+    await asyncio.sleep(0.5)
+    started = time.perf_counter()
+    start_gate.set()
+    await asyncio.gather(*tasks)
+    return sorted(latencies), time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20, help="requests per connection")
+    args = parser.parse_args(argv)
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "main.py", "--serve", f"127.0.0.1:{port}"],
+                              cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    try:
+        server.stdout.readline()  # "Calculator server listening on ..."
+        latencies, elapsed = asyncio.run(load_test(port, args.connections, args.requests))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{args.connections} connections x {args.requests} requests = {len(latencies):,} requests "
+          f"in {elapsed:.2f}s ({len(latencies) / elapsed:,.0f} req/s)")
+    print(f"p50 {percentile(latencies, 0.50) * 1000:.2f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms   "
+          f"max {latencies[-1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
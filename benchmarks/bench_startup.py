@@ -0,0 +1,64 @@
+"""benchmarks/bench_startup.py
+
+Measures the import cost of the calculator with `python -X importtime`.
+
+Run with: python -m benchmarks.bench_startup [--module app.calculator] [--top 15]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+# Cumulative import time of app.calculator that tests/test_startup.py enforces. With the optional backends,
+# profilers and spill file imported lazily it measures 90-120 ms (best of 3) on a single-core runner.
+STARTUP_BUDGET_MS = 135
+
+# Modules that must not be imported until a command actually needs them.
+DEFERRED_MODULES = ("pandas", "numpy", "dotenv", "importlib.metadata", "cProfile", "pstats", "sqlite3", "gzip",
+                    "concurrent.futures", "tempfile")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module: str = "app.calculator") -> Dict[str, Tuple[int, int]]:
+    """
+    Imports `module` in a fresh interpreter and returns, for every module it
+    pulled in, the (self, cumulative) import time in microseconds.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--module", default="app.calculator")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    best = min(runs, key=lambda timings: timings[args.module][1])
+    print(f"{args.module}: {best[args.module][1] / 1000:.1f} ms cumulative "
+          f"(best of {args.repeat}, budget {STARTUP_BUDGET_MS} ms)")
+    print(f"\n{'module':<45}{'self ms':>10}{'cumulative ms':>15}")
+    slowest = sorted(best.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{name:<45}{self_us / 1000:>10.1f}{cumulative_us / 1000:>15.1f}")
+    loaded = [name for name in DEFERRED_MODULES if name in best]
+    if loaded:
+        print(f"\nWarning: imported eagerly: {', '.join(loaded)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""benchmarks/bench_vectorized.py
+
+Compares the scalar operations in app.operations, called in a Python loop,
+with the array versions in app.operations.vectorized.
+
+Run with: python -m benchmarks.bench_vectorized [--size N]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app import operations
+from app.operations import vectorized
+
+OPERATIONS = ["addition", "subtraction", "multiplication", "division", "exponent", "modulus"]
+
+
+def scalar_loop(func, a, b):
+    """Evaluate func pairwise the way a caller of the scalar API would."""
+    results = []
+    for x, y in zip(a, b):
+        try:
+            results.append(func(x, y))
+        except (ValueError, ZeroDivisionError, OverflowError):
+            results.append(float("nan"))
+    return results
+
+
+def best_of(repeat, func, *args):
+    """Return the fastest of `repeat` timed calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--size", type=int, default=1_000_000, help="operand pairs per operation")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    a = rng.uniform(-100, 100, args.size)
+    b = rng.uniform(-10, 10, args.size)
+    a_list, b_list = a.tolist(), b.tolist()
+
+    print(f"{'operation':<15}{'scalar pairs/s':>18}{'vector pairs/s':>18}{'speedup':>10}")
+    for name in OPERATIONS:
+        scalar = best_of(args.repeat, scalar_loop, getattr(operations, name), a_list, b_list)
+        vector = best_of(args.repeat, getattr(vectorized, name), a, b)
+        print(f"{name:<15}{args.size / scalar:>18,.0f}{args.size / vector:>18,.0f}"
+              f"{scalar / vector:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""benchmarks/compare.py
+
+Compares two result files written by benchmarks/suite.py and flags metrics
+that got worse by more than a threshold.
+
+Run with: python -m benchmarks.compare baseline.json current.json [--threshold 0.10]
+Exits with status 1 when a regression is found.
+"""
+
+import argparse
+import json
+import sys
+from typing import List, NamedTuple
+
+
+class Change(NamedTuple):
+    """
+    Relative change of one metric; positive means better.
+    """
+    name: str
+    baseline: float
+    current: float
+    improvement: float
+
+
+def compare(baseline: dict, current: dict) -> List[Change]:
+    """
+    Returns the change of every metric present in both result documents.
+    """
+    changes = []
+    for name, before in baseline["results"].items():
+        after = current["results"].get(name)
+        if after is None or before["value"] == 0:
+            continue
+        ratio = (after["value"] - before["value"]) / before["value"]
+        changes.append(Change(name, before["value"], after["value"],
+                              ratio if before.get("higher_is_better", True) else -ratio))
+    return changes
+
+
+def regressions(changes: List[Change], threshold: float) -> List[Change]:
+    return [change for change in changes if change.improvement < -threshold]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown that counts as a regression (default 0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as baseline, open(args.current, encoding="utf-8") as current:
+        changes = compare(json.load(baseline), json.load(current))
+    flagged = regressions(changes, args.threshold)
+    for change in changes:
+        marker = "REGRESSION" if change in flagged else ""
+        print(f"{change.name:<40}{change.baseline:>14,.4g}{change.current:>14,.4g}"
+              f"{change.improvement:>+9.1%}  {marker}")
+    print(f"\n{len(flagged)} regression(s) beyond {args.threshold:.0%}.")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
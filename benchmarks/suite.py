@@ -0,0 +1,168 @@
+"""benchmarks/suite.py
+
+Benchmark suite for operations, history and persistence. Results are written
+as JSON so that runs can be compared with benchmarks/compare.py.
+
+Run with: python -m benchmarks.suite [--max-size 1000000] [--output results.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+from app.calculator import run_batch
+from app.history import History
+from app.operations import get_operation, operation_names
+
+DEFAULT_SIZES = (10**3, 10**4, 10**5, 10**6)
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def _best(repeat, func, *args):
+    return min(_timed(func, *args) for _ in range(repeat))
+
+
+def _peak_bytes(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _filled_history(size):
+    # Every addition stays undoable, so history.undo_last times real undos at any size.
+    history = History(undo_depth=0)
+    for i in range(size):
+        history.add_record("add", (float(i), 1.0), i + 1.0)
+    return history
+
+
+def bench_operations(results, pairs, repeat):
+    """Per-operation throughput of the scalar functions, in calls per second."""
+    a = [float(i % 1000 + 1) for i in range(pairs)]
+    b = [float(i % 7 + 1) for i in range(pairs)]
+    for name in operation_names():
+        func = get_operation(name).func
+
+        def loop(func=func):
+            for x, y in zip(a, b):
+                func(x, y)
+        results[f"operations.{name}"] = _metric(pairs / _best(repeat, loop), "ops/s")
+
+
+def bench_history(results, sizes, repeat):
+    """add_calculation/add_record, undo_last and get_history at each size."""
+    for size in sizes:
+        text = [f"add {float(i)} 1.0 = {i + 1.0}" for i in range(size)]
+
+        def add_calculations(text=text):
+            history = History()
+            for calculation in text:
+                history.add_calculation(calculation)
+        results[f"history.add_calculation.{size}"] = _metric(size / _best(repeat, add_calculations), "ops/s")
+        results[f"history.add_record.{size}"] = _metric(size / _best(repeat, _filled_history, size), "ops/s")
+
+        history = _filled_history(size)
+        results[f"history.get_history.{size}"] = _metric(_best(repeat, history.get_history), "s", False)
+        undo = min(size, 10_000)
+        with redirect_stdout(io.StringIO()):
+            elapsed = _timed(lambda history=history, undo=undo: [history.undo_last() for _ in range(undo)])
+        results[f"history.undo_last.{size}"] = _metric(undo / elapsed, "ops/s")
+
+
+def bench_persistence(results, sizes, repeat, directory):
+    """save/load latency and peak traced memory for the binary log, SQLite and CSV."""
+    for size in sizes:
+        history = _filled_history(size)
+        for fmt in ("bin", "db", "csv"):
+            path = os.path.join(directory, f"history-{size}.{fmt}")
+            with redirect_stdout(io.StringIO()):
+                save = _best(repeat, _fresh_save, history, path)
+                load = _best(repeat, History().load, path)
+                save_peak = _peak_bytes(_fresh_save, history, path)
+                load_peak = _peak_bytes(History().load, path)
+            results[f"persistence.{fmt}.save.{size}"] = _metric(save, "s", False)
+            results[f"persistence.{fmt}.load.{size}"] = _metric(load, "s", False)
+            results[f"persistence.{fmt}.save_peak.{size}"] = _metric(save_peak, "bytes", False)
+            results[f"persistence.{fmt}.load_peak.{size}"] = _metric(load_peak, "bytes", False)
+            results[f"persistence.{fmt}.file_size.{size}"] = _metric(os.path.getsize(path), "bytes", False)
+
+
+def _fresh_save(history, path):
+    """Full save: remove the file so the binary log cannot just append."""
+    if os.path.exists(path):
+        os.remove(path)
+    history.save(path)
+
+
+def bench_calculator(results, commands, repeat):
+    """End-to-end batch throughput of scripted commands."""
+    names = operation_names()
+    lines = [f"{names[i % len(names)]} {i % 97 + 1} {i % 7 + 1}" for i in range(commands)]
+    lines += ["history", "undo", "clear"]
+
+    def batch():
+        run_batch(lines, out=io.StringIO())
+    results["calculator.commands"] = _metric(len(lines) / _best(repeat, batch), "commands/s")
+
+
+def _metric(value, unit, higher_is_better=True):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def run_suite(sizes=DEFAULT_SIZES, repeat=3, commands=100_000):
+    """
+    Runs every benchmark and returns the results document.
+    """
+    results = {}
+    bench_operations(results, max(sizes), repeat)
+    bench_history(results, sizes, repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        bench_persistence(results, sizes, repeat, directory)
+    bench_calculator(results, commands, repeat)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": list(sizes),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--max-size", type=int, default=max(DEFAULT_SIZES),
+                        help="largest history size; sizes are powers of ten from 1000 (use 10000000 for 10^7)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--commands", type=int, default=100_000, help="commands in the end-to-end run")
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args(argv)
+
+    sizes = [10**power for power in range(3, 8) if 10**power <= args.max_size]
+    document = run_suite(sizes, args.repeat, args.commands)
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(document, output, indent=2)
+    for name, metric in document["results"].items():
+        print(f"{name:<40}{metric['value']:>16,.4g} {metric['unit']}")
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
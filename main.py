@@ -3,7 +3,10 @@
 # and now we are telling the computer, "Go and find that calculator tool for us."
 # The "app" part is like a folder, and inside that folder, there's another file called "calculator.py",
 # which has the tool (function) called "calculator" that we need.
-from app.calculator import calculator
+#
+# We actually import its helper "main", which starts the calculator for us: it reads the command line (like "--batch commands.txt")
+# and decides whether to ask us questions one at a time or read a whole file of commands.
+from app.calculator import main
 
 # This part of the code is super important! It checks if this file is being run directly by the computer.
 # Let me explain: when we write Python programs, sometimes we want to run them directly,
@@ -16,4 +19,5 @@ from app.calculator import calculator
 if __name__ == "__main__":
     # Now, we use the calculator tool we got earlier. This will start the calculator, which is a program 
     # that keeps running and doing math based on what we tell it.
-    calculator()
\ No newline at end of file
+    # "main" calls calculator() for us, either interactively or in batch mode.
+    main()
\ No newline at end of file
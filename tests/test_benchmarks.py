@@ -0,0 +1,48 @@
+"""tests/test_benchmarks.py
+
+Smoke tests for the benchmark suite and the regression comparison.
+"""
+
+import json
+
+import pytest
+
+from benchmarks import compare, suite
+
+
+def _document(**values):
+    return {"results": {name: {"value": value, "unit": "ops/s", "higher_is_better": not name.endswith("_s")}
+                        for name, value in values.items()}}
+
+
+@pytest.mark.fast
+def test_compare_flags_regressions_beyond_threshold() -> None:
+    """Test that only changes worse than the threshold are flagged, in both directions of 'better'."""
+    baseline = _document(ops=1000.0, latency_s=1.0, steady=500.0)
+    current = _document(ops=850.0, latency_s=0.8, steady=480.0)
+    changes = {change.name: change for change in compare.compare(baseline, current)}
+    assert changes["ops"].improvement == pytest.approx(-0.15)
+    assert changes["latency_s"].improvement == pytest.approx(0.2)
+    assert [change.name for change in compare.regressions(list(changes.values()), 0.10)] == ["ops"]
+
+
+@pytest.mark.fast
+def test_compare_exit_status(tmp_path, capsys) -> None:
+    """Test that the comparison script exits non-zero only when a regression is found."""
+    baseline, current = tmp_path / "baseline.json", tmp_path / "current.json"
+    baseline.write_text(json.dumps(_document(ops=1000.0)), encoding="utf-8")
+    current.write_text(json.dumps(_document(ops=950.0)), encoding="utf-8")
+    assert compare.main([str(baseline), str(current)]) == 0
+    assert compare.main([str(baseline), str(current), "--threshold", "0.01"]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
+
+
+@pytest.mark.slow
+def test_suite_runs_and_writes_json(tmp_path) -> None:
+    """Test a tiny end-to-end run of the suite."""
+    output = tmp_path / "results.json"
+    suite.main(["--max-size", "1000", "--repeat", "1", "--commands", "200", "--output", str(output)])
+    results = json.loads(output.read_text(encoding="utf-8"))["results"]
+    for name in ("operations.add", "history.add_record.1000", "history.undo_last.1000",
+                 "persistence.bin.load.1000", "persistence.csv.save_peak.1000", "calculator.commands"):
+        assert results[name]["value"] > 0, name
@@ -6,7 +6,8 @@ from io import StringIO
 from typing import List
 
 import pytest
-from app.calculator import calculator
+from app.calculator import calculator, main, run_batch
+from app.config import get_config, reload_config
 
 
 def run_calculator_with_input(monkeypatch: pytest.MonkeyPatch, inputs: List[str]) -> str:
@@ -236,6 +237,23 @@ def test_undo_command_with_empty_history(monkeypatch: pytest.MonkeyPatch) -> Non
     assert "History is already empty." in output
 
 
+def test_calculation_errors_are_reported() -> None:
+    """Test that overflow and modulus by zero are reported instead of crashing the loop."""
+    out = StringIO()
+    run_batch(["expo 10 400", "mod 5 0", "expo 0 -1", "expo 3 1000 mod 7"], out=out)
+    assert out.getvalue() == ("Result is too large to represent.\nModulus by zero is not allowed.\n"
+                              "Zero cannot be raised to a negative power.\nResult: 4.0\n")
+
+
+def test_redo_command(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that 'redo' reapplies an undone clear and reports when nothing is left."""
+    inputs = ["add 2 3", "clear", "undo", "redo", "undo", "redo", "redo", "undo", "history", "exit"]
+    output = run_calculator_with_input(monkeypatch, inputs)
+    assert output.count("Last undone change redone.") == 2
+    assert "Nothing to redo." in output
+    assert output.endswith("Calculation History:\nadd 2.0 3.0 = 5.0\nExiting calculator...\n")
+
+
 @pytest.mark.parametrize("exit_command", ["EXIT", "eXiT"])
 def test_exit_command_case_insensitivity(
     monkeypatch: pytest.MonkeyPatch, exit_command: str
@@ -328,3 +346,125 @@ def test_load_history_command(monkeypatch: pytest.MonkeyPatch) -> None:
         "History successfully loaded" in output
         or "File was not found." in output
     )
+
+
+def test_batch_inputs_skip_prompts(capsys: pytest.CaptureFixture) -> None:
+    """Test that calculator(inputs=...) runs without prompts or the banner."""
+    calculator(["add 2 3", "multi 4 5", "history"])
+    captured = capsys.readouterr()
+    assert "Enter an operation" not in captured.out
+    assert "Welcome to the Calculator!" not in captured.out
+    assert "Result: 5.0\nResult: 20.0\nCalculation History:\n" in captured.out
+    assert "Processed 3 lines" in captured.err
+
+
+def test_batch_matches_interactive_output(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that batch mode prints the same command output as the interactive loop."""
+    commands = ["add 2 3", "div 1 0", "undo", "undo", "ad 1 2", "", "history", "exit"]
+    interactive = run_calculator_with_input(monkeypatch, commands)
+    batch = StringIO()
+    run_batch(commands, out=batch)
+    assert interactive.endswith(batch.getvalue())
+
+
+def test_batch_stops_at_exit() -> None:
+    """Test that commands after 'exit' are not processed in batch mode."""
+    out = StringIO()
+    stats = run_batch(["add 1 1", "exit", "add 2 2"], out=out)
+    assert stats.lines == 2
+    assert "Result: 4.0" not in out.getvalue()
+
+
+def test_main_batch_file(tmp_path, capsys: pytest.CaptureFixture) -> None:
+    """Test running a command file through main --batch."""
+    command_file = tmp_path / "commands.txt"
+    command_file.write_text("add 1 2\nsub 5 1\n", encoding="utf-8")
+    main(["--batch", str(command_file)])
+    captured = capsys.readouterr()
+    assert "Result: 3.0\nResult: 4.0\n" == captured.out
+    assert "lines/sec" in captured.err
+
+
+def test_calculator_saves_to_history_file(monkeypatch, tmp_path, capsys: pytest.CaptureFixture) -> None:
+    """Test that HISTORY_FILE is where the calculator saves, and the backend's file is used when it is unset."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("HISTORY_BACKEND", "sqlite")
+    monkeypatch.setenv("HISTORY_FILE", "mine.bin")
+    reload_config()
+    try:
+        calculator(["add 1 2", "save"])
+        assert "History successfully saved to mine.bin." in capsys.readouterr().out
+        assert (tmp_path / "mine.bin").exists() and not (tmp_path / "history.db").exists()
+
+        monkeypatch.delenv("HISTORY_FILE")
+        reload_config()
+        calculator(["add 1 2", "save"])
+        assert "History successfully saved to history.db." in capsys.readouterr().out
+    finally:
+        monkeypatch.undo()
+        reload_config()
+
+
+def test_main_rejects_an_unknown_history_backend(monkeypatch, capsys: pytest.CaptureFixture) -> None:
+    """Test that a bad HISTORY_BACKEND is reported at startup instead of on the first save."""
+    monkeypatch.setenv("HISTORY_BACKEND", "parquet")
+    get_config.cache_clear()
+    try:
+        with pytest.raises(SystemExit) as exit_info:
+            main([])
+        assert exit_info.value.code == 2
+        assert "invalid configuration: Unknown HISTORY_BACKEND 'parquet'" in capsys.readouterr().err
+    finally:
+        monkeypatch.undo()
+        reload_config()
+
+
+def test_export_and_import_commands(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that export/import round-trip the history through CSV."""
+    monkeypatch.chdir(tmp_path)
+    out = StringIO()
+    run_batch(["add 2 3", "export", "clear", "import", "history"], out=out)
+    assert "History successfully saved to history.csv." in out.getvalue()
+    assert out.getvalue().endswith("Calculation History:\nadd 2.0 3.0 = 5.0\n")
+
+
+def test_history_stats_command(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that history stats reports resident and spilled entries."""
+    monkeypatch.setattr("app.history.get_config", lambda: get_config()._replace(history_capacity=2))
+    out = StringIO()
+    run_batch(["add 1 1", "add 2 2", "add 3 3", "history stats", "undo", "undo", "history"], out=out)
+    assert "History: 3 entries, 2 resident" in out.getvalue()
+    assert "1 spilled to disk" in out.getvalue()
+    assert out.getvalue().endswith("Calculation History:\nadd 1.0 1.0 = 2.0\n")
+
+
+def test_history_tail_and_get_commands(tmp_path) -> None:
+    """Test reading saved entries by position without loading the log."""
+    history_file = str(tmp_path / "history.bin")
+    commands = [f"add {i} 1" for i in range(30)] + ["save", "clear", "history tail 2", "history get 3..4",
+                                                    "history get 7", "history get 5..x"]
+    out = StringIO()
+    run_batch(commands, out=out, history_file=history_file)
+    output = out.getvalue()
+    assert "Saved History (30 entries):\n28: add 28.0 1.0 = 29.0\n29: add 29.0 1.0 = 30.0\n" in output
+    assert "3: add 3.0 1.0 = 4.0\n4: add 4.0 1.0 = 5.0\n" in output
+    assert "7: add 7.0 1.0 = 8.0\n" in output
+    assert output.endswith("Invalid input. Please use: history tail N, or history get I..J.\n")
+
+
+def test_history_tail_without_saved_log(tmp_path) -> None:
+    """Test that querying a missing log reports it."""
+    out = StringIO()
+    run_batch(["history tail 5"], out=out, history_file=str(tmp_path / "missing.bin"))
+    assert "was not found." in out.getvalue()
+
+
+def test_history_where_command() -> None:
+    """Test querying the current history by operation and result."""
+    out = StringIO()
+    run_batch(["div 500 2", "div 10 2", "multi 300 2", "history where op=div result>100",
+               "history where result > 100", "history where op=div result<"], out=out)
+    output = out.getvalue()
+    assert "History Query (1 matches):\n0: div 500.0 2.0 = 250.0\n" in output
+    assert "History Query (2 matches):\n0: div 500.0 2.0 = 250.0\n2: multi 300.0 2.0 = 600.0\n" in output
+    assert "Invalid query:" in output
@@ -0,0 +1,162 @@
+"""tests/test_exact.py
+
+Tests for exact arithmetic, the exponent digit budget and modular exponentiation.
+"""
+
+import sys
+from decimal import Decimal
+from fractions import Fraction
+from io import StringIO
+
+import pytest
+
+from app.calculator import run_batch
+from app.config import reload_config
+from app.expressions import compile_expression
+from app.operations import get_operation
+from app.operations.exact import check_digits, estimate_digits, parse_number, powmod
+
+
+@pytest.fixture
+def exact_mode(monkeypatch: pytest.MonkeyPatch):
+    """Turn on EXACT_ARITHMETIC with a small digit budget for one test."""
+    monkeypatch.setenv("EXACT_ARITHMETIC", "1")
+    monkeypatch.setenv("EXPONENT_DIGIT_BUDGET", "1000")
+    yield reload_config()
+    monkeypatch.undo()
+    reload_config()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("12", 12), ("-3", -3), ("1.5", Decimal("1.5")), ("2e3", Decimal("2e3")), ("1/4", Fraction(1, 4)),
+])
+def test_parse_number(text, expected) -> None:
+    """Test that operands are parsed into the narrowest exact type."""
+    value = parse_number(text)
+    assert value == expected and type(value) is type(expected)
+
+
+def test_parse_number_rejects_text() -> None:
+    """Test that invalid operands raise ValueError like float() does."""
+    with pytest.raises(ValueError):
+        parse_number("abc")
+
+
+@pytest.mark.parametrize("name, a, b, expected", [
+    ("add", 10**20, 1, 10**20 + 1),
+    ("add", Decimal("0.1"), Decimal("0.2"), Decimal("0.3")),
+    ("div", 1, 3, Fraction(1, 3)),
+    ("div", 6, 3, 2),
+    ("div", Decimal("1"), 8, Decimal("0.125")),
+    ("mod", Decimal("7.5"), 2, Decimal("1.5")),
+    ("expo", 2, 100, 2**100),
+    ("expo", 2, -2, Fraction(1, 4)),
+    ("multi", Fraction(1, 3), 3, 1),
+])
+def test_exact_operations(name, a, b, expected) -> None:
+    """Test that operations on exact operands give exact results."""
+    result = get_operation(name).apply((a, b))
+    assert result == expected and type(result) is type(expected)
+
+
+def test_float_operands_use_float_path() -> None:
+    """Test that float operands keep float results and error messages."""
+    assert get_operation("div").apply((1.0, 4.0)) == 0.25
+    with pytest.raises(ValueError, match="too large"):
+        get_operation("expo").apply((10.0, 400.0))
+    with pytest.raises(ValueError, match="Modulus by zero"):
+        get_operation("mod").apply((5.0, 0.0))
+
+
+def test_digit_budget_is_checked_before_computing() -> None:
+    """Test that the estimate is close to the real size and oversized results are refused."""
+    assert abs(estimate_digits(7, 1000) - len(str(7**1000))) <= 1
+    check_digits(7, 1000, budget=1000)
+    with pytest.raises(ValueError, match="digits"):
+        check_digits(7, 10**12, budget=1000)
+    with pytest.raises(ValueError, match="digits"):
+        check_digits(Decimal("1e999999"), 10**9, budget=1000)
+
+
+def test_powmod_matches_pow() -> None:
+    """Test modular exponentiation for exact and float operands."""
+    assert powmod(3, 10**18, 1_000_000_007) == pow(3, 10**18, 1_000_000_007)
+    assert powmod(7.0, 2.0, 5.0) == 4.0
+    assert powmod(2.5, 2.0, 3.0) == 0.25
+    with pytest.raises(ValueError):
+        powmod(2, 3, 0)
+
+
+def test_expression_power_modulus_uses_pow() -> None:
+    """Test that a ^ b % m is evaluated without computing a ^ b."""
+    assert compile_expression("3 ^ 1000000000 % 7").evaluate() == float(pow(3, 10**9, 7))
+
+
+def test_exact_mode_commands(exact_mode) -> None:  # pylint: disable=redefined-outer-name,unused-argument
+    """Test exact results, the digit budget and expo ... mod in the calculator."""
+    out = StringIO()
+    run_batch(["add 12345678901234567890 1", "div 1 3", "(1/3) + 1/6", "expo 7 100000",
+               "expo 2 100000 mod 1000", "history"], out=out)
+    output = out.getvalue()
+    assert "Result: 12345678901234567891\nResult: 1/3\nResult: 1/2\n" in output
+    assert "Result would have more than the limit of 1000 digits.\n" in output
+    assert f"Result: {pow(2, 100000, 1000)}\n" in output
+    assert "div 1 3 = 1/3\n" in output
+
+
+def test_budget_is_clamped_to_the_int_string_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that results beyond Python's int/str limit are refused, and printed once the limit allows them."""
+    if not hasattr(sys, "set_int_max_str_digits"):
+        pytest.skip("this Python has no int/str conversion limit")
+    monkeypatch.setenv("EXACT_ARITHMETIC", "1")
+    reload_config()
+    limit = sys.get_int_max_str_digits()
+    try:
+        sys.set_int_max_str_digits(4300)
+        out = StringIO()
+        run_batch(["expo 7 5200", "add 1 2"], out=out)
+        assert out.getvalue() == "Result would have about 4395 digits, more than the limit of 4300.\nResult: 3\n"
+        sys.set_int_max_str_digits(10000)
+        out = StringIO()
+        big = "9" * 2500
+        run_batch(["expo 7 5200", f"multi {big} {big}", "history"], out=out)
+        lines = out.getvalue().splitlines()
+        assert lines[0] == f"Result: {7 ** 5200}" and len(lines[0]) > 4300 + len("Result: ")
+        assert lines[1] == f"Result: {int(big) ** 2}"
+        assert lines[3] == f"expo 7 5200 = {7 ** 5200}"
+        assert sys.get_int_max_str_digits() == 10000
+    finally:
+        sys.set_int_max_str_digits(limit)
+        monkeypatch.undo()
+        reload_config()
+
+
+def test_runaway_exponent_is_refused(exact_mode) -> None:  # pylint: disable=redefined-outer-name,unused-argument
+    """Test that an exponent too large for a float is refused instead of overflowing."""
+    with pytest.raises(ValueError, match="more than the limit of 1000 digits"):
+        get_operation("expo").apply((2, parse_number("1e400")))
+    with pytest.raises(ValueError, match="more than the limit of 1000 digits"):
+        check_digits(Fraction(3, 2), -10 ** 400)
+    assert estimate_digits(2, 10 ** 400) > 10 ** 399
+    out = StringIO()
+    run_batch(["expo 2 1e400", "expo 2 10", "2 ^ 1e400"], out=out)
+    assert out.getvalue() == ("Result would have more than the limit of 1000 digits.\nResult: 1024\n"
+                              "Result would have more than the limit of 1000 digits.\n")
+
+
+def test_budget_applies_to_every_operation(exact_mode) -> None:  # pylint: disable=redefined-outer-name,unused-argument
+    """Test that operands and results of any operation are held to the digit budget."""
+    with pytest.raises(ValueError, match="Operand has about 3000001 digits"):
+        parse_number("1e3000000")
+    with pytest.raises(ValueError, match="more than the limit of 1000"):
+        parse_number("1" * 2000)
+    with pytest.raises(ValueError, match="Result has about"):
+        get_operation("multi").apply((10 ** 600, 10 ** 600))
+    with pytest.raises(ValueError, match="Operand has about"):
+        get_operation("add").apply((Decimal("1e3000000"), 1))
+    out = StringIO()
+    run_batch(["add 1e3000000 1", "div 1 1e-5000", "add 1 2"], out=out)
+    assert out.getvalue().splitlines() == [
+        "Invalid input. Please follow the format: <operation> <num1> <num2>.",
+        "Invalid expression: Operand has about 5001 digits, more than the limit of 1000.",
+        "Result: 3"]
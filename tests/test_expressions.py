@@ -0,0 +1,79 @@
+""" tests/test_expressions.py """
+from io import StringIO
+
+import pytest
+
+from app.calculator import run_batch
+from app.expressions import (
+    ExpressionError, clear_expression_cache, compile_expression, expression_cache_info, parse,
+)
+from app.history import History, Record
+from app.operations import Operation, OperationCache, register, unregister
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("(3 + 4) ^ 2 % 5", 4.0),
+    ("1 + 2 * 3", 7.0),
+    ("2 ^ 3 ^ 2", 512.0),
+    ("-2 ^ 2", -4.0),
+    ("10 - 4 - 3", 3.0),
+    ("-(1 + 2) * 2", -6.0),
+    ("add 2 3", 5.0),
+    ("add (1 + 2) expo 2 3", 11.0),
+    ("mod(7, 3) * 2", 2.0),
+    ("1.5e1 / .5", 30.0),
+])
+def test_evaluate(text, expected):
+    """Test precedence, associativity and the prefix forms."""
+    assert compile_expression(text).evaluate() == expected
+
+
+@pytest.mark.parametrize("text", ["3 +", "(1 + 2", "foo(1, 2)", "1 $ 2", "add(1, 2, 3)", ""])
+def test_invalid_expressions(text):
+    """Test that malformed expressions raise ExpressionError."""
+    with pytest.raises(ExpressionError):
+        parse(text)
+
+
+def test_division_by_zero_raises_value_error():
+    """Test that operation errors surface the same way as prefix commands."""
+    with pytest.raises(ValueError, match="Division by zero is not allowed."):
+        compile_expression("1 / (2 - 2)").evaluate()
+
+
+def test_repeated_expression_is_parsed_once():
+    """Test that the compiled expression is reused for identical text."""
+    clear_expression_cache()
+    first = compile_expression("(1 + 2) * 3")
+    assert compile_expression("  (1 + 2) * 3 ") is first
+    info = expression_cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_cache_is_invalidated_when_operations_change():
+    """Test that registering an operation makes cached parses see it."""
+    with pytest.raises(ExpressionError):
+        compile_expression("twice(4)")
+    register(Operation("twice", lambda a: 2 * a, arity=1))
+    try:
+        assert compile_expression("twice(4) + 1").evaluate() == 9.0
+    finally:
+        unregister("twice")
+
+
+def test_evaluate_through_operation_cache():
+    """Test that evaluation can be routed through the operation result cache."""
+    cache = OperationCache()
+    expression = compile_expression("(2 ^ 10) + (2 ^ 10)")
+    assert expression.evaluate(cache.call) == 2048.0
+    assert cache.stats().hits == 1
+
+
+def test_calculator_records_expressions():
+    """Test that expressions are evaluated by the calculator and recorded in history."""
+    history = History()
+    out = StringIO()
+    run_batch(["(3 + 4) ^ 2 % 5", "6 / 3", "2 +", "history"], out=out, history=history)
+    assert out.getvalue().splitlines()[:3] == [
+        "Result: 4.0", "Result: 2.0", "Invalid expression: Unexpected end of expression."]
+    assert history.get_records() == ["(3 + 4) ^ 2 % 5 = 4.0", Record("div", (6.0, 3.0), 2.0)]
@@ -3,16 +3,24 @@
 Unit tests for the History class.
 """
 
+import lzma
 import os
+import random
+import subprocess
+import sys
 import tempfile
+import tracemalloc
 import unittest
+from contextlib import closing
 from io import StringIO
 from unittest.mock import patch
 
 import pandas as pd
 import pytest
 
-from app.history import History
+from app.calculator import calculator
+from app.config import get_config, reload_config
+from app.history import History, Record, archive, binlog, sqlite
 
 
 # Pytest Test Functions
@@ -102,16 +110,110 @@ def test_get_history_is_copy() -> None:
 
 
 def test_undo_last_after_clear(capsys: pytest.CaptureFixture) -> None:
-    """Test undoing last calculation after clearing history."""
+    """Test that undoing after clearing history restores the cleared calculations."""
     history = History()
     history.add_calculation("add 2 3 = 5")
     history.clear_history()
     history.undo_last()
+    assert history.get_history() == ["add 2 3 = 5"]
+    history.undo_last()
+    history.undo_last()
     captured = capsys.readouterr()
     assert captured.out.strip() == "History is already empty."
     assert history.get_history() == []
 
 
+def test_undo_and_redo_many_changes(capsys: pytest.CaptureFixture) -> None:
+    """Test stepping back through additions and clears and forward again."""
+    history = History()
+    states = [[]]
+    for i in range(5):
+        history.add_record("add", (float(i), 1.0), i + 1.0)
+        states.append(list(history.get_history()))
+        if i % 2:
+            history.clear_history()
+            states.append([])
+    for expected in reversed(states[:-1]):
+        history.undo_last()
+        assert history.get_history() == expected
+    for expected in states[1:]:
+        assert history.redo_last()
+        assert history.get_history() == expected
+    assert not history.redo_last()
+    assert capsys.readouterr().out.strip() == "Nothing to redo."
+
+
+def test_new_change_discards_redo() -> None:
+    """Test that adding a calculation after undo makes the undone ones unreachable."""
+    history = History()
+    history.add_calculation("add 1 1 = 2")
+    history.add_calculation("add 2 2 = 4")
+    history.undo_last()
+    history.add_calculation("add 3 3 = 6")
+    with patch('sys.stdout', new=StringIO()):
+        assert not history.redo_last()
+    assert history.get_history() == ["add 1 1 = 2", "add 3 3 = 6"]
+
+
+def test_get_history_is_a_snapshot() -> None:
+    """Test that a retrieved history keeps its entries through later undo, clear and redo."""
+    history = History(capacity=2)
+    for i in range(6):
+        history.add_calculation(f"note {i}")
+    snapshot = history.get_history()
+    history.undo_last()
+    history.undo_last()
+    history.clear_history()
+    history.add_calculation("note x")
+    assert snapshot == [f"note {i}" for i in range(6)]
+    assert snapshot[-1] == "note 5"
+    assert history.get_history() == ["note x"]
+
+
+def _open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc/self/fd")
+def test_undo_depth_closes_spilled_stores(capsys: pytest.CaptureFixture) -> None:
+    """Test that undo is bounded and cleared histories that fall off it release their spill files."""
+    history = History(capacity=2, undo_depth=4)
+    history.add_calculation("first")
+    history.add_calculation("second")
+    history.add_calculation("third")
+    first_view = history.get_history()
+    before = _open_fds()
+    for i in range(300):
+        for j in range(4):
+            history.add_calculation(f"note {i}.{j}")
+        history.clear_history()
+    assert _open_fds() - before <= 4
+    assert first_view == ["first", "second", "third"]
+    # The clear and three of the four additions before it.
+    for _ in range(4):
+        history.undo_last()
+    assert history.get_history() == ["note 299.0"]
+    history.undo_last()
+    assert capsys.readouterr().out == "Nothing left to undo.\n"
+    assert history.get_history() == ["note 299.0"]
+
+
+def test_undo_load_and_save_after_undo(tmp_path) -> None:
+    """Test that a load can be undone and the restored history is saved in full."""
+    path, other = str(tmp_path / "history.bin"), str(tmp_path / "other.bin")
+    history = History()
+    history.add_calculation("add 1 1 = 2")
+    _silent_save(history, other)
+    history.add_calculation("add 2 2 = 4")
+    _silent_save(history, path)
+    with patch('sys.stdout', new=StringIO()):
+        history.load(other)
+        history.undo_last()
+    assert history.get_history() == ["add 1 1 = 2", "add 2 2 = 4"]
+    _silent_save(history, other)
+    assert _loaded(other) == ["add 1 1 = 2", "add 2 2 = 4"]
+
+
 # Unittest TestCase Class
 class TestHistory(unittest.TestCase):
     """Unit tests for the History class's save and load methods."""
@@ -207,7 +309,7 @@ class TestHistory(unittest.TestCase):
         with patch("logging.error") as mock_logging_error:
             history.load(nonexistent_file)
             mock_logging_error.assert_called_once_with(
-                f"The file {nonexistent_file} was not found."
+                "The file %s was not found.", nonexistent_file
             )
             assert history.get_history() == [], (
                 "History should remain empty when loading from a non-existent file."
@@ -225,3 +327,566 @@ def test_get_history_with_logging() -> None:
         assert logged_history == [
             "add 2 3 = 5"
             ], "History content should match the added calculation"
+
+
+def _silent_save(history: History, path: str) -> None:
+    with patch('sys.stdout', new=StringIO()):
+        history.save(path)
+
+
+def _loaded(path: str) -> list:
+    history = History()
+    with patch('sys.stdout', new=StringIO()):
+        history.load(path)
+    return history.get_history()
+
+
+def test_binary_log_round_trip(tmp_path) -> None:
+    """Test saving to and loading from the binary log."""
+    path = str(tmp_path / "history.bin")
+    history = History()
+    history.add_calculation("add 2.0 3.0 = 5.0")
+    history.add_calculation("mod 7.0 3.0 = 1.0")
+    _silent_save(history, path)
+    assert _loaded(path) == ["add 2.0 3.0 = 5.0", "mod 7.0 3.0 = 1.0"]
+
+
+def test_binary_log_appends_only_new_entries(tmp_path) -> None:
+    """Test that a second save writes just the new frame instead of the whole history."""
+    path = str(tmp_path / "history.bin")
+    history = History()
+    for i in range(100):
+        history.add_calculation(f"add {i} 1 = {i + 1}")
+    _silent_save(history, path)
+    size = os.path.getsize(path)
+    history.add_calculation("sub 1 1 = 0")
+    _silent_save(history, path)
+    assert os.path.getsize(path) - size == binlog.FRAME.size + len("sub 1 1 = 0")
+    assert _loaded(path)[-1] == "sub 1 1 = 0"
+
+
+def test_binary_log_records_undo_and_clear(tmp_path) -> None:
+    """Test that undo and clear after a save are replayed on load."""
+    path = str(tmp_path / "history.bin")
+    history = History()
+    history.add_calculation("a")
+    history.add_calculation("b")
+    _silent_save(history, path)
+    history.undo_last()
+    history.add_calculation("c")
+    _silent_save(history, path)
+    assert _loaded(path) == ["a", "c"]
+    history.clear_history()
+    _silent_save(history, path)
+    assert _loaded(path) == []
+
+
+def test_binary_log_compaction(tmp_path) -> None:
+    """Test that compaction drops undone records but keeps the saved entries."""
+    path = str(tmp_path / "history.bin")
+    history = History()
+    for i in range(10):
+        history.add_calculation(f"entry {i}")
+        _silent_save(history, path)
+        history.undo_last()
+    history.add_calculation("kept")
+    _silent_save(history, path)
+    size = os.path.getsize(path)
+    with patch('sys.stdout', new=StringIO()):
+        history.compact()
+    assert os.path.getsize(path) < size
+    assert _loaded(path) == ["kept"]
+    history.add_calculation("after")
+    _silent_save(history, path)
+    assert _loaded(path) == ["kept", "after"]
+
+
+def test_binary_log_ignores_torn_tail(tmp_path) -> None:
+    """Test that a frame cut short by a crash is skipped and overwritten by the next save."""
+    path = str(tmp_path / "history.bin")
+    history = History()
+    history.add_calculation("complete")
+    _silent_save(history, path)
+    with open(path, 'ab') as log_file:
+        log_file.write(binlog.FRAME.pack(binlog.ADD, 50) + b"partial")
+    recovered = History()
+    with patch('sys.stdout', new=StringIO()):
+        recovered.load(path)
+    assert recovered.get_history() == ["complete"]
+    recovered.add_calculation("next")
+    _silent_save(recovered, path)
+    assert _loaded(path) == ["complete", "next"]
+
+
+def test_binary_log_fsync_batching(tmp_path, monkeypatch) -> None:
+    """Test that fsync only runs once the configured number of frames is pending."""
+    monkeypatch.setattr("app.history.get_config", lambda: get_config()._replace(fsync_interval=3))
+    path = str(tmp_path / "history.bin")
+    history = History()
+    history.add_calculation("first")
+    _silent_save(history, path)
+    with patch('os.fsync') as mock_fsync:
+        for i in range(3):
+            history.add_calculation(f"entry {i}")
+            _silent_save(history, path)
+        assert mock_fsync.call_count == 1
+
+
+def test_load_rejects_non_log_file(tmp_path, capsys: pytest.CaptureFixture) -> None:
+    """Test that loading a file that is not a history log reports an error."""
+    path = tmp_path / "history.bin"
+    path.write_bytes(b"not a log")
+    history = History()
+    history.load(str(path))
+    assert "is not a history log" in capsys.readouterr().out
+    assert history.get_history() == []
+
+
+def test_add_record_renders_lazily() -> None:
+    """Test that structured records render like the calculator's strings."""
+    history = History()
+    history.add_record("add", (2.0, 3.0), 5.0)
+    history.add_record("neg", (4.0,), -4.0)
+    assert history.get_history() == ["add 2.0 3.0 = 5.0", "neg 4.0 = -4.0"]
+    assert history.get_records() == [Record("add", (2.0, 3.0), 5.0), Record("neg", (4.0,), -4.0)]
+
+
+def test_canonical_strings_are_stored_as_records() -> None:
+    """Test that calculation strings are parsed into records only when lossless."""
+    history = History()
+    history.add_calculation("div 1.0 3.0 = 0.3333333333333333")
+    history.add_calculation("add 2 3 = 5")
+    records = history.get_records()
+    assert records[0] == Record("div", (1.0, 3.0), 0.3333333333333333)
+    assert records[1] == "add 2 3 = 5"
+    assert history.get_history() == ["div 1.0 3.0 = 0.3333333333333333", "add 2 3 = 5"]
+
+
+def test_non_float_results_are_kept_as_text() -> None:
+    """Test that results that are not floats (e.g. complex powers) fall back to text."""
+    history = History()
+    history.add_record("expo", (-8.0, 0.5), (-8.0) ** 0.5)
+    assert history.get_records() == [f"expo -8.0 0.5 = {(-8.0) ** 0.5}"]
+
+
+def test_record_store_undo_mixed_entries() -> None:
+    """Test undo over a mix of record and text entries."""
+    history = History()
+    history.add_record("mod", (7.0, 3.0), 1.0)
+    history.add_calculation("free text")
+    history.undo_last()
+    history.add_record("sub", (1.0, 1.0), 0.0)
+    assert history.get_history() == ["mod 7.0 3.0 = 1.0", "sub 1.0 1.0 = 0.0"]
+
+
+def test_records_survive_binary_log(tmp_path) -> None:
+    """Test that records are saved as binary frames and come back structured."""
+    path = str(tmp_path / "history.bin")
+    history = History()
+    history.add_record("expo", (2.0, 0.5), 2.0 ** 0.5)
+    history.add_calculation("note")
+    _silent_save(history, path)
+    loaded = History()
+    with patch('sys.stdout', new=StringIO()):
+        loaded.load(path)
+    assert loaded.get_records() == [Record("expo", (2.0, 0.5), 2.0 ** 0.5), "note"]
+
+
+def test_record_store_is_compact() -> None:
+    """Test that record storage stays well below the cost of formatted strings."""
+    history = History()
+    for i in range(10000):
+        history.add_record("div", (float(i), 3.0), i / 3.0)
+    assert history.history.nbytes() / 10000 < 40
+
+
+def _churned_log(path: str, size: int) -> None:
+    """Writes a log of about size bytes in which almost every entry is later undone."""
+    text = binlog.encode_entry("x" * 4096)
+    cycle = text * 64 + binlog.encode_truncate(1)
+    with open(path, 'wb') as log_file:
+        log_file.write(binlog.MAGIC + binlog.encode_entry("first"))
+        for _ in range(size // len(cycle)):
+            log_file.write(cycle)
+        log_file.write(binlog.encode_entry("last"))
+
+
+def test_binary_log_streams_across_blocks(tmp_path) -> None:
+    """Test that frames split across read blocks are replayed and iterated correctly."""
+    path = str(tmp_path / "history.bin")
+    history = History()
+    for i in range(20):
+        history.add_record("add", (float(i), 1.0), i + 1.0)
+        history.add_calculation(f"note {i}")
+        _silent_save(history, path)
+        if i % 3 == 0:
+            history.undo_last()
+    _silent_save(history, path)
+    log = binlog.HistoryLog(path)
+    expected = history.get_history()
+    assert list(log.read(block_size=7)) == expected
+    assert [str(entry) for entry in log.iter_entries(block_size=7)] == expected
+    assert list(History().iter_history(path)) == expected
+
+
+def test_iter_history_csv_in_chunks(tmp_path, monkeypatch) -> None:
+    """Test that CSV histories are imported and iterated chunk by chunk."""
+    monkeypatch.setattr('app.history.CSV_CHUNK_SIZE', 3)
+    path = str(tmp_path / "history.csv")
+    calculations = [f"add {i}.0 1.0 = {i + 1}.0" for i in range(10)]
+    pd.DataFrame({'calculations': calculations}).to_csv(path, index=False)
+    assert list(History().iter_history(path)) == calculations
+    assert _loaded(path) == calculations
+
+
+def test_churned_log_loads_in_bounded_memory(tmp_path) -> None:
+    """Test that loading and iterating a log allocates a few read blocks, not the size of the file."""
+    path = str(tmp_path / "history.bin")
+    _churned_log(path, 16 * 1024 * 1024)
+    history = History(capacity=0)
+    tracemalloc.start()
+    try:
+        history.load(path)
+        assert sum(1 for _ in history.iter_history(path)) == 2
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert history.get_history() == ["first", "last"]
+    assert peak < 4 * binlog.READ_BLOCK_SIZE
+
+
+@pytest.mark.parametrize("size", [
+    pytest.param(192 * 1024 * 1024, marks=pytest.mark.slow),
+    pytest.param(int(os.environ.get("HISTORY_STREAM_TEST_BYTES") or 3 * 1024 ** 3), marks=[
+        pytest.mark.slow,
+        pytest.mark.skipif(not os.environ.get("HISTORY_STREAM_TEST_BYTES"),
+                           reason="set HISTORY_STREAM_TEST_BYTES (e.g. 3221225472) to write a multi-GB log"),
+    ]),
+])
+def test_large_log_loads_under_memory_cap(tmp_path, size) -> None:
+    """Test that a log larger than the address space limit can be loaded and iterated."""
+    path = str(tmp_path / "history.bin")
+    _churned_log(path, size)
+    script = (
+        "import resource, sys\n"
+        "from app.history import History\n"
+        "resource.setrlimit(resource.RLIMIT_AS, (128 * 1024 * 1024, 128 * 1024 * 1024))\n"
+        "history = History()\n"
+        "history.load(sys.argv[1])\n"
+        "print(history.get_history(), sum(1 for _ in history.iter_history(sys.argv[1])))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script, path], capture_output=True, text=True,
+                            check=False, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == "['first', 'last'] 2"
+
+
+def test_spilling_history_bounds_resident_entries(tmp_path) -> None:
+    """Test that only the most recent entries stay in memory and the rest spill to disk."""
+    history = History(capacity=8)
+    expected = []
+    for i in range(100):
+        history.add_record("add", (float(i), 1.0), i + 1.0)
+        history.add_calculation(f"note {i}")
+        expected += [f"add {float(i)} 1.0 = {i + 1.0}", f"note {i}"]
+    stats = history.stats()
+    assert stats.resident <= 8
+    assert stats.spilled == 200 - stats.resident
+    assert stats.spilled_bytes > 0
+    assert history.get_history() == expected
+    assert history.history[3] == expected[3]
+    assert history.history[10:14] == expected[10:14]
+    assert "spilled to disk" in str(stats)
+
+
+def test_spilling_history_matches_unbounded_history(tmp_path) -> None:
+    """Test that undo, clear and incremental saves behave the same with and without spilling."""
+    path_bounded, path_unbounded = str(tmp_path / "bounded.bin"), str(tmp_path / "unbounded.bin")
+    bounded, unbounded = History(capacity=4), History(capacity=0)
+    rng = random.Random(7)
+    with patch('sys.stdout', new=StringIO()):
+        for step in range(600):
+            action = rng.random()
+            for history, path in ((bounded, path_bounded), (unbounded, path_unbounded)):
+                if action < 0.6:
+                    history.add_record("multi", (float(step), 2.0), step * 2.0)
+                elif action < 0.9:
+                    history.undo_last()
+                elif action < 0.92:
+                    history.clear_history()
+                else:
+                    history.save(path)
+            assert len(bounded.history) == len(unbounded.history)
+    assert bounded.get_history() == unbounded.get_history()
+    _silent_save(bounded, path_bounded)
+    assert _loaded(path_bounded) == unbounded.get_history()
+
+
+def test_load_into_spilling_history(tmp_path) -> None:
+    """Test that loading a saved history respects the capacity."""
+    path = str(tmp_path / "history.bin")
+    history = History(capacity=0)
+    for i in range(50):
+        history.add_record("div", (float(i), 4.0), i / 4.0)
+    _silent_save(history, path)
+    bounded = History(capacity=10)
+    with patch('sys.stdout', new=StringIO()):
+        bounded.load(path)
+    assert bounded.stats().resident <= 10
+    assert bounded.get_history() == history.get_history()
+
+
+def test_offset_index_follows_appends(tmp_path) -> None:
+    """Test that the offset index is kept current by incremental saves, undo and compaction."""
+    path = str(tmp_path / "history.bin")
+    history = History(capacity=0)
+    for i in range(30):
+        history.add_record("sub", (float(i), 1.0), i - 1.0)
+        history.add_calculation(f"note {i}")
+        if i % 4 == 0:
+            history.undo_last()
+        _silent_save(history, path)
+    with history.open_saved(path) as saved:
+        assert len(saved) == len(history.history)
+        assert list(saved) == history.get_history()
+        assert saved[-1] == history.history[-1]
+        assert saved[5:9] == history.history[5:9]
+    with patch('sys.stdout', new=StringIO()):
+        history.compact()
+    with history.open_saved(path) as saved:
+        assert list(saved) == history.get_history()
+
+
+def test_mapped_log_reads_entries_without_scanning(tmp_path, monkeypatch) -> None:
+    """Test that a current index is used for random access instead of replaying the log."""
+    path = str(tmp_path / "history.bin")
+    history = History(capacity=0)
+    for i in range(1000):
+        history.add_record("add", (float(i), 0.5), i + 0.5)
+    _silent_save(history, path)
+    monkeypatch.setattr(binlog.HistoryLog, "frames", None)
+    with binlog.MappedLog(path) as saved:
+        assert len(saved) == 1000
+        assert saved[737] == "add 737.0 0.5 = 737.5"
+
+
+def test_stale_offset_index_is_rebuilt(tmp_path) -> None:
+    """Test that a missing or outdated index is rebuilt from the log."""
+    path = str(tmp_path / "history.bin")
+    history = History(capacity=0)
+    history.add_calculation("a")
+    history.add_calculation("b")
+    _silent_save(history, path)
+    os.remove(binlog.index_path(path))
+    history.undo_last()
+    history.add_calculation("c")
+    _silent_save(history, path)
+    with binlog.MappedLog(path) as saved:
+        assert list(saved) == ["a", "c"]
+    with open(path, 'ab') as log_file:
+        log_file.write(binlog.encode_entry("d"))
+    with binlog.MappedLog(path) as saved:
+        assert list(saved) == ["a", "c", "d"]
+
+
+def _query_model(history: History, query: str) -> list:
+    from app.history.query import parse_query, scan  # pylint: disable=import-outside-toplevel
+    return scan(history.history.entries(), parse_query(query))
+
+
+@pytest.mark.parametrize("capacity", [0, 16])
+def test_where_matches_full_scan_through_changes(capacity, monkeypatch) -> None:
+    """Test that indexed queries agree with a full scan through adds, undo, clear and load."""
+    monkeypatch.setattr('app.history.query.MERGE_THRESHOLD', 8)
+    queries = ["op=div result>100", "result<=3", "op=multiply", "result>=2 result<50", "result=7.0"]
+    history = History(capacity=capacity)
+    rng = random.Random(3)
+    with patch('sys.stdout', new=StringIO()):
+        for step in range(400):
+            action = rng.random()
+            if action < 0.7:
+                operation = rng.choice(["add", "div", "multi"])
+                history.add_record(operation, (float(step), 2.0), float(rng.randint(0, 200)))
+            elif action < 0.75:
+                history.add_record("div", (1.0, 0.0), float("nan"))
+            elif action < 0.8:
+                history.add_calculation(f"note {step}")
+            elif action < 0.97:
+                history.undo_last()
+            else:
+                history.clear_history()
+            if step % 25 == 0:
+                for query in queries:
+                    assert history.where(query) == _query_model(history, query), query
+    for query in queries:
+        assert history.where(query) == _query_model(history, query), query
+
+
+def test_where_after_load(tmp_path) -> None:
+    """Test that the indexes describe the loaded history, not the one before it."""
+    path = str(tmp_path / "history.bin")
+    saved = History(capacity=0)
+    saved.add_record("div", (500.0, 2.0), 250.0)
+    _silent_save(saved, path)
+    history = History(capacity=0)
+    history.add_record("div", (900.0, 3.0), 300.0)
+    history.add_record("div", (900.0, 1.0), 900.0)
+    assert history.where("op=div result>100") == [0, 1]
+    with patch('sys.stdout', new=StringIO()):
+        history.load(path)
+    assert history.where("op=div result>100") == [0]
+
+
+def test_where_rejects_invalid_queries() -> None:
+    """Test query syntax errors."""
+    from app.history.query import QueryError  # pylint: disable=import-outside-toplevel
+    history = History()
+    for query in ["", "op>div", "size=3", "result>abc", "op=div and"]:
+        with pytest.raises(QueryError):
+            history.where(query)
+
+
+def test_sqlite_backend_saves_incrementally(tmp_path, monkeypatch) -> None:
+    """Test incremental saves with undo, batched inserts and batched reads in a SQLite history."""
+    monkeypatch.setattr(sqlite, "INSERT_BATCH_SIZE", 7)
+    monkeypatch.setattr(sqlite, "READ_BATCH_SIZE", 5)
+    path = str(tmp_path / "history.db")
+    history = History(capacity=0)
+    for i in range(30):
+        history.add_record("div", (float(i), 2.0), i / 2.0)
+        history.add_calculation(f"note {i}")
+        if i % 4 == 0:
+            history.undo_last()
+        _silent_save(history, path)
+    assert _loaded(path) == history.get_history()
+    assert list(History().iter_history(path)) == history.get_history()
+    with history.open_saved(path) as saved:
+        assert len(saved) == len(history.history)
+        assert saved[-1] == history.history[-1]
+        assert saved[5:9] == history.history[5:9]
+    with closing(sqlite.SQLiteLog(path).connect()) as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert connection.execute("SELECT COUNT(*) FROM entries WHERE operation = 'div'").fetchone()[0] == 30
+
+
+def test_history_backend_setting(tmp_path, monkeypatch) -> None:
+    """Test that HISTORY_BACKEND selects SQLite for other paths, and rejects unknown backends."""
+    path = str(tmp_path / "history.bin")
+    monkeypatch.setenv("HISTORY_BACKEND", "sqlite")
+    reload_config()
+    try:
+        history = History()
+        history.add_record("add", (1.0, 2.0), 3.0)
+        _silent_save(history, path)
+        with open(path, 'rb') as saved:
+            assert saved.read(16) == b"SQLite format 3\x00"
+        assert _loaded(path) == ["add 1.0 2.0 = 3.0"]
+        monkeypatch.setenv("HISTORY_BACKEND", "parquet")
+        with pytest.raises(ValueError, match="Unknown HISTORY_BACKEND"):
+            reload_config()
+    finally:
+        monkeypatch.undo()
+        reload_config()
+
+
+def test_sqlite_backend_rejects_other_files(tmp_path, capsys) -> None:
+    """Test loading a file that is not a SQLite history."""
+    path = tmp_path / "history.db"
+    path.write_bytes(b"not a database" * 100)
+    History().load(str(path))
+    assert "is not a history database" in capsys.readouterr().out
+
+
+def test_sqlite_backend_keeps_non_finite_numbers(tmp_path) -> None:
+    """Test that NaN and infinite operands and results are reloaded as they were saved."""
+    path = str(tmp_path / "history.db")
+    history = History(capacity=0)
+    history.add_record("add", (1.0, float("nan")), float("nan"))
+    history.add_record("sqrt", (float("nan"),), float("nan"))
+    history.add_record("multi", (float("inf"), -1.0), float("-inf"))
+    _silent_save(history, path)
+    expected = ["add 1.0 nan = nan", "sqrt nan = nan", "multi inf -1.0 = -inf"]
+    assert _loaded(path) == history.get_history() == expected
+    with history.open_saved(path) as saved:
+        assert list(saved) == expected
+    assert [len(entry.operands) for entry in sqlite.SQLiteLog(path).iter_entries()] == [2, 1, 2]
+
+
+@pytest.fixture
+def archive_settings(monkeypatch):
+    """Small segments and several threads for archive tests."""
+    monkeypatch.setenv("HISTORY_SEGMENT_SIZE", "16")
+    monkeypatch.setenv("HISTORY_ARCHIVE_THREADS", "4")
+    reload_config()
+    yield monkeypatch
+    monkeypatch.undo()
+    reload_config()
+
+
+def test_archive_rotates_segments_through_saves(tmp_path, archive_settings) -> None:  # pylint: disable=redefined-outer-name
+    """Test incremental saves with undo into a segmented archive, and reading it back."""
+    path = str(tmp_path / "history.archive")
+    history = History(capacity=0)
+    for i in range(60):
+        history.add_record("multi", (float(i), 3.0), i * 3.0)
+        history.add_calculation(f"note {i}")
+        if i % 7 == 0:
+            history.undo_last()
+        if i % 5 == 0:
+            _silent_save(history, path)
+    _silent_save(history, path)
+    manifest = archive.ArchiveLog(path).manifest()
+    assert [segment["entries"] for segment in manifest["segments"]] == [16] * 6 + [len(history.history) - 96]
+    assert sorted(os.listdir(path)) == sorted([archive.MANIFEST] + [s["file"] for s in manifest["segments"]])
+    assert _loaded(path) == history.get_history()
+    assert list(History().iter_history(path)) == history.get_history()
+    with history.open_saved(path) as saved:
+        assert len(saved) == len(history.history)
+        assert saved[-1] == history.history[-1]
+        assert saved[14:19] == history.history[14:19]
+
+
+def test_archive_codec_change_and_damage(tmp_path, archive_settings) -> None:  # pylint: disable=redefined-outer-name
+    """Test that switching codec recompresses the archive and that damaged segments are reported."""
+    path = str(tmp_path / "history.archive")
+    history = History(capacity=0)
+    for i in range(40):
+        history.add_record("add", (float(i), 1.0), i + 1.0)
+    _silent_save(history, path)
+    archive_settings.setenv("HISTORY_ARCHIVE_CODEC", "lzma")
+    reload_config()
+    history = History(capacity=0)
+    with patch('sys.stdout', new=StringIO()):
+        history.load(path)
+    history.add_calculation("last")
+    _silent_save(history, path)
+    manifest = archive.ArchiveLog(path).manifest()
+    assert manifest["codec"] == "lzma"
+    assert all(segment["file"].endswith(".xz") for segment in manifest["segments"])
+    assert _loaded(path) == history.get_history()
+
+    with open(os.path.join(path, manifest["segments"][1]["file"]), "wb") as segment_file:
+        segment_file.write(lzma.compress(b"truncated"))
+    with patch('sys.stdout', new=StringIO()) as output:
+        History().load(path)
+    assert "is damaged" in output.getvalue()
+
+
+def test_archive_backend_default_path(tmp_path, archive_settings) -> None:  # pylint: disable=redefined-outer-name
+    """Test that HISTORY_BACKEND=archive saves to history.archive, and that a file in the way is reported."""
+    archive_settings.setenv("HISTORY_BACKEND", "archive")
+    archive_settings.chdir(tmp_path)
+    reload_config()
+    with patch('sys.stdout', new=StringIO()):
+        calculator(["add 1 2", "save"])
+    assert os.path.isdir("history.archive") and not os.path.exists("history.bin")
+    assert _loaded("history.archive") == ["add 1.0 2.0 = 3.0"]
+
+    path = tmp_path / "other.archive"
+    path.write_bytes(b"not an archive")
+    history = History()
+    history.add_calculation("kept")
+    with patch('sys.stdout', new=StringIO()) as output:
+        history.save(str(path))
+    assert output.getvalue() == f"{path} is a file, not a history archive directory.\n"
+    assert path.read_bytes() == b"not an archive"
@@ -0,0 +1,219 @@
+"""tests/test_journal.py
+
+Tests for autosaving a history through the write-ahead journal, including crashes mid-write.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.calculator import calculator
+from app.config import reload_config
+from app.history import History, SharedHistory, binlog, journal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(name="autosave_settings")
+def fixture_autosave_settings(monkeypatch):
+    """Commits every change and never checkpoints on a timer, unless a test changes it."""
+    monkeypatch.setenv("HISTORY_JOURNAL_COMMIT_INTERVAL", "0")
+    monkeypatch.setenv("HISTORY_CHECKPOINT_INTERVAL", "0")
+    reload_config()
+    yield monkeypatch
+    monkeypatch.undo()
+    reload_config()
+
+
+def _crash_after(path, script):
+    """Runs script against a history autosaving to path in a child process that then dies without cleanup."""
+    code = ("import os, sys\n"
+            "from app.history import History\n"
+            "history = History()\n"
+            "history.start_autosave(sys.argv[1])\n"
+            f"{script}\n"
+            "os._exit(1)\n")
+    result = subprocess.run([sys.executable, "-c", code, path], capture_output=True, text=True, check=False,
+                            cwd=ROOT, env={**os.environ, "PYTHONPATH": ROOT})
+    assert result.returncode == 1, result.stderr
+
+
+def _saved(path):
+    history = History(capacity=0)
+    history.load(path)
+    return list(history.get_history())
+
+
+@pytest.mark.usefixtures("autosave_settings")
+def test_autosave_checkpoints_every_kind_of_change(tmp_path) -> None:
+    """Test that adds, undo, redo and clear (and undoing the clear) all reach the saved history."""
+    path = str(tmp_path / "history.bin")
+    history = History()
+    assert history.start_autosave(path) == 0
+    for index in range(5):
+        history.add_record("add", (float(index), 1.0), index + 1.0)
+    history.undo_last()
+    history.undo_last()
+    assert history.redo_last()
+    history.add_calculation("note")
+    history.save(path)
+    assert _saved(path) == list(history.get_history())
+    history.clear_history()
+    history.save(path)
+    assert not _saved(path)
+    history.undo_last()
+    history.stop_autosave()
+    assert _saved(path) == list(history.get_history()) == [
+        "add 0.0 1.0 = 1.0", "add 1.0 1.0 = 2.0", "add 2.0 1.0 = 3.0", "add 3.0 1.0 = 4.0", "note"]
+    assert not os.path.exists(journal.journal_path(path))
+
+
+@pytest.mark.usefixtures("autosave_settings")
+def test_start_autosave_loads_the_saved_history(tmp_path) -> None:
+    """Test that autosave resumes from the saved history, which replaces the current one."""
+    path = str(tmp_path / "history.bin")
+    history = History()
+    history.add_calculation("first")
+    history.start_autosave(path)
+    history.stop_autosave()
+    resumed = History()
+    resumed.add_calculation("discarded")
+    resumed.start_autosave(path)
+    resumed.add_calculation("second")
+    resumed.stop_autosave()
+    assert _saved(path) == ["first", "second"]
+
+
+@pytest.mark.usefixtures("autosave_settings")
+@pytest.mark.parametrize("name", ["history.bin", "history.db", "history.archive"])
+def test_recovery_after_a_crash(tmp_path, name) -> None:
+    """Test that changes journaled before a crash are recovered into each backend on the next start."""
+    path = str(tmp_path / name)
+    _crash_after(path, "\n".join([
+        "for i in range(10): history.add_record('add', (float(i), 1.0), i + 1.0)",
+        "history.save(sys.argv[1])",
+        "history.undo_last()",
+        "history.add_calculation('after the checkpoint')",
+    ]))
+    assert os.path.exists(journal.journal_path(path))
+    history = History()
+    assert history.start_autosave(path) == 2
+    expected = [f"add {float(i)} 1.0 = {i + 1.0}" for i in range(9)] + ["after the checkpoint"]
+    assert list(history.get_history()) == expected
+    history.add_calculation("after recovery")
+    history.stop_autosave()
+    assert _saved(path) == expected + ["after recovery"]
+
+
+@pytest.mark.usefixtures("autosave_settings")
+def test_torn_and_corrupt_batches_are_ignored(tmp_path) -> None:
+    """Test that a batch cut short or damaged mid-write is dropped along with everything after it."""
+    path = str(tmp_path / "history.bin")
+    _crash_after(path, "for i in range(3): history.add_calculation(f'entry {i}')")
+    journal_file = journal.journal_path(path)
+    with open(journal_file, "rb") as source:
+        data = source.read()
+    batch = journal.BATCH.size + binlog.FRAME.size + len("entry 0")
+
+    # The last batch cut short by a crash while it was written.
+    with open(journal_file, "wb") as target:
+        target.write(data[:-3])
+    assert journal.read_journal(journal_file)[1] == [(binlog.ADD, b"entry 0"), (binlog.ADD, b"entry 1")]
+
+    # A damaged byte in the second batch: the second and third are dropped.
+    damaged = bytearray(data)
+    damaged[journal.HEADER.size + batch + journal.BATCH.size + binlog.FRAME.size] ^= 0xFF
+    with open(journal_file, "wb") as target:
+        target.write(bytes(damaged))
+    history = History()
+    assert history.start_autosave(path) == 1
+    assert list(history.get_history()) == ["entry 0"]
+    history.stop_autosave()
+
+
+@pytest.mark.usefixtures("autosave_settings")
+def test_crash_during_a_checkpoint_is_recovered_once(tmp_path) -> None:
+    """Test that a journal applied before a crash kept it from being deleted is not applied twice."""
+    path = str(tmp_path / "history.bin")
+    _crash_after(path, "\n".join([
+        "history.add_calculation('kept')",
+        "history.add_calculation('undone')",
+        "history.undo_last()",
+        "history.add_calculation('last')",
+    ]))
+    # The checkpoint renamed the journal and applied it, then the process died.
+    os.replace(journal.journal_path(path), journal.checkpoint_path(path))
+    journal.apply_journal(journal.checkpoint_path(path), journal.open_log(path))
+    history = History()
+    assert history.start_autosave(path) == 4
+    assert list(history.get_history()) == ["kept", "last"]
+    history.stop_autosave()
+    assert not os.path.exists(journal.checkpoint_path(path))
+    assert _saved(path) == ["kept", "last"]
+
+
+def test_group_commit_fsyncs_once_per_interval(tmp_path, autosave_settings) -> None:
+    """Test that changes made within one commit interval are written as one batch with one fsync."""
+    autosave_settings.setenv("HISTORY_JOURNAL_COMMIT_INTERVAL", "3600")
+    reload_config()
+    path = str(tmp_path / "history.bin")
+    history = History()
+    history.start_autosave(path)
+    fsyncs = []
+    real_fsync = os.fsync
+    autosave_settings.setattr(journal.os, "fsync", lambda fd: fsyncs.append(fd) or real_fsync(fd))
+    for index in range(1000):
+        history.add_calculation(f"entry {index}")
+    assert not fsyncs and not journal.read_journal(journal.journal_path(path))[1]
+    history._journal.commit()  # pylint: disable=protected-access
+    assert len(fsyncs) == 1
+    assert len(journal.read_journal(journal.journal_path(path))[1]) == 1000
+    history.stop_autosave()
+    assert len(_saved(path)) == 1000
+
+
+def test_background_checkpoints(tmp_path, autosave_settings) -> None:
+    """Test that the checkpoint thread folds the journal into the saved history on its own."""
+    autosave_settings.setenv("HISTORY_JOURNAL_COMMIT_INTERVAL", "0.01")
+    autosave_settings.setenv("HISTORY_CHECKPOINT_INTERVAL", "0.05")
+    reload_config()
+    path = str(tmp_path / "history.bin")
+    history = SharedHistory()
+    history.start_autosave(path)
+    history.add_calculation("checkpointed")
+    deadline = time.monotonic() + 10
+    while _saved(path) != ["checkpointed"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _saved(path) == ["checkpointed"]
+    history.compact(path)
+    history.add_calculation("after compact")
+    history.stop_autosave()
+    assert _saved(path) == ["checkpointed", "after compact"]
+
+
+def test_calculator_autosaves(tmp_path, autosave_settings, capsys) -> None:
+    """Test that HISTORY_AUTOSAVE=1 saves batch results without a save command."""
+    autosave_settings.setenv("HISTORY_AUTOSAVE", "1")
+    autosave_settings.chdir(tmp_path)
+    reload_config()
+    calculator(["add 1 2", "multiply 2 3", "undo"])
+    calculator(["add 5 5"])
+    capsys.readouterr()
+    assert _saved("history.bin") == ["add 1.0 2.0 = 3.0", "add 5.0 5.0 = 10.0"]
+    assert not os.path.exists("history.bin.journal")
+
+
+def test_calculator_runs_without_autosave_when_it_cannot_start(tmp_path, autosave_settings, capsys) -> None:
+    """Test that a saved history autosave cannot open is reported and the calculator still runs."""
+    autosave_settings.setenv("HISTORY_AUTOSAVE", "1")
+    autosave_settings.chdir(tmp_path)
+    reload_config()
+    (tmp_path / "history.bin").write_bytes(b"not a history log")
+    calculator(["add 1 2"])
+    captured = capsys.readouterr()
+    assert captured.out == "Result: 3.0\n"
+    assert "Autosave is off: history.bin is not a history log." in captured.err
+    assert not os.path.exists("history.bin.journal")
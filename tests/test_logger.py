@@ -0,0 +1,129 @@
+"""tests/test_logger.py
+
+Tests for the queue-based logging pipeline.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from io import StringIO
+
+from app.calculator import run_batch
+from app.config import reload_config
+from app.logger import configure_logging, shutdown_logging
+
+
+@contextmanager
+def bare_root_logger():
+    """Detach the root logger's handlers (pytest installs its own) while in the block."""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    for handler in handlers:
+        root.removeHandler(handler)
+    try:
+        yield root
+    finally:
+        shutdown_logging()
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+
+
+def test_records_reach_the_file(tmp_path) -> None:
+    """Test that queued records are written to the log file by shutdown."""
+    log_file = tmp_path / "calc.log"
+    with bare_root_logger() as root:
+        assert configure_logging(str(log_file))
+        logging.info("Calculation performed: %s", "add 1.0 2.0 = 3.0")
+        logging.debug("not written at INFO level")
+        shutdown_logging()
+        assert not root.handlers
+    contents = log_file.read_text(encoding="utf-8")
+    assert "INFO - Calculation performed: add 1.0 2.0 = 3.0" in contents
+    assert "not written" not in contents
+
+
+def test_formatting_happens_off_the_calling_thread(tmp_path) -> None:
+    """Test that %-style arguments are rendered by the listener thread, not the caller."""
+    rendered_on = []
+
+    class Probe:  # pylint: disable=too-few-public-methods
+        """Argument that records which thread rendered it."""
+        def __str__(self):
+            rendered_on.append(threading.current_thread())
+            return "probe"
+
+    with bare_root_logger():
+        configure_logging(str(tmp_path / "calc.log"))
+        logging.info("value: %s", Probe())
+        shutdown_logging()
+    assert rendered_on and threading.current_thread() not in rendered_on
+
+
+def test_existing_handlers_are_left_alone(tmp_path) -> None:
+    """Test that configuration is skipped when the root logger is already configured."""
+    assert logging.getLogger().handlers
+    assert not configure_logging(str(tmp_path / "calc.log"))
+    assert not (tmp_path / "calc.log").exists()
+
+
+@contextmanager
+def log_settings(monkeypatch, **settings):
+    """Sets LOG_* variables for one configure_logging call."""
+    for name, value in settings.items():
+        monkeypatch.setenv(name, str(value))
+    reload_config()
+    try:
+        yield
+    finally:
+        for name in settings:
+            monkeypatch.delenv(name)
+        reload_config()
+
+
+def test_sampling_keeps_one_in_n_and_summarizes(tmp_path, monkeypatch) -> None:
+    """Test 1-in-N sampling per record type, with errors always written and a final summary."""
+    log_file = tmp_path / "calc.log"
+    with log_settings(monkeypatch, LOG_SAMPLE_RATE=10, LOG_SUMMARY_INTERVAL=3600), bare_root_logger():
+        configure_logging(str(log_file))
+        run_batch(["add 1 2"] * 100 + ["div 1 0"] * 3 + ["history"] * 5, out=StringIO())
+        shutdown_logging()
+    lines = log_file.read_text(encoding="utf-8").splitlines()
+    summary = [line for line in lines if "Log summary" in line]
+    lines = [line for line in lines if line not in summary]
+    assert sum("Calculation performed" in line for line in lines) == 10
+    assert sum("Division by zero" in line for line in lines) == 3
+    assert sum("History retrieved" in line for line in lines) == 1
+    assert len(summary) == 1
+    assert "100 add ops, 5 'History retrieved.', 3 division_by_zero errors" in summary[0]
+    assert "(110 records, 94 not written)" in summary[0]
+
+
+def test_rate_limit_per_record_type(tmp_path, monkeypatch) -> None:
+    """Test that at most LOG_RATE_LIMIT records of each type are written per second, with the drops summarized."""
+    log_file = tmp_path / "calc.log"
+    with log_settings(monkeypatch, LOG_RATE_LIMIT=5), bare_root_logger():
+        configure_logging(str(log_file))
+        for _ in range(50):
+            logging.info("first type")
+            logging.warning("second type %s", 1)
+        shutdown_logging()
+    *lines, summary = log_file.read_text(encoding="utf-8").splitlines()
+    assert sum("first type" in line for line in lines) == 5
+    assert sum("second type" in line for line in lines) == 5
+    assert "50 'first type', 50 'second type %s' (100 records, 90 not written)." in summary
+
+
+def test_log_file_is_rotated(tmp_path, monkeypatch) -> None:
+    """Test that the log is rotated at LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT files."""
+    log_file = tmp_path / "calc.log"
+    with log_settings(monkeypatch, LOG_MAX_BYTES=2000, LOG_BACKUP_COUNT=2), bare_root_logger():
+        configure_logging(str(log_file))
+        for index in range(500):
+            logging.info("record %d", index)
+        shutdown_logging()
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert files == ["calc.log", "calc.log.1", "calc.log.2"]
+    for name in files:
+        assert (tmp_path / name).stat().st_size < 2100
+    assert "record 499" in log_file.read_text(encoding="utf-8")
@@ -0,0 +1,99 @@
+"""tests/test_metrics.py
+
+Tests for the command counters, latency histograms and the Prometheus export.
+"""
+
+import time
+from io import StringIO
+
+import pytest
+
+from app.calculator import run_batch
+from app.config import reload_config
+from app.metrics import Histogram, configure_metrics, get_metrics, shutdown_metrics
+
+
+@pytest.fixture(autouse=True)
+def metrics_enabled(monkeypatch):
+    """Metrics are opt-in; turn them on for these tests."""
+    monkeypatch.setenv("METRICS_ENABLED", "1")
+    reload_config()
+    yield
+    monkeypatch.undo()
+    reload_config()
+
+
+@pytest.fixture
+def metrics():
+    """Fresh process metrics for one test."""
+    shutdown_metrics()
+    configure_metrics()
+    yield get_metrics()
+    shutdown_metrics()
+
+
+def test_histogram_buckets_and_quantiles() -> None:
+    """Test that observations land in power-of-two buckets."""
+    histogram = Histogram()
+    for nanoseconds in (100, 100, 100, 5000):
+        histogram.observe(nanoseconds)
+    assert histogram.count == 4
+    assert histogram.cumulative(7) == 3
+    assert histogram.cumulative(13) == 4
+    assert histogram.quantile(0.5) == 128e-9
+    assert histogram.quantile(1.0) == 8192e-9
+    assert histogram.mean == pytest.approx(1325e-9)
+
+
+def test_commands_errors_and_stages_are_counted(metrics) -> None:  # pylint: disable=redefined-outer-name
+    """Test per-command counts, error kinds and stage histograms from a batch."""
+    out = StringIO()
+    run_batch(["add 1 2", "add 3 4", "div 1 0", "ad 1 2", "foo", "", "history", "stats"], out=out)
+    assert metrics.commands == {"add": 2, "div": 1, "invalid": 2, "empty": 1, "history": 1, "stats": 1}
+    assert metrics.errors == {"division_by_zero": 1, "unknown_operation": 1, "invalid_input": 1, "empty_input": 1}
+    assert [histogram.count for histogram in metrics.stages["add"]] == [2] * 5
+    assert "div" not in metrics.stages
+    assert "Metrics: 7 commands, 4 errors" in out.getvalue()
+    assert "mean by stage: dispatch" in out.getvalue()
+
+
+def test_parallel_batches_are_counted(metrics) -> None:  # pylint: disable=redefined-outer-name
+    """Test that results computed by workers are counted like a sequential batch, errors included."""
+    from app.calculator.parallel import run_parallel  # pylint: disable=import-outside-toplevel
+
+    lines = ["add 1 2", "add 3 4", "div 1 0", "(1 + 2) * 3", "ad 1 2", "history"]
+    run_parallel(lines, workers=1, chunk_size=2, out=StringIO())
+    parallel = (dict(metrics.commands), dict(metrics.errors))
+    metrics.reset()
+    run_batch(lines, out=StringIO())
+    assert parallel == (metrics.commands, metrics.errors)
+    assert parallel[0]["add"] == 2 and parallel[1]["division_by_zero"] == 1
+
+
+def test_prometheus_text(metrics) -> None:  # pylint: disable=redefined-outer-name
+    """Test the exposition format of counters and cumulative histogram buckets."""
+    run_batch(["mul 1 2", "multi 2 3", "div 1 0"], out=StringIO())
+    text = metrics.prometheus()
+    assert "# TYPE calculator_commands_total counter\n" in text
+    assert 'calculator_commands_total{command="multi"} 1\n' in text
+    assert 'calculator_errors_total{kind="division_by_zero"} 1\n' in text
+    assert 'calculator_command_duration_seconds_bucket{command="multi",le="+Inf"} 1\n' in text
+    assert 'calculator_stage_duration_seconds_count{command="multi",stage="compute"} 1\n' in text
+
+
+def test_exporter_writes_file_periodically(tmp_path) -> None:
+    """Test that the exporter thread rewrites the file and writes once more on shutdown."""
+    path = tmp_path / "calculator.prom"
+    shutdown_metrics()
+    assert configure_metrics(str(path), interval=0.01)
+    try:
+        run_batch(["add 1 1"], out=StringIO())
+        deadline = time.monotonic() + 5
+        while not path.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert 'calculator_commands_total{command="add"} 1' in path.read_text(encoding="utf-8")
+        run_batch(["add 2 2"], out=StringIO())
+    finally:
+        shutdown_metrics()
+    assert 'calculator_commands_total{command="add"} 2' in path.read_text(encoding="utf-8")
+    assert get_metrics() is None
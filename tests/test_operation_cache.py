@@ -0,0 +1,94 @@
+""" tests/test_operation_cache.py """
+from io import StringIO
+
+import pytest
+
+from app.calculator import run_batch
+from app.operations import Operation, OperationCache, get_operation
+
+
+def counting(func):
+    """Wrap func in an Operation that counts how often it is really called."""
+    calls = []
+
+    def wrapped(*args):
+        calls.append(args)
+        return func(*args)
+    return Operation("counted", wrapped), calls
+
+
+def test_repeated_operands_hit_the_cache():
+    """Test that the second identical call is served from the cache."""
+    cache = OperationCache(capacity=8)
+    operation, calls = counting(lambda a, b: a ** b)
+    assert cache.call(operation, (2.0, 10.0)) == 1024.0
+    assert cache.call(operation, (2.0, 10.0)) == 1024.0
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.hit_rate) == (1, 1, 0.5)
+
+
+def test_least_recently_used_entry_is_evicted():
+    """Test that capacity is enforced by evicting the least recently used result."""
+    cache = OperationCache(capacity=2)
+    operation, calls = counting(lambda a, b: a + b)
+    cache.call(operation, (1.0, 1.0))
+    cache.call(operation, (2.0, 2.0))
+    cache.call(operation, (1.0, 1.0))
+    cache.call(operation, (3.0, 3.0))
+    assert cache.stats().evictions == 1
+    cache.call(operation, (1.0, 1.0))
+    assert len(calls) == 3
+    cache.call(operation, (2.0, 2.0))
+    assert len(calls) == 4
+
+
+def test_nan_and_signed_zero_keys():
+    """Test that NaNs share a key while 0.0 and -0.0 do not."""
+    cache = OperationCache()
+    operation, calls = counting(lambda a, b: a * b)
+    cache.call(operation, (float("nan"), 1.0))
+    cache.call(operation, (float("nan"), 1.0))
+    assert len(calls) == 1
+    assert str(cache.call(operation, (5.0, 0.0))) == "0.0"
+    assert str(cache.call(operation, (5.0, -0.0))) == "-0.0"
+
+
+def test_errors_are_not_cached():
+    """Test that a call that raises is retried instead of cached."""
+    cache = OperationCache()
+    division = get_operation("div")
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.call(division, (1.0, 0.0))
+    assert len(cache) == 0
+    assert cache.stats().misses == 2
+
+
+def test_ttl_expires_entries(monkeypatch):
+    """Test that results older than the TTL are recomputed."""
+    now = [100.0]
+    monkeypatch.setattr("app.operations.cache.time.monotonic", lambda: now[0])
+    cache = OperationCache(ttl=5)
+    operation, calls = counting(lambda a, b: a - b)
+    cache.call(operation, (3.0, 1.0))
+    now[0] += 6
+    cache.call(operation, (3.0, 1.0))
+    assert len(calls) == 2
+    assert cache.stats().expirations == 1
+
+
+def test_cache_command():
+    """Test the cache command output with and without a cache."""
+    out = StringIO()
+    run_batch(["cache"], out=out)
+    assert "Operation cache is disabled." in out.getvalue()
+
+    out = StringIO()
+    run_batch(["expo 3 4", "expo 3 4", "cache", "cache clear", "cache"], out=out, cache=OperationCache(16))
+    lines = out.getvalue().splitlines()
+    assert lines[2] == ("Cache: 1/16 entries, 1 hits, 1 misses, 0 evictions, 0 expirations, "
+                        "hit rate 50.0%")
+    assert lines[3].startswith("Expression cache: ")
+    assert lines[4] == "Operation cache cleared."
+    assert lines[5].startswith("Cache: 0/16 entries, 0 hits")
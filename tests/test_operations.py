@@ -1,6 +1,10 @@
 """ tests/test_operations.py """
 import pytest
+from app.calculator import calculator
 from app.operations import addition, subtraction, multiplication, division
+from app.operations import (
+    Operation, get_operation, load_plugins, operation_names, register, unregister,
+)
 
 
 def test_addition_positive():
@@ -58,3 +62,59 @@ def test_division_by_zero():
     """Test division by zero."""
     with pytest.raises(ValueError, match="Division by zero is not allowed."):
         division(1, 0)
+
+
+def test_registry_lookup_by_name_and_alias():
+    """Test that names and aliases resolve to the same operation."""
+    assert get_operation("sub") is get_operation("subtract")
+    assert get_operation("sub").func(5, 3) == 2
+    assert get_operation("unknown") is None
+    assert operation_names() == ["add", "sub", "multi", "div", "expo", "mod"]
+
+
+def test_registry_rejects_duplicate_names():
+    """Test that an operation cannot silently take over an existing name."""
+    with pytest.raises(ValueError, match="already registered"):
+        register(Operation("add", lambda a, b: a))
+
+
+def test_registry_vectorized_is_imported_lazily():
+    """Test that the array implementation is resolved from its dotted path."""
+    assert get_operation("div").vectorized([1.0], [0.0]).errors.tolist() == [True]
+
+
+def test_registered_operation_is_dispatched(capsys):
+    """Test that calculator() picks up newly registered operations without changes."""
+    register(Operation("neg", lambda a: -a, arity=1, label="negate"))
+    try:
+        calculator(["neg 4", "help", "ad 1 2"])
+        output = capsys.readouterr().out
+        assert "Result: -4.0" in output
+        assert "Math Functions: add, sub, multi, div, expo, mod, neg." in output
+        assert "Supported operations: add, subtract, multiply, divide, exponent, modulus, negate." in output
+    finally:
+        unregister("neg")
+    assert get_operation("neg") is None
+
+
+def test_load_plugins_from_entry_points(monkeypatch):
+    """Test that plugins are registered from entry points and broken ones are skipped."""
+    class FakeEntryPoint:  # pylint: disable=too-few-public-methods
+        """Minimal stand-in for importlib.metadata.EntryPoint."""
+        def __init__(self, name, value):
+            self.name = name
+            self.value = name
+            self._value = value
+
+        def load(self):
+            """Return the advertised object."""
+            return self._value
+
+    plugins = [FakeEntryPoint("hypot", Operation("hypot", lambda a, b: (a * a + b * b) ** 0.5)),
+               FakeEntryPoint("broken", object())]
+    monkeypatch.setattr("importlib.metadata.entry_points", lambda group: plugins)
+    try:
+        assert load_plugins(force=True) == 1
+        assert get_operation("hypot").func(3, 4) == 5
+    finally:
+        unregister("hypot")
@@ -0,0 +1,75 @@
+"""tests/test_parallel.py
+
+Tests for parallel batch mode.
+"""
+
+import os
+from io import StringIO
+
+import pytest
+from app.calculator import run_batch
+from app.calculator.parallel import evaluate_chunk, run_parallel
+from app.history import History
+from app.operations import OperationCache
+
+COMMANDS = [
+    "add 2 3", "div 1 0", "(3 + 4) ^ 2 % 5", "mod(7, 3)", "undo", "history",
+    "multi 4 5", "ad 1 2", "", "add (1 +", "clear", "sub 10 4", "history",
+]
+
+
+def _crash(lines):
+    os._exit(1)  # pylint: disable=protected-access
+
+
+def test_parallel_matches_sequential_batch() -> None:
+    """Test that output and history match run_batch, including stateful commands between chunks."""
+    lines = COMMANDS * 20
+    sequential, parallel = StringIO(), StringIO()
+    sequential_history, parallel_history = History(), History()
+    run_batch(lines, out=sequential, history=sequential_history)
+    stats = run_parallel(lines, workers=2, chunk_size=7, out=parallel, history=parallel_history)
+    assert stats.lines == len(lines)
+    assert parallel.getvalue() == sequential.getvalue()
+    assert parallel_history.get_history() == sequential_history.get_history()
+
+
+def test_parallel_stops_at_exit() -> None:
+    """Test that lines after 'exit' are neither printed nor recorded."""
+    out = StringIO()
+    history = History()
+    stats = run_parallel(["add 1 1", "exit"] + ["add 2 2"] * 50, workers=2, chunk_size=4, out=out, history=history)
+    assert stats.lines == 2
+    assert "Result: 4.0" not in out.getvalue()
+    assert history.get_history() == ["add 1.0 1.0 = 2.0"]
+
+
+def test_evaluate_chunk_leaves_stateful_lines() -> None:
+    """Test that workers only compute stateless lines."""
+    outcomes = evaluate_chunk(["add 1 2", "history", "div 1 0", "add (1 +", "3 * 2 + 1"])
+    assert outcomes[0][1:] == ("add", [1.0, 2.0], 3.0)
+    assert outcomes[1] is None
+    assert outcomes[2][1] == "Division by zero is not allowed."
+    assert outcomes[3] is None
+    assert outcomes[4][1:] == ("3 * 2 + 1", 7.0, None)
+
+
+def test_worker_failure_falls_back_to_in_process(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the chunks of a crashed worker, and every chunk after it, are executed in the main process."""
+    monkeypatch.setattr("app.calculator.parallel.evaluate_chunk", _crash)
+    lines = [f"add {i} 1" for i in range(9)] + ["history"]
+    out = StringIO()
+    # Five chunks for one worker: the pool breaks while later chunks are still to be submitted.
+    stats = run_parallel(lines, workers=1, chunk_size=2, out=out)
+    assert stats.lines == 10
+    expected = [f"add {float(i)} 1.0 = {i + 1.0}" for i in range(9)]
+    assert out.getvalue().splitlines() == [f"Result: {i + 1.0}" for i in range(9)] + ["Calculation History:"] + expected
+
+
+def test_parallel_uses_the_operation_cache() -> None:
+    """Test that lines executed in the main process go through the caller's cache, as in run_batch."""
+    cache = OperationCache(16)
+    out = StringIO()
+    run_parallel(["expo 2 10 mod 7"] * 5, workers=1, chunk_size=2, out=out, cache=cache)
+    assert out.getvalue() == "Result: 2.0\n" * 5
+    assert cache.misses == 1 and cache.hits == 4
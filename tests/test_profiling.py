@@ -0,0 +1,130 @@
+"""tests/test_profiling.py
+
+Tests for the profiling hooks: whole-run profiles and profile start/stop windows.
+"""
+
+import os
+import pstats
+import subprocess
+import sys
+import time
+from io import StringIO
+
+import pytest
+
+from app.calculator import main, run_batch
+from app.config import reload_config
+from app.profiling import ProfilingError, active_profile, collapsed_from_stats, start_profile, stop_profile
+
+
+@pytest.fixture
+def profile_output(tmp_path, monkeypatch):
+    """Points PROFILE_OUTPUT at a temporary directory."""
+    prefix = tmp_path / "profile"
+    monkeypatch.setenv("PROFILE_OUTPUT", str(prefix))
+    monkeypatch.setenv("PROFILE_INTERVAL", "0.001")
+    reload_config()
+    yield prefix
+    if active_profile() is not None:
+        stop_profile(str(prefix))
+    monkeypatch.undo()
+    reload_config()
+
+
+def _parse_collapsed(path):
+    stacks = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        stack, weight = line.rsplit(" ", 1)
+        stacks[stack] = int(weight)
+    return stacks
+
+
+def test_profile_window_writes_pstats_and_collapsed(profile_output) -> None:  # pylint: disable=redefined-outer-name
+    """Test that profile start/stop captures the commands in between."""
+    out = StringIO()
+    run_batch(["profile", "profile start", "profile start"] + ["expo 3 2000"] * 2000 + ["profile stop", "profile"],
+              out=out)
+    output = out.getvalue()
+    assert "No profile is running." in output
+    assert "Profiling with cprofile." in output
+    assert "A cprofile profile is already running." in output
+    assert f"Profile written to {profile_output}-1.pstats, {profile_output}-1.collapsed." in output
+    assert output.rstrip().endswith("No profile is running.")
+
+    stats = pstats.Stats(f"{profile_output}-1.pstats")
+    assert any(name == "expo" for _, _, name in stats.stats)  # pylint: disable=no-member
+    stacks = _parse_collapsed(profile_output.parent / "profile-1.collapsed")
+    assert any("execute_command" in stack and stack.endswith("expo") for stack in stacks)
+
+
+def test_profile_usage_and_errors(profile_output) -> None:  # pylint: disable=redefined-outer-name,unused-argument
+    """Test stopping without a profile and unknown profilers."""
+    out = StringIO()
+    run_batch(["profile stop", "profile start perf", "profile bogus"], out=out)
+    assert out.getvalue().splitlines() == [
+        "No profile is running.",
+        "Unknown profiler 'perf'. Choose one of: cprofile, sample.",
+        "Usage: profile start [cprofile|sample], profile stop, profile",
+    ]
+    with pytest.raises(ProfilingError):
+        stop_profile()
+
+
+def test_sampling_profiler_records_stacks(profile_output) -> None:  # pylint: disable=redefined-outer-name
+    """Test that the sampling profiler folds the stacks of the profiled thread."""
+    profiler = start_profile("sample")
+    deadline = time.perf_counter() + 0.2
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    paths = stop_profile(str(profile_output))
+    assert paths == [f"{profile_output}.collapsed"]
+    assert sum(profiler.samples.values()) > 10
+    stacks = _parse_collapsed(profile_output.parent / "profile.collapsed")
+    assert any("test_sampling_profiler_records_stacks" in stack for stack in stacks)
+
+
+def test_collapsed_from_stats_splits_time_between_callers() -> None:
+    """Test that a function's own time is divided among its callers."""
+    root, left, right, leaf = (("f.py", line, name) for line, name in
+                               ((1, "root"), (2, "left"), (3, "right"), (4, "leaf")))
+    stats = {
+        root: (1, 1, 0.001, 0.010, {}),
+        left: (1, 1, 0.001, 0.007, {root: (1, 1, 0.001, 0.007)}),
+        right: (1, 1, 0.000, 0.002, {root: (1, 1, 0.000, 0.002)}),
+        leaf: (2, 2, 0.008, 0.008, {left: (1, 1, 0.006, 0.006), right: (1, 1, 0.002, 0.002)}),
+    }
+    assert dict(collapsed_from_stats(stats)) == {
+        "f.py:root": 1000,
+        "f.py:root;f.py:left": 1000,
+        "f.py:root;f.py:left;f.py:leaf": 6000,
+        "f.py:root;f.py:right;f.py:leaf": 2000,
+    }
+
+
+def test_collapsed_export_of_a_whole_repl_session(tmp_path) -> None:
+    """Test that folding a real cProfile of a REPL session, imports and all, finishes quickly."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = ("import builtins, sys\n"
+            "from app.profiling import profiled\n"
+            "commands = iter(['add 1 2', 'export', 'exit'])\n"
+            "builtins.input = lambda prompt='': next(commands)\n"
+            "with profiled('cprofile', sys.argv[1]):\n"
+            "    from app.calculator import calculator\n"
+            "    calculator()\n")
+    result = subprocess.run([sys.executable, "-c", code, str(tmp_path / "repl")], capture_output=True, text=True,
+                            check=False, cwd=tmp_path, env={**os.environ, "PYTHONPATH": root}, timeout=60)
+    assert result.returncode == 0, result.stderr
+    stacks = _parse_collapsed(tmp_path / "repl.collapsed")
+    assert any(stack.endswith("__init__.py:calculator") for stack in stacks)
+    assert max(stack.count(";") + 1 for stack in stacks) <= 64
+
+
+def test_main_profile_flag(profile_output, monkeypatch, capsys) -> None:  # pylint: disable=redefined-outer-name
+    """Test that --profile wraps a batch run and writes its profile on exit."""
+    commands = profile_output.parent / "commands.txt"
+    commands.write_text("add 1 2\nexit\n", encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", ["calculator"])
+    main(["--batch", str(commands), "--profile", "cprofile", "--profile-output", str(profile_output)])
+    assert f"Profile written to {profile_output}.pstats" in capsys.readouterr().err
+    assert (profile_output.parent / "profile.pstats").exists()
+    assert active_profile() is None
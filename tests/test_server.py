@@ -0,0 +1,131 @@
+"""tests/test_server.py
+
+Tests for the asyncio JSON-lines server.
+"""
+
+import asyncio
+import json
+import math
+import tempfile
+
+from app.server import CalculatorServer, MicroBatcher
+
+
+async def _session(port, commands):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    responses = []
+    for command in commands:
+        writer.write(json.dumps(command).encode() + b"\n")
+        await writer.drain()
+        line = await reader.readline()
+        if not line:
+            break
+        responses.append(json.loads(line))
+    writer.close()
+    return responses
+
+
+def _run(coroutine_factory, batcher=None):
+    async def main(history_dir):
+        server = await CalculatorServer(batcher=batcher, history_dir=history_dir).start(port=0)
+        try:
+            return await coroutine_factory(server.address[1])
+        finally:
+            await server.close()
+    with tempfile.TemporaryDirectory() as history_dir:
+        return asyncio.run(main(history_dir))
+
+
+def test_calculation_and_commands() -> None:
+    """Test results, command output and request ids over one connection."""
+    responses = _run(lambda port: _session(port, [
+        {"id": 7, "command": "add 2 3"},
+        "div 1 0",
+        "history",
+        "(1 + 2) * 3",
+        "exit",
+        "add 1 1",
+    ]))
+    assert responses[0] == {"id": 7, "ok": True, "output": "Result: 5.0", "result": 5.0}
+    assert responses[1]["ok"] is False and responses[1]["error"] == "Division by zero is not allowed."
+    assert responses[2]["output"] == "Calculation History:\nadd 2.0 3.0 = 5.0"
+    assert responses[3]["output"] == "Result: 9.0"
+    assert responses[4]["output"] == "Exiting calculator..."
+    assert len(responses) == 5, "the session must end after exit"
+
+
+def test_invalid_request() -> None:
+    """Test that malformed JSON gets an error response without closing the session."""
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"not json\n" + json.dumps({"command": "sub 5 2"}).encode() + b"\n")
+        first, second = json.loads(await reader.readline()), json.loads(await reader.readline())
+        writer.close()
+        return first, second
+    first, second = _run(scenario)
+    assert first["ok"] is False and "Invalid request" in first["error"]
+    assert second["result"] == 3.0
+
+
+def test_sessions_have_separate_histories() -> None:
+    """Test that each connection gets its own History."""
+    async def scenario(port):
+        return await asyncio.gather(
+            _session(port, ["add 1 1", "history"]),
+            _session(port, ["multi 3 3", "history"]),
+        )
+    first, second = _run(scenario)
+    assert first[1]["output"] == "Calculation History:\nadd 1.0 1.0 = 2.0"
+    assert second[1]["output"] == "Calculation History:\nmulti 3.0 3.0 = 9.0"
+
+
+def test_sessions_save_and_load_separate_logs() -> None:
+    """Test that interleaved saves from two sessions never overwrite each other's saved history."""
+    async def scenario(port):
+        first_reader, first = await asyncio.open_connection("127.0.0.1", port)
+        second_reader, second = await asyncio.open_connection("127.0.0.1", port)
+
+        async def send(reader, writer, command):
+            writer.write(json.dumps(command).encode() + b"\n")
+            return json.loads(await reader.readline())
+
+        for command in ("add 1 1", "save"):
+            await send(first_reader, first, command)
+        for command in ("add 2 2", "add 3 3", "save"):
+            await send(second_reader, second, command)
+        for command in ("add 4 4", "save", "clear"):
+            await send(first_reader, first, command)
+        await send(second_reader, second, "save")
+        loaded = [await send(first_reader, first, command) for command in ("load", "history")]
+        loaded += [await send(second_reader, second, command) for command in ("clear", "load", "history")]
+        first.close()
+        second.close()
+        return loaded
+    first_load, first_history, _, second_load, second_history = _run(scenario)
+    assert first_load["output"].startswith("History successfully loaded")
+    assert first_history["output"] == "Calculation History:\nadd 1.0 1.0 = 2.0\nadd 4.0 4.0 = 8.0"
+    assert second_load["output"].startswith("History successfully loaded")
+    assert second_history["output"] == "Calculation History:\nadd 2.0 2.0 = 4.0\nadd 3.0 3.0 = 6.0"
+
+
+def test_non_finite_results_are_valid_json() -> None:
+    """Test that inf and nan results are sent as strings, not as the invalid JSON NaN/Infinity."""
+    responses = _run(lambda port: _session(port, ["multi 1e308 10", "sub inf inf"]))
+    assert responses[0]["ok"] and responses[0]["result"] == "inf"
+    assert responses[1]["ok"] and responses[1]["result"] == "nan"
+    assert math.isnan(float(responses[1]["result"]))
+
+
+def test_concurrent_requests_are_micro_batched() -> None:
+    """Test that calculations from concurrent connections share batches, vectorized or not."""
+    batcher = MicroBatcher(vectorize_threshold=4)
+
+    async def scenario(port):
+        return await asyncio.gather(*(
+            _session(port, [f"div {i} 2", f"mod {i} 0" if i == 3 else f"expo {i} 2"]) for i in range(20)))
+    sessions = _run(scenario, batcher)
+    assert [responses[0]["result"] for responses in sessions] == [i / 2 for i in range(20)]
+    assert sessions[3][1]["ok"] is False
+    assert sessions[4][1]["result"] == 16.0
+    assert batcher.calculations == 40
+    assert batcher.batches < batcher.calculations
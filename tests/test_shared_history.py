@@ -0,0 +1,111 @@
+"""tests/test_shared_history.py
+
+Stress tests for SharedHistory: 64 threads adding, undoing, reading and saving at once.
+"""
+
+import threading
+from collections import defaultdict
+
+from app.history import History, SharedHistory, shared
+
+THREADS = 64
+PER_THREAD = 2000
+
+
+def _run(threads, target):
+    barrier = threading.Barrier(threads)
+
+    def worker(number):
+        barrier.wait()
+        target(number)
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+
+def _check_order(entries):
+    """Asserts that no entry is duplicated and each thread's entries are in order."""
+    last = defaultdict(lambda: -1)
+    for entry in entries:
+        thread, index = map(float, entry.split()[1:3])
+        assert index == last[thread] + 1, entry
+        last[thread] = index
+    return last
+
+
+def test_concurrent_adds_are_neither_lost_nor_duplicated(monkeypatch) -> None:
+    """Test that 64 appending threads produce every entry exactly once, in per-thread order."""
+    monkeypatch.setattr(shared, "MERGE_SIZE", 64)
+    history = SharedHistory(capacity=0)
+    snapshots = []
+
+    def add(number):
+        for index in range(PER_THREAD):
+            history.add_record("add", (float(number), float(index)), float(number + index))
+            if number == 0 and index % 250 == 0:
+                snapshots.append(history.get_history())
+
+    _run(THREADS, add)
+    entries = list(history.get_history())
+    assert len(entries) == THREADS * PER_THREAD
+    last = _check_order(entries)
+    assert all(index == PER_THREAD - 1 for index in last.values())
+    for snapshot in snapshots:
+        # Each snapshot is a consistent prefix of the final order.
+        assert list(snapshot) == entries[:len(snapshot)]
+
+
+def test_concurrent_undo_pops_exactly_one_entry_each() -> None:
+    """Test that add/undo pairs from 64 threads leave an empty history without errors."""
+    history = SharedHistory(capacity=0)
+
+    def add_and_undo(number):
+        for index in range(200):
+            history.add_calculation(f"add {number} {index} = 0")
+            history.undo_last()
+
+    _run(THREADS, add_and_undo)
+    assert len(history.get_history()) == 0
+
+
+def test_save_writes_a_consistent_snapshot(tmp_path) -> None:
+    """Test that logs saved while threads append hold a prefix of the final history."""
+    history = SharedHistory(capacity=0)
+    paths = [str(tmp_path / f"history{number}.bin") for number in range(8)]
+
+    def add_or_save(number):
+        if number < len(paths):
+            history.save(paths[number])
+            return
+        for index in range(500):
+            history.add_record("add", (float(number), float(index)), 0.0)
+
+    _run(THREADS, add_or_save)
+    entries = list(history.get_history())
+    _check_order(entries)
+    assert len(entries) == (THREADS - len(paths)) * 500
+    for path in paths:
+        saved = History(capacity=0)
+        saved.load(path)
+        assert list(saved.get_history()) == entries[:len(saved.history)]
+
+
+def test_shared_history_behaves_like_history() -> None:
+    """Test the single-threaded behaviour, including the history attribute and spilling."""
+    history = SharedHistory(capacity=3)
+    for index in range(5):
+        history.add_record("add", (float(index), 1.0), index + 1.0)
+    assert len(history.history) == 5
+    assert history.stats().spilled == 2
+    view = history.get_history()
+    history.undo_last()
+    history.clear_history()
+    history.undo_last()
+    assert history.redo_last()
+    history.undo_last()
+    assert list(history.get_history()) == [f"add {index}.0 1.0 = {index + 1.0}" for index in range(4)]
+    assert len(view) == 5 and view[-1] == "add 4.0 1.0 = 5.0"
+    assert history.where("op=add result>2") == [2, 3]
@@ -0,0 +1,36 @@
+"""tests/test_startup.py
+
+Startup cost checks for the calculator entry point.
+"""
+
+import pytest
+
+from app.config import get_config, reload_config
+from benchmarks.bench_startup import DEFERRED_MODULES, STARTUP_BUDGET_MS, measure_import
+
+
+@pytest.mark.slow
+def test_heavy_modules_are_not_imported_at_startup() -> None:
+    """Test that importing the calculator does not import pandas, numpy, dotenv, the profilers or the optional history backends."""
+    timings = measure_import("app.calculator")
+    eager = [name for name in DEFERRED_MODULES if name in timings]
+    assert not eager, f"Imported at startup: {eager}"
+
+
+@pytest.mark.slow
+def test_import_time_within_budget() -> None:
+    """Test that the best of three imports of app.calculator stays within the budget."""
+    best_us = min(measure_import("app.calculator")["app.calculator"][1] for _ in range(3))
+    assert best_us / 1000 <= STARTUP_BUDGET_MS, (
+        f"app.calculator took {best_us / 1000:.1f} ms to import (budget {STARTUP_BUDGET_MS} ms)"
+    )
+
+
+def test_config_is_loaded_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the configuration is cached until explicitly reloaded."""
+    first = get_config()
+    monkeypatch.setenv("LOG_FILE", "other.log")
+    assert get_config() is first
+    assert reload_config().log_file == "other.log"
+    monkeypatch.undo()
+    reload_config()
@@ -0,0 +1,46 @@
+""" tests/test_vectorized.py """
+from array import array
+
+import numpy as np
+
+from app import operations
+from app.operations import vectorized
+
+
+def test_matches_scalar_operations():
+    """Test that every vectorized operation agrees with its scalar version."""
+    a = [2.0, -7.5, 10.0, 3.0]
+    b = [3.0, 2.0, -4.0, 0.5]
+    for name in ["addition", "subtraction", "multiplication", "division", "exponent", "modulus"]:
+        result = getattr(vectorized, name)(a, b)
+        expected = [getattr(operations, name)(x, y) for x, y in zip(a, b)]
+        assert np.allclose(result.values, expected), name
+        assert not result.errors.any(), name
+
+
+def test_division_by_zero_is_masked():
+    """Test that division by zero marks the row instead of raising."""
+    result = vectorized.division(np.array([1.0, 4.0, 0.0]), np.array([0.0, 2.0, 0.0]))
+    assert result.errors.tolist() == [True, False, True]
+    assert np.isnan(result.values[0]) and np.isnan(result.values[2])
+    assert result.values[1] == 2.0
+
+
+def test_modulus_by_zero_is_masked():
+    """Test that modulus by zero marks the row instead of raising."""
+    result = vectorized.modulus([5.0, -5.0], [0.0, 3.0])
+    assert result.errors.tolist() == [True, False]
+    assert result.values[1] == -5.0 % 3.0
+
+
+def test_exponent_overflow_is_masked():
+    """Test that an overflowing power is reported per element."""
+    result = vectorized.exponent([10.0, 2.0], [400.0, 3.0])
+    assert result.errors.tolist() == [True, False]
+    assert result.values[1] == 8.0
+
+
+def test_accepts_buffers_and_broadcasts():
+    """Test that array.array buffers and scalars are accepted."""
+    result = vectorized.multiplication(array('d', [1.0, 2.0, 3.0]), 2)
+    assert result.values.tolist() == [2.0, 4.0, 6.0]